@@ -0,0 +1,54 @@
+"""Config time for a large handler mounted under many prefixes.
+
+Run with ``python benchmarks/action_table.py [helpers] [mounts]``; compares
+``add_resource`` with the per-class action table cache against rebuilding the
+table on every call, as happened before it was cached.
+"""
+import sys
+import time
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action, get_action_table
+
+def make_handler(helpers):
+    class BaseHandler(object):
+        def __init__(self, request):
+            self.request = request
+
+    for i in range(helpers):
+        setattr(BaseHandler, 'helper%d' % i, lambda self: None)
+
+    class Handler(BaseHandler):
+        @action(renderer='string')
+        def index(self):
+            return 'index'
+
+        @action(renderer='json', format='json')
+        @action(renderer='string')
+        def show(self):
+            return 'show'
+
+    return Handler
+
+def mount(handler, mounts, cached):
+    config = Configurator()
+    includeme(config)
+    start = time.time()
+    for i in range(mounts):
+        if not cached:
+            del handler.__action_table__
+        config.add_resource(handler, 'item', 'items',
+                            parent_resource=dict(member_name='parent%d' % i,
+                                                 collection_name='parents%d' % i))
+    return time.time() - start
+
+def main(helpers=500, mounts=100):
+    handler = make_handler(helpers)
+    get_action_table(handler)
+    for cached in (False, True):
+        elapsed = mount(handler, mounts, cached)
+        print '%-9s %5d helpers %5d mounts %8.2f ms' % (
+            cached and 'cached' or 'uncached', helpers, mounts, elapsed * 1000)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""Throughput of writes sent one per request or through a batch endpoint.
+
+Run with ``python benchmarks/batch.py [operations] [round trip ms]``;
+sends ``operations`` create, update and delete requests to a resource added
+with ``batch=True``, first as separate requests and then as a single request
+to its ``batch_items`` route, and prints the operations per second of each.
+Both are called in process, so the measured time only covers the work of
+handling the requests in the application (the batch adds some JSON
+encoding); the last column adds one network round trip per request sent,
+which is what the batch saves a client.
+"""
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from pyramid.config import Configurator
+from pyramid.request import Request
+from pyramid_routehelper import includeme, action
+
+class BenchHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='json')
+    def create(self):
+        return {'title': self.request.params.get('title')}
+
+    @action(renderer='json')
+    def update(self):
+        return {'id': self.request.matchdict['id']}
+
+    @action(renderer='string')
+    def delete(self):
+        return ''
+
+def make_app():
+    config = Configurator(autocommit=True)
+    includeme(config)
+    config.add_resource(BenchHandler, 'item', 'items', batch=1000, trie=True)
+    return config.make_wsgi_app()
+
+def make_operations(number):
+    operations = []
+    for i in range(number):
+        if i % 3 == 0:
+            operations.append({'method': 'POST', 'params': {'title': 'item %d' % i}})
+        elif i % 3 == 1:
+            operations.append({'method': 'PUT', 'id': i, 'params': {'title': 'item %d' % i}})
+        else:
+            operations.append({'method': 'DELETE', 'id': i})
+    return operations
+
+def separate(app, operations):
+    for operation in operations:
+        path = '/items'
+        if 'id' in operation:
+            path = '/items/%s' % operation['id']
+        request = Request.blank(path, POST=operation.get('params'))
+        request.method = operation['method']
+        request.get_response(app)
+
+def batch(app, operations):
+    request = Request.blank('/items/batch', method='POST')
+    request.body = json.dumps(operations)
+    response = request.get_response(app)
+    assert response.status_int == 200, response.status
+
+def main(operations=300, rtt=20, repeat=5):
+    app = make_app()
+    ops = make_operations(operations)
+    for name, send, requests in (('separate', separate, operations),
+                                 ('batch', batch, 1)):
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            send(app, ops)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        total = best + requests * rtt / 1000.0
+        print '%-8s %5d operations %8.1f ms %9.0f ops/s %9.0f ops/s with %d ms round trips' % (
+            name, operations, best * 1000, operations / best, operations / total, rtt)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,59 @@
+"""Handler calls under a thundering herd, with and without coalescing.
+
+Run with ``python benchmarks/coalesce.py [threads] [rounds]``; each round
+starts ``threads`` concurrent requests to the same member of a resource whose
+``show`` takes 50 ms, once as is and once with ``coalesce=True``.  For each
+it prints the number of handler calls per round and the time per round.
+"""
+import sys
+import threading
+import time
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action
+
+class BenchHandler(object):
+    calls = 0
+
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='string')
+    def show(self):
+        BenchHandler.calls += 1
+        time.sleep(0.05)
+        return 'message %s' % self.request.matchdict['id']
+
+class CoalescedBenchHandler(BenchHandler):
+    @action(renderer='string', coalesce=True)
+    def show(self):
+        return BenchHandler.show(self)
+
+def make_app(handler):
+    config = Configurator(autocommit=True)
+    includeme(config)
+    config.add_resource(handler, 'item', 'items')
+    return config.make_wsgi_app()
+
+def main(threads=20, rounds=5):
+    environ = {'PATH_INFO': '/items/1', 'REQUEST_METHOD': 'GET',
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+               'wsgi.url_scheme': 'http'}
+    start_response = lambda status, headers: None
+    for name, handler in (('plain', BenchHandler), ('coalesced', CoalescedBenchHandler)):
+        app = make_app(handler)
+        call = lambda: ''.join(app(dict(environ), start_response))
+        BenchHandler.calls = 0
+        start = time.time()
+        for i in range(rounds):
+            workers = [threading.Thread(target=call) for j in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = (time.time() - start) / rounds * 1e3
+        print '%-10s %6.2f handler calls %8.2f ms per round of %d requests' % (
+            name, BenchHandler.calls / float(rounds), elapsed, threads)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,156 @@
+"""Config-time scaling of ``add_resource``.
+
+Every case builds synthetic handlers and registers ``size`` resources, then
+commits the configuration.  Each case runs in a child process so its peak
+memory is its own, and one JSON object is written per case::
+
+    python benchmarks/config.py --sizes 10,100,1000 --output results.jsonl
+
+Fields are ``size``, ``formats`` (format views per action), ``actions``
+(extra member, collection and new actions), ``depth`` (``parent_resource``
+nesting), ``mode``, ``routes``, ``config_actions``, ``add_seconds``,
+``commit_seconds`` and ``peak_rss_kb``.  The ``snapshot`` mode adds the
+resources from a resource snapshot written beforehand.
+"""
+import optparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action
+
+FORMATS = ('json', 'xml', 'csv', 'atom', 'yaml', 'txt')
+MODES = ('add_resource', 'add_resources', 'trie', 'collapse_formats',
+         'snapshot')
+
+def make_handler(formats, actions):
+    """Return a handler class whose actions each have ``formats`` format
+    views, with ``actions`` extra member, collection and new actions."""
+    names = ['index', 'create', 'new', 'show', 'update', 'delete', 'edit']
+    for i in range(actions):
+        names.extend(['member%d' % i, 'collection%d' % i, 'new%d' % i])
+    attrs = {'__init__': lambda self, request: None}
+    for name in names:
+        def view(self):
+            return {}
+        view = action(renderer='string')(view)
+        attrs[name] = view
+        for format in FORMATS[:formats]:
+            def formatted(self):
+                return {}
+            attrs['%s_%s' % (name, format)] = action(
+                alt_for=name, renderer='json', format=format)(formatted)
+    return type('Handler', (object,), attrs)
+
+def resource_specs(size, formats, actions, depth):
+    handler = make_handler(formats, actions)
+    member = dict([('member%d' % i, 'POST') for i in range(actions)])
+    collection = dict([('collection%d' % i, 'GET') for i in range(actions)])
+    new = dict([('new%d' % i, 'GET') for i in range(actions)])
+    for i in range(size):
+        spec = dict(handler=handler, member_name='item%d' % i,
+                    collection_name='items%d' % i, member=member,
+                    collection=collection, new=new)
+        if depth:
+            prefix = ''.join(['/parents%d/:parent%d_id' % (level, level)
+                              for level in range(depth)])
+            spec['path_prefix'] = prefix
+            spec['parent_resource'] = dict(member_name='parent%d' % i,
+                                           collection_name='parents')
+        yield spec
+
+def add_specs(config, specs, mode):
+    if mode == 'add_resources':
+        config.add_resources(specs)
+        return
+    for spec in specs:
+        spec = dict(spec)
+        if mode in ('trie', 'collapse_formats'):
+            spec[mode] = True
+        config.add_resource(spec.pop('handler'), spec.pop('member_name'),
+                            spec.pop('collection_name'), **spec)
+
+def run_case(size, formats, actions, depth, mode):
+    specs = list(resource_specs(size, formats, actions, depth))
+    config = Configurator()
+    includeme(config)
+    if mode == 'snapshot':
+        # write the snapshot untimed, as an earlier process would have
+        path = tempfile.mktemp(suffix='.json')
+        config.use_resource_snapshot(path)
+        add_specs(config, specs, mode)
+        config.save_resource_snapshot()
+        del specs[0]['handler'].__action_table__
+        config = Configurator()
+        includeme(config)
+        config.use_resource_snapshot(path)
+        os.remove(path)
+    start = time.time()
+    add_specs(config, specs, mode)
+    added = time.time()
+    config_actions = len(config._ctx.actions)
+    config.commit()
+    committed = time.time()
+    return dict(size=size, formats=formats, actions=actions, depth=depth,
+                mode=mode,
+                routes=len(config.get_routes_mapper().get_routes()),
+                config_actions=config_actions,
+                add_seconds=round(added - start, 4),
+                commit_seconds=round(committed - added, 4),
+                peak_rss_kb=resource.getrusage(
+                    resource.RUSAGE_SELF).ru_maxrss)
+
+def split_ints(value):
+    return [int(item) for item in value.split(',')]
+
+def main(argv=sys.argv):
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('--sizes', default='10,100,1000,5000')
+    parser.add_option('--formats', default='1,3')
+    parser.add_option('--actions', default='0,4')
+    parser.add_option('--depth', default='0,2')
+    parser.add_option('--modes', default='add_resource,add_resources')
+    parser.add_option('--output', default='-',
+                      help='file to append JSON lines to (default stdout)')
+    parser.add_option('--case', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(argv[1:])
+
+    if options.case:
+        case = options.case.split(',')
+        result = run_case(*[int(item) for item in case[:4]] + [case[4]])
+        print json.dumps(result)
+        return
+
+    if options.output == '-':
+        output = sys.stdout
+    else:
+        output = open(options.output, 'a')
+    for mode in options.modes.split(','):
+        if mode not in MODES:
+            parser.error('unknown mode %r' % mode)
+        for size in split_ints(options.sizes):
+            for formats in split_ints(options.formats):
+                for actions in split_ints(options.actions):
+                    for depth in split_ints(options.depth):
+                        case = '%d,%d,%d,%d,%s' % (size, formats, actions,
+                                                   depth, mode)
+                        child = subprocess.Popen(
+                            [sys.executable, os.path.abspath(__file__),
+                             '--case', case], stdout=subprocess.PIPE)
+                        result = child.communicate()[0]
+                        if child.returncode:
+                            raise SystemExit('case %s failed' % case)
+                        output.write(result)
+                        output.flush()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Route matching latency for the first and last of N resources.
+
+Run with ``python benchmarks/dispatch.py``; compares the default routes
+mapper with the segment trie enabled by ``add_resource(..., trie=True)``.
+"""
+import sys
+import timeit
+
+from pyramid.config import Configurator
+from pyramid.interfaces import IRoutesMapper
+from pyramid_routehelper import includeme, action
+
+class BenchHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='string')
+    def index(self):
+        return 'index'
+
+    @action(renderer='json', format='json')
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+
+class DummyRequest(object):
+    def __init__(self, path):
+        self.environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}
+
+def make_mapper(count, trie):
+    config = Configurator(autocommit=True)
+    includeme(config)
+    for i in range(count):
+        config.add_resource(BenchHandler, 'item%d' % i, 'items%d' % i,
+                            member={'mark': 'POST'}, trie=trie)
+    return config.registry.getUtility(IRoutesMapper)
+
+def time_match(mapper, path, number):
+    request = DummyRequest(path)
+    info = mapper(request)
+    assert info['route'] is not None, path
+    timer = timeit.Timer(lambda: mapper(request))
+    return min(timer.repeat(3, number)) / number * 1e6
+
+def main(sizes=(10, 100, 1000), number=2000):
+    print '%6s %6s %8s %12s %12s' % ('size', 'routes', 'mapper',
+                                      'first (us)', 'last (us)')
+    for count in sizes:
+        for trie in (False, True):
+            mapper = make_mapper(count, trie)
+            first = time_match(mapper, '/items0/7/mark', number)
+            last = time_match(mapper, '/items%d/7/mark' % (count - 1), number)
+            print '%6d %6d %8s %12.2f %12.2f' % (
+                count, len(mapper.get_routes()), trie and 'trie' or 'default',
+                first, last)
+
+if __name__ == '__main__':
+    main([int(size) for size in sys.argv[1:]] or (10, 100, 1000))
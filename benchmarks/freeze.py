@@ -0,0 +1,90 @@
+"""Resident memory of forked workers with and without ``freeze_resources``.
+
+Run with ``python benchmarks/freeze.py [resources] [workers]`` on Linux.
+For each mode the parent configures ``resources`` lazy, trie-indexed
+resources with collapsed formats, optionally calls
+``config.freeze_resources()``, and forks ``workers`` processes which each
+request every route once.  The resident and private dirty memory of each
+worker, read from ``/proc/self/smaps``, are then averaged; private dirty
+memory is what a worker does not share with the parent.
+"""
+import os
+import sys
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action, get_action_table
+
+class BenchHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='string')
+    def index(self):
+        return 'index'
+
+    @action(renderer='json', format='json')
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+
+def memory():
+    """Return the resident and private dirty memory of this process in kB."""
+    rss = private = 0
+    for line in open('/proc/self/smaps'):
+        if line.startswith('Rss:'):
+            rss += int(line.split()[1])
+        elif line.startswith('Private_Dirty:'):
+            private += int(line.split()[1])
+    return rss, private
+
+def make_app(resources, freeze):
+    config = Configurator()
+    includeme(config)
+    actions = get_action_table(BenchHandler)
+    for i in range(resources):
+        config.add_resource('__main__:BenchHandler', 'item%d' % i, 'items%d' % i,
+                            lazy=True, actions=actions, trie=True,
+                            collapse_formats=True)
+    if freeze:
+        config.freeze_resources()
+    return config.make_wsgi_app()
+
+def serve(app, resources):
+    for i in range(resources):
+        for path in ('/items%d' % i, '/items%d/1' % i, '/items%d/1.json' % i):
+            environ = dict(PATH_INFO=path, REQUEST_METHOD='GET')
+            app(environ, lambda status, headers: None)
+
+def run(resources, workers, freeze):
+    app = make_app(resources, freeze)
+    results = []
+    for i in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if not pid:
+            os.close(read)
+            serve(app, resources)
+            os.write(write, '%d %d' % memory())
+            os._exit(0)
+        os.close(write)
+        result = os.read(read, 100)
+        os.close(read)
+        os.waitpid(pid, 0)
+        results.append([int(value) for value in result.split()])
+    rss = sum([result[0] for result in results]) / len(results)
+    private = sum([result[1] for result in results]) / len(results)
+    return rss, private
+
+def main(resources=500, workers=4):
+    for freeze in (False, True):
+        pid = os.fork()
+        if not pid:
+            rss, private = run(resources, workers, freeze)
+            print '%-9s %5d resources %8d kB rss %8d kB private dirty' % (
+                freeze and 'frozen' or 'unfrozen', resources, rss, private)
+            sys.stdout.flush()
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,71 @@
+"""Latency and allocations of per-request and reused handlers.
+
+Run with ``python benchmarks/handlers.py [number]``; requests a member route
+of a resource whose handler is built for each request, and of the same
+handler added with ``stateless=True``.  For each it prints the latency per
+request and the number of handler instances, and of the helper objects
+their ``__init__`` allocates, built per request.
+"""
+import sys
+import timeit
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action, StatelessHandler
+
+class Settings(object):
+    built = 0
+
+    def __init__(self):
+        Settings.built += 1
+        self.formats = {'json': 'application/json', 'html': 'text/html'}
+        self.fields = ['id', 'title', 'body']
+
+class BenchHandler(object):
+    built = 0
+
+    def __init__(self, request):
+        BenchHandler.built += 1
+        self.request = request
+        self.settings = Settings()
+
+    @action(renderer='string')
+    def show(self):
+        return self.settings.fields[0]
+
+class StatelessBenchHandler(StatelessHandler):
+    __slots__ = ('settings',)
+    built = 0
+
+    def __init__(self):
+        StatelessBenchHandler.built += 1
+        self.settings = Settings()
+
+    @action(renderer='string')
+    def show(self, request):
+        return self.settings.fields[0]
+
+def make_app(handler, **kw):
+    config = Configurator(autocommit=True)
+    includeme(config)
+    config.add_resource(handler, 'item', 'items', trie=True, **kw)
+    return config.make_wsgi_app()
+
+def main(number=5000):
+    environ = {'PATH_INFO': '/items/1', 'REQUEST_METHOD': 'GET',
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+               'wsgi.url_scheme': 'http'}
+    start_response = lambda status, headers: None
+    for name, handler, kw in (('per-request', BenchHandler, {}),
+                              ('stateless', StatelessBenchHandler, {'stateless': True})):
+        app = make_app(handler, **kw)
+        call = lambda: app(dict(environ), start_response)
+        call()
+        handler.built = Settings.built = 0
+        timer = timeit.Timer(call)
+        best = min(timer.repeat(3, number)) / number * 1e6
+        requests = 3.0 * number
+        print '%-12s %8.2f us %6.3f handlers %6.3f helpers built per request' % (
+            name, best, handler.built / requests, Settings.built / requests)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
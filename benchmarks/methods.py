@@ -0,0 +1,58 @@
+"""Request latency of routes shared by several actions.
+
+Run with ``python benchmarks/methods.py [number]``; compares the views
+generated by ``add_resource`` (one per action, chosen by their
+``request_method`` predicates) with those of ``method_dispatch=True`` (one
+per route, choosing the action's view from a dict).
+"""
+import sys
+import timeit
+
+from pyramid.config import Configurator
+from pyramid_routehelper import includeme, action
+
+class BenchHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+
+    @action(renderer='string')
+    def update(self):
+        return 'update'
+
+    @action(renderer='string')
+    def delete(self):
+        return 'delete'
+
+    @action(renderer='string')
+    def mark(self):
+        return 'mark'
+
+def make_app(method_dispatch):
+    config = Configurator(autocommit=True)
+    includeme(config)
+    config.add_resource(BenchHandler, 'item', 'items',
+                        member={'mark': 'PATCH'}, trie=True,
+                        method_dispatch=method_dispatch)
+    return config.make_wsgi_app()
+
+def main(number=5000):
+    start_response = lambda status, headers: None
+    for method_dispatch in (False, True):
+        app = make_app(method_dispatch)
+        for method in ('GET', 'PUT', 'DELETE', 'PATCH'):
+            environ = {'PATH_INFO': '/items/1', 'REQUEST_METHOD': method,
+                       'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+                       'wsgi.url_scheme': 'http'}
+            call = lambda: app(dict(environ), start_response)
+            body = call()[0]
+            best = min(timeit.Timer(call).repeat(3, number)) / number * 1e6
+            print '%-10s %-7s %-7s %8.2f us' % (
+                method_dispatch and 'dispatch' or 'predicate', method, body,
+                best)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,118 @@
+"""Application startup time with eager and ``lazy=True`` handlers.
+
+Writes a synthetic package of ``modules`` handler modules, each defining
+``weight`` helper functions and building a table at import time to stand in
+for the models and serializers a real handler module imports.  Each mode is
+then timed in a fresh interpreter, from importing pyramid to committing the
+configuration, after one untimed run has compiled the modules::
+
+    python benchmarks/startup.py --modules 200 --weight 500 --repeat 5
+
+``lazy+warm`` also calls ``config.warm_resources()``, as an application
+importing its handlers before forking workers would.
+"""
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = ('eager', 'lazy', 'lazy+warm')
+
+HANDLER = '''
+from pyramid_routehelper import action
+
+TABLE = dict([(i, str(i) * 4) for i in range(%(weight)d * 20)])
+
+%(helpers)s
+
+class Handler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='string')
+    def index(self):
+        return 'index'
+
+    @action(renderer='json', format='json')
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+'''
+
+HELPER = '''def helper%(i)d(value):
+    return [item for item in value if item != %(i)d]
+'''
+
+ACTIONS = {
+    'index': {'default': {'renderer': 'string'}},
+    'show': {'default': {'renderer': 'string'},
+             'formatted': [{'renderer': 'json', 'format': 'json',
+                            'attr': 'show'}]},
+    }
+
+def write_package(directory, modules, weight):
+    package = os.path.join(directory, 'startup_app')
+    os.mkdir(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    helpers = ''.join([HELPER % {'i': i} for i in range(weight)])
+    for i in range(modules):
+        source = HANDLER % {'weight': weight, 'helpers': helpers}
+        open(os.path.join(package, 'handler%d.py' % i), 'w').write(source)
+
+def run_case(modules, mode):
+    start = time.time()
+    from pyramid.config import Configurator
+    from pyramid_routehelper import includeme
+    config = Configurator()
+    includeme(config)
+    for i in range(modules):
+        kwargs = {}
+        if mode != 'eager':
+            kwargs = dict(lazy=True, actions=ACTIONS)
+        config.add_resource('startup_app.handler%d:Handler' % i,
+                            'item%d' % i, 'items%d' % i, **kwargs)
+    config.commit()
+    if mode == 'lazy+warm':
+        config.warm_resources()
+    return time.time() - start
+
+def main(argv=sys.argv):
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option('--modules', type='int', default=200)
+    parser.add_option('--weight', type='int', default=500)
+    parser.add_option('--repeat', type='int', default=5)
+    parser.add_option('--case', help=optparse.SUPPRESS_HELP)
+    options, args = parser.parse_args(argv[1:])
+
+    if options.case:
+        print run_case(options.modules, options.case)
+        return
+
+    directory = tempfile.mkdtemp()
+    try:
+        write_package(directory, options.modules, options.weight)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [directory] + [path for path in [env.get('PYTHONPATH')] if path])
+        def run(mode):
+            child = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--case', mode,
+                 '--modules', str(options.modules)],
+                stdout=subprocess.PIPE, env=env)
+            result = child.communicate()[0]
+            if child.returncode:
+                raise SystemExit('case %s failed' % mode)
+            return float(result)
+        run('eager')
+        for mode in MODES:
+            best = min([run(mode) for i in range(options.repeat)])
+            print '%-10s %5d modules %8.1f ms' % (mode, options.modules,
+                                                 best * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
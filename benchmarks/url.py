@@ -0,0 +1,45 @@
+"""URL generation with ``resource_path`` compared to ``route_path``.
+
+Run with ``python benchmarks/url.py [number]``.
+"""
+import sys
+import timeit
+
+from pyramid import testing
+from pyramid.config import Configurator
+from pyramid.url import route_path
+from pyramid_routehelper import includeme, action
+from pyramid_routehelper.url import resource_path
+
+class BenchHandler(object):
+    def __init__(self, request):
+        self.request = request
+
+    @action(renderer='json', format='json')
+    @action(renderer='string')
+    def edit(self):
+        return 'edit'
+
+def main(number=20000):
+    config = Configurator(autocommit=True)
+    includeme(config)
+    for i in range(100):
+        config.add_resource(BenchHandler, 'message%d' % i, 'messages%d' % i,
+                            path_prefix='/category/:category_id')
+    config.begin()
+    request = testing.DummyRequest()
+    cases = [
+        ('route_path', lambda: route_path('json_formatted_edit_message50',
+                                          request, id=1, category_id=2)),
+        ('resource_path', lambda: resource_path('edit_message50', request,
+                                                id=1, category_id=2,
+                                                format='json')),
+        ]
+    assert cases[0][1]() == cases[1][1]()
+    for label, generate in cases:
+        best = min(timeit.Timer(generate).repeat(3, number)) / number * 1e6
+        print '%-14s %8.2f us' % (label, best)
+    config.end()
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -1,10 +1,91 @@
 from pyramid.config import ConfigurationError
+from pyramid.settings import asbool
+from pyramid_routehelper.urldispatch import ConvertPredicate
+from pyramid_routehelper.urldispatch import Converter
+from pyramid_routehelper.urldispatch import FormatPregenerator
+from pyramid_routehelper.urldispatch import SubDomainPregenerator
+from pyramid_routehelper.urldispatch import add_generator_route
+from pyramid_routehelper.urldispatch import builtin_converters
+from pyramid_routehelper.urldispatch import format_pattern
+from pyramid_routehelper.urldispatch import get_resource_mapper
+from pyramid_routehelper.urldispatch import marker_names
+from pyramid_routehelper.urldispatch import normalize_pattern
+from pyramid_routehelper.urldispatch import typed_pattern
+from pyramid_routehelper.batch import BatchView
+from pyramid_routehelper.batch import DEFAULT_LIMIT
+from pyramid_routehelper.cache import DEFAULT_SIZE
+from pyramid_routehelper.cache import ResponseCache
+from pyramid_routehelper.cache import cache_decorator
+from pyramid_routehelper.cache import invalidate_decorator
+from pyramid_routehelper.cache import vary_headers
+from pyramid_routehelper.coalesce import Coalescer
+from pyramid_routehelper.coalesce import coalesce_decorator
+from pyramid_routehelper.coalesce import coalesce_headers
+from pyramid_routehelper.conditional import validator_decorator
+from pyramid_routehelper.freeze import freeze_resources
+from pyramid_routehelper.handler import HandlerInstances
+from pyramid_routehelper.handler import StatelessHandler
+from pyramid_routehelper.handler import StatelessViewMapper
+from pyramid_routehelper.handler import is_stateless
+from pyramid_routehelper.interfaces import IResourceSnapshot
+from pyramid_routehelper.interfaces import IResourceStats
+from pyramid_routehelper.interfaces import IRouteProfile
+from pyramid_routehelper.jobs import JobView
+from pyramid_routehelper.jobs import background_decorator
+from pyramid_routehelper.jobs import job_queue
+from pyramid_routehelper.lazy import LazyViewMapper
+from pyramid_routehelper.lazy import lazy_handler
+from pyramid_routehelper.lazy import warm_resources
+from pyramid_routehelper.limits import concurrency_limits
+from pyramid_routehelper.limits import limit_decorator
+from pyramid_routehelper.pagination import Pagination
+from pyramid_routehelper.pagination import pagination_decorator
+from pyramid_routehelper.profile import order_routes
+from pyramid_routehelper.profile import use_route_profile
+from pyramid_routehelper.sampling import DEFAULT_DIRECTORY
+from pyramid_routehelper.sampling import DEFAULT_DUMP_INTERVAL
+from pyramid_routehelper.sampling import DEFAULT_DUMP_SAMPLES
+from pyramid_routehelper.sampling import RouteProfiler
+from pyramid_routehelper.sampling import profile_decorator
+from pyramid_routehelper.sampling import profile_rate
+from pyramid_routehelper.sampling import route_profilers
+from pyramid_routehelper.snapshot import handler_modules
+from pyramid_routehelper.snapshot import handler_name
+from pyramid_routehelper.snapshot import save_resource_snapshot
+from pyramid_routehelper.snapshot import snapshot_key
+from pyramid_routehelper.snapshot import use_resource_snapshot
+from pyramid_routehelper.stats import add_resource_stats
+from pyramid_routehelper.stats import stats_decorator
+from pyramid_routehelper.stream import stream_decorator
+from pyramid_routehelper.stream import stream_formats
+from pyramid_routehelper.url import add_url_generators
+from pyramid_routehelper.view import FormatDispatcher
+from pyramid_routehelper.view import MethodDispatcher
+from pyramid_routehelper.view import compose_decorators
+from pyramid_routehelper.view import format_view_name
+from pyramid_routehelper.view import method_view_name
 import inspect
 
-__all__ = ['includeme', 'add_resource', 'action']
+__all__ = ['includeme', 'add_resource', 'add_resources', 'resource_group',
+           'action', 'get_action_table', 'StatelessHandler']
 
 def includeme(config):
     config.add_directive('add_resource', add_resource)
+    config.add_directive('add_resources', add_resources)
+    config.add_directive('resource_group', resource_group)
+    config.add_directive('add_resource_stats', add_resource_stats)
+    config.add_directive('warm_resources', warm_resources)
+    config.add_directive('use_resource_snapshot', use_resource_snapshot)
+    config.add_directive('save_resource_snapshot', save_resource_snapshot)
+    config.add_directive('freeze_resources', freeze_resources)
+    config.add_directive('use_route_profile', use_route_profile)
+    settings = config.get_settings() or {}
+    if asbool(settings.get('routehelper.stats')):
+        config.add_resource_stats()
+    if settings.get('routehelper.snapshot'):
+        config.use_resource_snapshot(settings['routehelper.snapshot'])
+    if settings.get('routehelper.profile'):
+        config.use_route_profile(settings['routehelper.profile'])
 
 def strip_slashes(name):
     """Remove slashes from the beginning and end of a part/URL."""
@@ -19,7 +100,9 @@ class action(object):
     :func:`~pyramid_routehelper.add_resource`.
     
     Keyword arguments are identical to :class:`~pyramid.view.view_config`, with
-    the exception to how the ``name`` argument is used.
+    the exception to how the ``name`` argument is used.  The view's
+    ``decorator`` wraps those added by the settings below, so that it runs
+    for every request, including those answered from the cache.
     
     ``alt_for``
         Designate a method as another view for the specified action if
@@ -28,7 +111,162 @@ class action(object):
     
     ``format``
         Specify a format for the view that this decorator describes.
+    
+    ``cache``
+        A number of seconds for which the responses of the view to ``GET``
+        and ``HEAD`` requests are cached in process, keyed by route name,
+        matchdict (including the format), query string and ``Authorization``
+        and ``Cookie`` headers.  Each resource with a cached action keeps up
+        to ``cache_size`` (given to :func:`~pyramid_routehelper.add_resource`,
+        1000 by default) of them, evicting the least recently used; a
+        successful request with any other method to one of its routes evicts
+        those of the requested member and of its collection.  Responses
+        with a ``Set-Cookie`` header are never cached.
+    
+    ``cache_vary``
+        A sequence of request header names (or a single one) replacing the
+        ``Authorization`` and ``Cookie`` headers which must match for
+        requests to share a cached response.  A response which depends on
+        who asks for it is only safe to share between requests which agree
+        on every header identifying the user: with ``()``, one user's
+        response is served to everyone.
+    
+    ``validator``
+        A callable (or dotted name of one) taking the request, for cheaply
+        computing from its ``matchdict`` the ETag (a string) or modification
+        time (a :class:`datetime.datetime` in UTC, or a number of seconds
+        since the epoch) of the view's response.  A ``GET`` or ``HEAD``
+        request whose ``If-None-Match`` or ``If-Modified-Since`` header
+        matches it is answered with ``304 Not Modified`` without calling the
+        handler or its renderer; other responses get an ``ETag`` or
+        ``Last-Modified`` header.  The validator applies to the views of the
+        action's default and ``format`` routes it is given for.  It may
+        return ``None`` to always call the handler.
+        
+        Example::
+            
+            @action(renderer='json', format='json', validator=message_etag)
+            @action(renderer='message.mak', validator=message_etag)
+            def show(self):
+                ...
+    
+    ``stream``
+        If ``True``, the view takes no ``renderer``: the method returns an
+        iterable, such as a generator, whose items are serialized in the
+        view's ``format``, ``'ndjson'`` (a line of JSON per item) or
+        ``'csv'`` (items are sequences, or dicts whose sorted keys make a
+        header row), and sent in chunks through the response's
+        ``app_iter`` as it is consumed.  Memory use does not grow with the
+        number of items.  The format may also be given as the value of
+        ``stream``.  A streamed view cannot be cached.
+        
+        Example::
+            
+            @action(format='csv', stream=True)
+            @action(format='ndjson', stream=True)
+            @action(renderer='messages.mak')
+            def index(self):
+                return iter_messages()
+    
+    ``coalesce``
+        If ``True``, concurrent ``GET`` (or ``HEAD``) requests to the view
+        with the same route, matchdict (including the format), query string
+        and ``Authorization`` and ``Cookie`` headers share one call of the
+        handler: the first runs it and the others wait for its response,
+        each getting its own copy.  A sequence of header names (or a single
+        one) replaces the headers which must match; with ``()``, requests
+        share responses whoever makes them.  An exception raised by the
+        handler is raised for every waiting request.  A streamed view
+        cannot be coalesced.
+        
+        Example::
+            
+            @action(renderer='json', format='json', coalesce=('Accept-Language',))
+            @action(renderer='message.mak', coalesce=True)
+            def show(self):
+                ...
+    
+    ``background``
+        If ``True``, the view runs on a worker thread of the application's
+        job queue, and the request is answered at once with ``202
+        Accepted``, the JSON ``id`` and ``status`` of the job, and a
+        ``Location`` header: the URL of the resource's
+        ``<member name>_job`` route, ``<collection path>/jobs/<job id>``.
+        A ``GET`` of that URL returns the job's ``status`` (``pending``,
+        ``running``, ``done`` or ``failed``) and, once it is done, its
+        ``result``: the ``status`` and ``body`` of the view's response, the
+        body decoded if it is JSON.  If the view has a ``permission``, a
+        request for the job without it gets ``403 Forbidden``.  The queue
+        runs jobs on 4 threads, holds up to 100 waiting ones (further
+        requests are answered with ``503 Service Unavailable``) and keeps
+        the last 1000 finished ones, which the ``routehelper.jobs.workers``,
+        ``routehelper.jobs.queue_size`` and ``routehelper.jobs.keep``
+        settings change.  Jobs are kept in
+        the process, so with several processes the job route must be
+        answered by the one which ran the job.  A streamed view cannot run
+        in the background.
+        
+        Example::
+            
+            @action(renderer='json', background=True)
+            def export(self):
+                return write_export(self.request.params['since'])
+            
+            config.add_resource(MessageHandler, 'message', 'messages', collection={'export': 'POST'})
+            # POST /messages/export answers 202 with Location: /messages/jobs/<job id>
+            # (route "message_job")
+    
+    ``max_concurrency``
+        The number of requests to the action (through any of its routes and
+        formats) allowed to run at once in the process.  Further requests
+        wait for up to ``queue_timeout`` seconds (0 by default) for one of
+        them to finish, and are then answered with ``503 Service
+        Unavailable`` and a ``Retry-After`` header, so that a slow action
+        cannot tie up every worker thread.  A streamed response counts
+        until the server closes it.  Responses from the cache or ``304 Not
+        Modified`` ones do not count.  Both default to the
+        ``max_concurrency`` and ``queue_timeout`` given to
+        :func:`~pyramid_routehelper.add_resource`; the first view of an
+        action sets its limit.  The requests in flight, waiting and
+        rejected so far are returned by
+        ``registry.getUtility(IConcurrencyLimits).snapshot()``.
+        
+        Example::
+            
+            @action(renderer='json', max_concurrency=4, queue_timeout=0.5)
+            def mark(self):
+                ...
+    
+    ``profile``
+        The fraction (from 0 to 1, ``True`` meaning 1) of the requests to the
+        view which run under :mod:`cProfile`.  The statistics of each route
+        are aggregated over its profiled requests and written to
+        ``<route name>.<pid>.pstats``, to be read with :mod:`pstats`, in the
+        directory named by the ``routehelper.cprofile_dir`` setting
+        (``routehelper-profiles`` in the temporary directory by default)
+        after every ``routehelper.cprofile_samples`` profiled requests (100)
+        or ``routehelper.cprofile_interval`` seconds (60), whichever comes
+        first, and when the process exits.
+        The ``routehelper.cprofile.<route name>`` setting gives the fraction
+        for every view of that route instead, to turn profiling on or off in
+        a deployment.  Views which are not profiled are registered as they
+        would be without this option.
+        
+        Example::
+            
+            @action(renderer='json', format='json', profile=0.01)
+            @action(renderer='messages.mak')
+            def index(self):
+                ...
+        
+        or, in the settings::
+            
+            routehelper.cprofile.messages = 0.05
     """
+    # Bumped whenever a method is decorated so that action tables built
+    # before then are rebuilt by get_action_table
+    generation = 0
+
     def __init__(self, **kw):
         self.kw = kw
 
@@ -37,8 +275,50 @@ class action(object):
             wrapped.__exposed__.append(self.kw)
         else:
             wrapped.__exposed__ = [self.kw]
+        action.generation += 1
         return wrapped
 
+def get_action_table(handler):
+    """Return the view settings of the methods of ``handler`` decorated with
+    :class:`~pyramid_routehelper.action`, keyed by action name.
+
+    Each value is a dict which may contain the ``'default'`` settings for the
+    action and a ``'formatted'`` list of settings with a ``format`` and
+    ``attr``.  The table is built once per handler class and kept on the
+    class itself, so a subclass builds (and caches) its own; callers must not
+    modify it."""
+    cached = handler.__dict__.get('__action_table__')
+    if cached is not None and cached[0] == action.generation:
+        return cached[1]
+    
+    members = {}
+    for klass in reversed(inspect.getmro(handler)):
+        members.update(klass.__dict__)
+    
+    action_kwargs = {}
+    for name in sorted(members):
+        meth = members[name]
+        if isinstance(meth, classmethod):
+            meth = meth.__get__(None, handler)
+        if inspect.isroutine(meth) and hasattr(meth, '__exposed__'):
+            for settings in meth.__exposed__:
+                config_settings = settings.copy()
+                action_name = config_settings.pop('alt_for', name)
+
+                # If format is not set, use the route that doesn't specify a format
+                if 'format' not in config_settings:
+                    if 'default' in action_kwargs.get(action_name,{}):
+                        raise ConfigurationError("Two methods have been decorated without specifying a format.")
+                    else:
+                        action_kwargs.setdefault(action_name, {})['default'] = config_settings
+                # Otherwise, append to the list of view config settings for formatted views
+                else:
+                    config_settings['attr'] = name
+                    action_kwargs.setdefault(action_name, {}).setdefault('formatted',[]).append(config_settings)
+    
+    setattr(handler, '__action_table__', (action.generation, action_kwargs))
+    return action_kwargs
+
 # map.resource port
 def add_resource(self, handler, member_name, collection_name, **kwargs):
     """ Add some RESTful routes for a resource handler.
@@ -165,42 +445,477 @@ def add_resource(self, handler, member_name, collection_name, **kwargs):
             >>> # path_prefix is "regions/:region_id" 
             >>> route_path('locations', region_id=51)
             '/regions/51/locations'
-    """
-    handler = self.maybe_dotted(handler)
+
+    ``trie``
+        If ``True``, the generated routes are indexed in a segment trie shared
+        by every resource added this way, so a request is matched in time
+        proportional to the depth of its path rather than the number of
+        routes.  The application's routes mapper is replaced by a
+        :class:`~pyramid_routehelper.urldispatch.ResourceRoutesMapper` the
+        first time this is used; route names and ordering are unaffected.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages', trie=True)
     
-    action_kwargs = {}
-    for name,meth in inspect.getmembers(handler, inspect.ismethod):
-        if hasattr(meth, '__exposed__'):
-            for settings in meth.__exposed__:
-                config_settings = settings.copy()
-                action_name = config_settings.pop('alt_for', name)
+    ``converters``
+        A ``dict`` mapping marker names, such as ``id`` or the
+        ``<parent member name>_id`` of ``parent_resource``, to converters.
+        A converter is the name of a built-in converter (``'int'`` or
+        ``'uuid'``), a ``(regex, to_python)`` pair or a
+        :class:`~pyramid_routehelper.urldispatch.Converter`.  The regex is
+        compiled into the route pattern and ``to_python`` is applied while
+        the route is matched, so invalid values never reach a view and
+        ``request.matchdict`` holds the converted values.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:LocationHandler', 'location', 'locations',
+                parent_resource=dict(member_name='region', collection_name='regions'),
+                converters=dict(id='int', region_id='uuid'))
+            # GET /regions/<uuid>/locations/7 matches with matchdict['id'] == 7
+            # GET /regions/<uuid>/locations/abc does not match
+    
+    ``collapse_formats``
+        If ``True``, an action with ``format`` views is registered as a
+        single route with an optional ``.{format}`` suffix instead of one
+        route and view per format.  One view per request method looks up the
+        view for the requested format in a dict, so matching costs the same
+        however many formats an action supports.  The
+        ``<format>_formatted_<route name>`` names remain available for URL
+        generation, and the route itself accepts a ``format`` argument.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages', collapse_formats=True)
+            # GET /messages/1 and GET /messages/1.json both match route "message"
+            # route_path('message', request, id=1, format='json') == '/messages/1.json'
+            # route_path('json_formatted_message', request, id=1) == '/messages/1.json'
+    
+    ``method_dispatch``
+        If ``True``, each generated route gets a single view which calls the
+        view of the request method through a dict, rather than one view per
+        action with a ``request_method`` predicate to be tried in turn.  A
+        request with a method that none of the route's actions accepts gets
+        a ``405 Method Not Allowed`` response whose ``Allow`` header lists
+        those which do.  ``HEAD`` requests are answered by the ``GET``
+        view, whose body the server leaves out.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages', method_dispatch=True)
+            # PATCH /messages/1 is answered with 405 and "Allow: DELETE, GET, HEAD, PUT"
+    
+    ``sub_domain``
+        A sub domain, or a list of them, to which the generated routes are
+        restricted.  Their routes are kept in a separate index for each sub
+        domain, and a request is only matched against the index for the sub
+        domain of its host (and routes without a ``sub_domain``), so a
+        tenant's requests never try the routes of other tenants.  The sub
+        domain is the part of the host before the ``routehelper.domain``
+        setting if it is set, and otherwise the first label of a host with
+        three or more.  It is available as ``request.matchdict['sub_domain']``.
+        The routes accept a ``sub_domain`` argument to generate URLs on that
+        sub domain; as route names must be unique, give each tenant a
+        ``name_prefix``.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages',
+                sub_domain='acme', name_prefix='acme_')
+            # GET http://acme.example.com/messages/1 has named route "acme_message"
+            # route_url('acme_message', request, id=1, sub_domain='acme') == 'http://acme.example.com/messages/1'
 
-                # If format is not set, use the route that doesn't specify a format
-                if 'format' not in config_settings:
-                    if 'default' in action_kwargs.get(action_name,{}):
-                        raise ConfigurationError("Two methods have been decorated without specifying a format.")
+    ``cache_size``
+        The number of responses kept by the resource's cache if any of its
+        actions has a ``cache`` setting (see
+        :class:`~pyramid_routehelper.action`); 1000 by default.  The cache
+        is per process, so a write handled by one worker does not evict the
+        responses cached by others before their time to live expires.
+
+        Example::
+
+            class MessageHandler(object):
+                @action(renderer='json', cache=30)
+                def show(self):
+                    ...
+
+            config.add_resource(MessageHandler, 'message', 'messages', cache_size=5000)
+            # GET /messages/1 is answered from the cache for 30 seconds
+            # or until e.g. PUT /messages/1 or POST /messages succeeds
+
+    ``max_concurrency``, ``queue_timeout``
+        The default ``max_concurrency`` and ``queue_timeout`` of the
+        resource's actions (see :class:`~pyramid_routehelper.action`).
+
+    ``batch``
+        If ``True`` (or the maximum number of operations, 100 by default), a
+        ``POST <collection path>/batch`` route named ``batch_<collection
+        name>`` is added.  It takes a JSON list of operations, each of which
+        is handled as a ``POST`` to the collection or a ``PUT`` or
+        ``DELETE`` of a member would be, and responds with the status and
+        body of each.  See :class:`~pyramid_routehelper.batch.BatchView`.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages', batch=True)
+            # POST /messages/batch with the body
+            # [{"method": "POST", "params": {"body": "Hi"}},
+            #  {"method": "PUT", "id": 1, "params": {"body": "Hello"}},
+            #  {"method": "DELETE", "id": 2}]
+            # calls the create, update and delete actions, and responds with
+            # [{"status": 200, "body": ...}, {"status": 200, ...}, ...]
+    
+    ``paginate``
+        A pagination spec for the ``index`` action: ``True``, or a ``dict``
+        of the arguments of :class:`~pyramid_routehelper.pagination.Pagination`,
+        being the ``keys`` ordering the collection (``('id',)`` by
+        default; the last must be unique, and their values numbers,
+        strings, booleans, ``None``, dates or datetimes, aware ones being
+        decoded in UTC), and
+        the default and maximum ``limit`` of a page (20 and 100).  The index views, formatted or not,
+        read the opaque ``cursor`` and the ``limit`` parameters of the
+        request, respond with ``400 Bad Request`` if they are invalid, and
+        set ``request.page`` to a
+        :class:`~pyramid_routehelper.pagination.Page` holding the keyset
+        bound of the requested page.  The handler queries the items past
+        that bound and passes them to ``request.page.paginate()``, after
+        which ``request.page.next_url`` and ``prev_url`` link the pages
+        around it (as does the response's ``Link`` header), generated from
+        the matched route.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages',
+                paginate=dict(keys=('created', 'id'), limit=50))
+            
+            class MessageHandler(object):
+                @action(renderer='json', format='json')
+                @action(renderer='messages.mak')
+                def index(self):
+                    page = self.request.page
+                    query = session.query(Message)
+                    if page.direction == 'next':
+                        if page.after:
+                            query = query.filter(tuple_(Message.created, Message.id) > page.after)
+                        query = query.order_by(Message.created, Message.id)
                     else:
-                        action_kwargs.setdefault(action_name, {})['default'] = config_settings
-                # Otherwise, append to the list of view config settings for formatted views
-                else:
-                    config_settings['attr'] = name
-                    action_kwargs.setdefault(action_name, {}).setdefault('formatted',[]).append(config_settings)
+                        query = query.filter(tuple_(Message.created, Message.id) < page.before)
+                        query = query.order_by(Message.created.desc(), Message.id.desc())
+                    messages = page.paginate(query.limit(page.limit + 1))
+                    return {'messages': messages, 'next': page.next_url, 'prev': page.prev_url}
+    
+    ``stateless``
+        If ``True``, the handler, which must be marked stateless by a true
+        ``__stateless__`` attribute (as subclasses of
+        :class:`~pyramid_routehelper.StatelessHandler` are), is built without
+        arguments once per thread instead of once per request, and its
+        action methods are called with the request.  With ``'process'``, a
+        single instance is shared by every thread, so it must be thread
+        safe.  Views of the handler cannot have their own ``mapper``.
+        
+        Example::
+            
+            class MessageHandler(StatelessHandler):
+                __slots__ = ('messages',)
                 
-    collection = kwargs.pop('collection', {})
-    member = kwargs.pop('member', {})
-    new = kwargs.pop('new', {})
-    path_prefix = kwargs.pop('path_prefix', None)
-    name_prefix = kwargs.pop('name_prefix', None)
-    parent_resource = kwargs.pop('parent_resource', None)
+                def __init__(self):
+                    self.messages = get_message_store()
+                
+                @action(renderer='json')
+                def show(self, request):
+                    return self.messages.get(request.matchdict['id'])
+            
+            config.add_resource(MessageHandler, 'message', 'messages', stateless=True)
     
-    if parent_resource is not None:
-        if path_prefix is None:
-            path_prefix = '%s/:%s_id' % (parent_resource['collection_name'], parent_resource['member_name'])
-        if name_prefix is None:
-            name_prefix = '%s_' % parent_resource['member_name']
-    else:
-        if path_prefix is None: path_prefix = ''
-        if name_prefix is None: name_prefix = ''
+    ``actions``
+        The view settings of the handler's actions in the form returned by
+        :func:`~pyramid_routehelper.get_action_table`, used instead of the
+        handler's :class:`~pyramid_routehelper.action` decorators.
+    
+    ``lazy``
+        If ``True`` and ``handler`` is a dotted name, the handler is not
+        imported until one of its views is first called, so an application
+        does not import the modules of every handler (and everything they
+        import) at startup.  The routes and views are generated from
+        ``actions``, which must be given unless they are recorded in the
+        resource snapshot (see below).  ``config.warm_resources()``
+        imports the handlers of every lazy resource, e.g. before forking
+        workers.
+        
+        Example::
+            
+            config.add_resource('myproject.handlers:MessageHandler', 'message', 'messages', lazy=True,
+                actions={'index': {'default': {'renderer': 'json'}},
+                         'show': {'default': {'renderer': 'json'},
+                                  'formatted': [{'format': 'xml', 'attr': 'show_xml',
+                                                 'renderer': 'xml.mak'}]}})
+    
+    If ``config.use_resource_snapshot(path)`` has been called, or the
+    ``routehelper.snapshot`` setting names a file, the action table and
+    routes of the resource are read from that file rather than collected
+    from the handler, and recorded there if they are missing or the modules
+    defining the handler have changed since.
+    ``config.save_resource_snapshot()`` writes them for the next process.
+
+    If ``config.use_route_profile(profile)`` has been called, or the
+    ``routehelper.profile`` setting names a file, the routes of the resource
+    are registered in descending order of their hits in the profile: a file
+    or dict of route name hit counts, or the stats recorded with
+    ``routehelper.stats`` (see
+    :func:`~pyramid_routehelper.profile.load_route_profile`).  A route only
+    moves ahead of routes whose patterns no path can match as well as its
+    own, so every request matches the same route as in the default order.
+    Routes are reordered within one call; pass every resource to
+    :func:`~pyramid_routehelper.add_resources` to order them all together.
+
+    A URL generator is precompiled for every route added by this function;
+    :func:`pyramid_routehelper.url.resource_path` and
+    :func:`~pyramid_routehelper.url.resource_url` use them to generate URLs
+    faster than :func:`~pyramid.url.route_path`.
+    
+    Example::
+        
+        from pyramid_routehelper.url import resource_path
+        resource_path('message', request, id=1, format='json')
+        # '/messages/1.json'
+    """
+    resource_routes(self, handler, member_name, collection_name, **kwargs).register(self)
+
+def add_resources(self, resources):
+    """ Add the RESTful routes for many resource handlers at once.
+    
+    Like :func:`~pyramid_routehelper.add_resource`, this function is made
+    available as a method of the configurator by
+    ``pyramid_routehelper.includeme``.
+    
+    ``resources`` is a sequence of dicts, each holding the ``handler``,
+    ``member_name`` and ``collection_name`` arguments of ``add_resource``
+    along with any of its optional keyword arguments.  The routes of every
+    resource are generated first and checked against each other; a
+    :exc:`~pyramid.config.ConfigurationError` is raised if two resources
+    generate the same route name or pattern, rather than one silently
+    replacing the other.  The routes and views are then registered as one
+    batch.
+    
+    Example::
+        
+        config.add_resources([
+            dict(handler='myproject.handlers:MessageHandler',
+                 member_name='message', collection_name='messages'),
+            dict(handler='myproject.handlers:CommentHandler',
+                 member_name='comment', collection_name='comments',
+                 parent_resource=dict(member_name='message',
+                                      collection_name='messages')),
+            ])
+    """
+    batch = ResourceRoutes()
+    names = {}
+    patterns = {}
+    for spec in resources:
+        spec = dict(spec)
+        routes = resource_routes(self, spec.pop('handler'), spec.pop('member_name'),
+                                 spec.pop('collection_name'), **spec)
+        for name, pattern, trie, kw in routes.routes:
+            key = (normalize_pattern(pattern), routes.sub_domains.get(name))
+            if name in names:
+                raise ConfigurationError(
+                    "Route name %r is generated by both the %r and %r resources."
+                    % (name, names[name], routes.label))
+            if key in patterns:
+                raise ConfigurationError(
+                    "Route pattern %r is generated by both the %r and %r resources."
+                    % (pattern, patterns[key], routes.label))
+            names[name] = patterns[key] = routes.label
+        for name, pattern, pregenerator in routes.generator_routes:
+            if name in names:
+                raise ConfigurationError(
+                    "Route name %r is generated by both the %r and %r resources."
+                    % (name, names[name], routes.label))
+            names[name] = routes.label
+        batch.extend(routes)
+    
+    # One call site for the whole batch, instead of a stack inspection for
+    # every route and view
+    info = self._ainfo and self._ainfo[-1] or ''
+    batch.register(self, _info=info)
+
+def resource_group(self, path_prefix, name_prefix='', **kwargs):
+    """ Return a :class:`ResourceGroup` adding resources under
+    ``path_prefix``, whose routes are named with ``name_prefix``.
+    
+    Like :func:`~pyramid_routehelper.add_resource`, this function is made
+    available as a method of the configurator by
+    ``pyramid_routehelper.includeme``.
+    
+    The routes of the group's resources are kept together in a
+    :class:`~pyramid_routehelper.urldispatch.RouteGroup` of the
+    :class:`~pyramid_routehelper.urldispatch.ResourceRoutesMapper`.  Its
+    prefix is matched once per request, and none of the group's routes are
+    tried for a path which does not start with it.  Any other keyword
+    arguments are defaults for the ``add_resource`` arguments of the group's
+    resources.  The resources are checked and registered together, as by
+    :func:`~pyramid_routehelper.add_resources`, at the end of the ``with``
+    block.
+    
+    Example::
+        
+        with config.resource_group('/regions/:region_id', name_prefix='region_') as regions:
+            regions.add_resource('myproject.handlers:LocationHandler', 'location', 'locations')
+            # GET /regions/13/locations has named route "region_locations"
+            with regions.resource_group('/areas/:area_id', name_prefix='area_') as areas:
+                areas.add_resource('myproject.handlers:SiteHandler', 'site', 'sites')
+                # GET /regions/13/areas/5/sites has named route "region_area_sites"
+    """
+    return ResourceGroup(self, path_prefix, name_prefix, **kwargs)
+
+class ResourceGroup(object):
+    """Resources added under a common path and name prefix; see
+    :func:`~pyramid_routehelper.resource_group`."""
+    def __init__(self, config, path_prefix, name_prefix='', parent=None, **kwargs):
+        path_prefix = strip_slashes(path_prefix)
+        if '*' in path_prefix:
+            raise ConfigurationError("A resource group prefix cannot contain a *stararg: %r." % path_prefix)
+        self.config = config
+        self.parent = parent
+        if parent is not None:
+            path_prefix = strip_slashes(parent.path_prefix + '/' + path_prefix)
+            name_prefix = parent.name_prefix + name_prefix
+            kwargs = dict(parent.kwargs, **kwargs)
+        self.path_prefix = path_prefix
+        self.name_prefix = name_prefix
+        self.kwargs = kwargs
+        self.resources = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.register()
+    
+    def add_resource(self, handler, member_name, collection_name, **kwargs):
+        """Add a resource to the group, with the arguments of
+        :func:`~pyramid_routehelper.add_resource`; ``path_prefix`` and
+        ``name_prefix`` are relative to the group's."""
+        spec = dict(self.kwargs, **kwargs)
+        spec.update(handler=handler, member_name=member_name,
+                    collection_name=collection_name, _group=self)
+        self.resources.append(spec)
+    
+    def resource_group(self, path_prefix, name_prefix='', **kwargs):
+        """Return a group nested in this one."""
+        return ResourceGroup(self.config, path_prefix, name_prefix, self, **kwargs)
+    
+    def register(self):
+        """Register the group's resources, or hand them to the enclosing
+        group; called at the end of the ``with`` block."""
+        resources, self.resources = self.resources, []
+        if self.parent is not None:
+            self.parent.resources.extend(resources)
+        else:
+            add_resources(self.config, resources)
+    
+    def route_group(self, mapper):
+        """Return the :class:`~pyramid_routehelper.urldispatch.RouteGroup`
+        of ``mapper`` holding this group's routes."""
+        parent = None
+        if self.parent is not None:
+            parent = self.parent.route_group(mapper)
+        return mapper.group('/' + self.path_prefix, parent)
+
+class ResourceRoutes(object):
+    """The routes and views generated for one or more resources, collected
+    so that they can be checked before being registered together."""
+    def __init__(self, label=None):
+        self.label = label
+        self.routes = []
+        self.generator_routes = []
+        self.views = []
+        self.route_names = {}
+        self.url_patterns = {}
+        self.sub_domains = {}
+        self.groups = {}
+
+    def add_route(self, name, pattern, trie=False, url_pattern=None,
+                  sub_domains=None, group=None, **kw):
+        """Collect a route; ``url_pattern`` is the pattern its URLs are
+        generated from when it differs from ``pattern``, ``sub_domains``
+        the sorted tuple of sub domains it is restricted to and ``group``
+        the :class:`ResourceGroup` it was added to."""
+        if name not in self.route_names:
+            self.routes.append((name, pattern, trie, kw))
+            self.route_names[name] = pattern
+            self.url_patterns[name] = url_pattern or pattern
+            if sub_domains:
+                self.sub_domains[name] = sub_domains
+            if group is not None:
+                self.groups[name] = group
+
+    def add_generator_route(self, name, pattern, pregenerator=None):
+        if name not in self.route_names:
+            self.generator_routes.append((name, pattern, pregenerator))
+            self.route_names[name] = pattern
+            self.url_patterns[name] = pattern
+
+    def add_view(self, **kw):
+        self.views.append(kw)
+
+    def extend(self, other):
+        self.routes.extend(other.routes)
+        self.generator_routes.extend(other.generator_routes)
+        self.views.extend(other.views)
+        self.route_names.update(other.route_names)
+        self.url_patterns.update(other.url_patterns)
+        self.sub_domains.update(other.sub_domains)
+        self.groups.update(other.groups)
+
+    def register(self, config, _info=None):
+        """Add the collected routes and views to ``config``."""
+        mapper = None
+        routes = self.routes
+        hits = config.registry.queryUtility(IRouteProfile)
+        if hits:
+            routes = order_routes(routes, hits)
+        for name, pattern, trie, kw in routes:
+            route = config.add_route(name, pattern, _info=_info, **kw)
+            sub_domains = self.sub_domains.get(name)
+            group = self.groups.get(name)
+            if trie or sub_domains or group is not None:
+                if mapper is None:
+                    mapper = get_resource_mapper(config)
+                if group is not None:
+                    group = group.route_group(mapper)
+                mapper.index_route(route, sub_domains, group)
+        for name, pattern, pregenerator in self.generator_routes:
+            add_generator_route(config, name, pattern, pregenerator)
+        add_url_generators(config, self.url_patterns)
+        for kw in self.views:
+            config.add_view(_info=_info, **kw)
+
+def resolve_converters(converters):
+    """Return ``converters`` with the names of built-in converters and
+    ``(regex, to_python)`` pairs replaced by
+    :class:`~pyramid_routehelper.urldispatch.Converter` instances."""
+    resolved = {}
+    for name, converter in converters.items():
+        if isinstance(converter, basestring):
+            if converter not in builtin_converters:
+                raise ConfigurationError("Unknown converter %r for %r." % (converter, name))
+            converter = builtin_converters[converter]
+        elif not isinstance(converter, Converter):
+            converter = Converter(*converter)
+        resolved[name] = converter
+    return resolved
+
+def resource_actions(member_name, collection_name, collection, member, new,
+                     path_prefix, name_prefix, converters=None):
+    """Return the ``(action, route name, pattern[, request method])`` of
+    each route of a resource; ``path_prefix`` and ``name_prefix`` are those
+    of the resource and ``converters`` have been resolved."""
+    collection = dict(collection)
+    member = dict(member)
+    new = dict(new)
     
     member['edit'] = 'GET'
     new['new'] = 'GET'
@@ -229,40 +944,22 @@ def add_resource(self, handler, member_name, collection_name, **kwargs):
     new_path = path + '/new'
     member_path = path + '/:id'
     
-    added_route_names = {}
-    
-    def add_route_if_new(self, route_name, path, **kwargs):
-        if route_name not in added_route_names:
-            self.add_route(route_name, path, **kwargs)
-            added_route_names[route_name] = path
-
-    def add_route_and_view(self, action, route_name, path, request_method='any'):
-        if request_method != 'any':
-            request_method = request_method.upper()
-        else:
-            request_method = None
-        
-        add_route_if_new(self, route_name, path, **kwargs)
-        self.add_view(view=handler, attr=action, route_name=route_name, request_method=request_method, **action_kwargs.get(action, {}).get('default', {}))
-        
-        for format_kwargs in action_kwargs.get(action, {}).get('formatted', []):
-            format = format_kwargs.pop('format')
-            formatted_route_name = "%s_formatted_%s" % (format, route_name)
-            
-            add_route_if_new(self, formatted_route_name, "%s.%s" % (path, format), **kwargs)
-            self.add_view(view=handler, attr=format_kwargs.pop('attr'), request_method=request_method,
-                          route_name = "%s_formatted_%s" % (format, route_name), **format_kwargs)
+    if converters:
+        collection_path = typed_pattern(collection_path, converters)
+        new_path = typed_pattern(new_path, converters)
+        member_path = typed_pattern(member_path, converters)
     
+    actions = []
     for method, lst in collection_methods.iteritems():
         primary = (method != 'GET' and lst.pop(0)) or None
         for action in lst:
-            add_route_and_view(self, action, "%s%s_%s" % (name_prefix, action, collection_name), "%s/%s" % (collection_path,action))
+            actions.append((action, "%s%s_%s" % (name_prefix, action, collection_name), "%s/%s" % (collection_path,action)))
         
         if primary:
-            add_route_and_view(self, primary, name_prefix + collection_name, collection_path, method)
+            actions.append((primary, name_prefix + collection_name, collection_path, method))
     
     # Add route and view for collection
-    add_route_and_view(self, 'index', name_prefix + collection_name, collection_path, 'GET')
+    actions.append(('index', name_prefix + collection_name, collection_path, 'GET'))
     
     for method, lst in new_methods.iteritems():
         for action in lst:
@@ -270,8 +967,7 @@ def add_resource(self, handler, member_name, collection_name, **kwargs):
             name = "new_" + member_name
             if action != 'new':
                 name = action + "_" + name
-            formatted_path = (action == 'new' and new_path + '.:format') or "%s/%s.:format" % (new_path, action)
-            add_route_and_view(self, action, name_prefix + name, path, method)
+            actions.append((action, name_prefix + name, path, method))
     
     for method, lst in member_methods.iteritems():
         if method not in ['POST', 'GET', 'any']:
@@ -279,17 +975,316 @@ def add_resource(self, handler, member_name, collection_name, **kwargs):
         else:
             primary = None
         for action in lst:
-            add_route_and_view(self, action, '%s%s_%s' % (name_prefix, action, member_name), '%s/%s' % (member_path, action))
+            actions.append((action, '%s%s_%s' % (name_prefix, action, member_name), '%s/%s' % (member_path, action)))
         
         if primary:
-            add_route_and_view(self, primary, name_prefix + member_name, member_path, method)
+            actions.append((primary, name_prefix + member_name, member_path, method))
     
-    add_route_and_view(self, 'show', name_prefix + member_name, member_path, method)
-
-# Submapper support
-
-
-# Sub_domain option
+    actions.append(('show', name_prefix + member_name, member_path, 'GET'))
+    
+    return actions
 
+def resource_routes(config, handler, member_name, collection_name, **kwargs):
+    """Return the :class:`ResourceRoutes` which
+    :func:`~pyramid_routehelper.add_resource` registers for a resource,
+    without registering them."""
+    lazy = kwargs.pop('lazy', False)
+    action_kwargs = kwargs.pop('actions', None)
+    collection = dict(kwargs.pop('collection', {}))
+    member = dict(kwargs.pop('member', {}))
+    new = dict(kwargs.pop('new', {}))
+    path_prefix = kwargs.pop('path_prefix', None)
+    name_prefix = kwargs.pop('name_prefix', None)
+    parent_resource = kwargs.pop('parent_resource', None)
+    trie = kwargs.pop('trie', False)
+    collapse_formats = kwargs.pop('collapse_formats', False)
+    method_dispatch = kwargs.pop('method_dispatch', False)
+    converters = kwargs.pop('converters', None)
+    sub_domains = kwargs.pop('sub_domain', None)
+    group = kwargs.pop('_group', None)
+    cache_size = kwargs.pop('cache_size', DEFAULT_SIZE)
+    batch = kwargs.pop('batch', False)
+    pagination = kwargs.pop('paginate', None)
+    stateless = kwargs.pop('stateless', False)
+    max_concurrency = kwargs.pop('max_concurrency', None)
+    queue_timeout = kwargs.pop('queue_timeout', 0)
+    
+    # the caller's pregenerator, before it is wrapped for sub domains
+    user_pregenerator = kwargs.get('pregenerator')
+    if isinstance(sub_domains, basestring):
+        sub_domains = [sub_domains]
+    if sub_domains:
+        sub_domains = tuple(sorted([sub_domain.lower() for sub_domain in sub_domains]))
+        kwargs['pregenerator'] = SubDomainPregenerator(kwargs.get('pregenerator'))
+    
+    if parent_resource is not None:
+        if path_prefix is None:
+            path_prefix = '%s/:%s_id' % (parent_resource['collection_name'], parent_resource['member_name'])
+        if name_prefix is None:
+            name_prefix = '%s_' % parent_resource['member_name']
+    else:
+        if path_prefix is None: path_prefix = ''
+        if name_prefix is None: name_prefix = ''
+    if group is not None:
+        path_prefix = group.path_prefix + '/' + strip_slashes(path_prefix)
+        name_prefix = group.name_prefix + name_prefix
+    if converters:
+        converters = resolve_converters(converters)
+    if pagination is True:
+        pagination = Pagination()
+    elif isinstance(pagination, dict):
+        pagination = Pagination(**pagination)
+    
+    # The action table and routes of the resource may have been recorded by
+    # an earlier process
+    snapshot = config.registry.queryUtility(IResourceSnapshot)
+    key = entry = None
+    if snapshot is not None:
+        converter_regexes = dict([(name, converter.regex) for name, converter in (converters or {}).items()])
+        key = snapshot_key(handler_name(config, handler),
+                           [member_name, collection_name, collection, member, new,
+                            path_prefix, name_prefix, converter_regexes])
+        if key is not None:
+            entry = snapshot.lookup(key)
+    declared = action_kwargs is not None
+    if entry is not None and not declared:
+        if entry['actions'] is None:
+            entry = None
+        else:
+            action_kwargs = entry['actions']
+    
+    if lazy and isinstance(handler, basestring):
+        handler = lazy_handler(config, handler)
+        if action_kwargs is None:
+            if snapshot is None:
+                raise ConfigurationError("The actions of lazy resource %r must be declared." % collection_name)
+            action_kwargs = get_action_table(handler.resolve())
+    else:
+        lazy = False
+        handler = config.maybe_dotted(handler)
+        if action_kwargs is None:
+            action_kwargs = get_action_table(handler)
+    
+    instances = None
+    if stateless:
+        if lazy:
+            resolve = handler.resolve
+        else:
+            if not is_stateless(handler):
+                raise ConfigurationError("Handler %r is not marked stateless." % handler)
+            resolve = lambda: handler
+        instances = HandlerInstances(resolve, stateless is True and 'thread' or stateless)
+    
+    if entry is not None:
+        actions = entry['routes']
+    else:
+        actions = resource_actions(member_name, collection_name, collection, member, new,
+                                   path_prefix, name_prefix, converters)
+        if key is not None:
+            if declared:
+                snapshot.record(key, None, actions, [])
+            else:
+                snapshot.record(key, action_kwargs, actions,
+                                handler_modules(lazy and handler.resolve() or handler))
+    
+    convert_predicates = {}
+    
+    def route_kwargs(path, pregenerator=None):
+        route_kw = dict(kwargs, sub_domains=sub_domains, group=group)
+        if pregenerator is not None:
+            if sub_domains:
+                pregenerator = SubDomainPregenerator(pregenerator)
+            route_kw['pregenerator'] = pregenerator
+        names = tuple([name for name in marker_names(path) if name in (converters or {})])
+        if names:
+            if names not in convert_predicates:
+                convert_predicates[names] = ConvertPredicate(dict([(name, converters[name]) for name in names]))
+            route_kw['custom_predicates'] = tuple(kwargs.get('custom_predicates', ())) + (convert_predicates[names],)
+        return route_kw
+    
+    routes = ResourceRoutes(name_prefix + collection_name)
+    stats = config.registry.queryUtility(IResourceStats)
+    app_settings = config.get_settings() or {}
+    route_rates = route_profilers(app_settings)
+    profile_dir = app_settings.get('routehelper.cprofile_dir', DEFAULT_DIRECTORY)
+    dump_samples = int(app_settings.get('routehelper.cprofile_samples', DEFAULT_DUMP_SAMPLES))
+    dump_interval = float(app_settings.get('routehelper.cprofile_interval', DEFAULT_DUMP_INTERVAL))
+    profilers = {}
+    
+    # Every view of a resource with a cached action invalidates its cache
+    response_cache = None
+    for table in action_kwargs.values():
+        for settings in [table.get('default', {})] + table.get('formatted', []):
+            if settings.get('cache'):
+                response_cache = ResponseCache(cache_size)
+    
+    # Background actions run on the registry's job queue and report to the
+    # resource's job route
+    jobs = None
+    job_route_name = name_prefix + member_name + '_job'
+    for table in action_kwargs.values():
+        for settings in [table.get('default', {})] + table.get('formatted', []):
+            if settings.get('background'):
+                jobs = job_queue(config.registry, app_settings)
+    
+    coalescer = Coalescer()
+    
+    def add_action_view(action, settings, format=None, **kw):
+        kw.update(settings)
+        ttl = kw.pop('cache', None)
+        cache_vary = kw.pop('cache_vary', True)
+        validator = kw.pop('validator', None)
+        stream = kw.pop('stream', None)
+        coalesce = kw.pop('coalesce', None)
+        background = kw.pop('background', None)
+        limit = kw.pop('max_concurrency', max_concurrency)
+        timeout = kw.pop('queue_timeout', queue_timeout)
+        rate = profile_rate(kw.pop('profile', 0))
+        rate = route_rates.get(kw['route_name'], rate)
+        if stream:
+            if stream is True:
+                stream = format
+            if stream not in stream_formats:
+                raise ConfigurationError("Unknown stream format %r for action %r." % (stream, action))
+            if kw.get('renderer') is not None or ttl or coalesce or background:
+                raise ConfigurationError("The streamed action %r can have no renderer, cache, coalesce or background." % action)
+        # The library's wrappers go inside the user's decorator, so that it
+        # still runs for responses answered from the cache, coalesced or
+        # shed
+        decorators = []
+        if stats is not None:
+            decorators.append(stats_decorator(stats, kw['route_name'], action))
+        if kw.get('decorator') is not None:
+            decorators.append(config.maybe_dotted(kw['decorator']))
+        if background:
+            decorators.append(background_decorator(jobs, job_route_name, kw.get('permission')))
+        if rate:
+            profiler = profilers.get(kw['route_name'])
+            if profiler is None:
+                profiler = RouteProfiler(kw['route_name'], profile_dir, dump_samples, dump_interval)
+                profilers[kw['route_name']] = profiler
+            decorators.append(profile_decorator(profiler, rate))
+        if response_cache is not None:
+            decorators.append(invalidate_decorator(response_cache))
+        if validator is not None:
+            decorators.append(validator_decorator(config.maybe_dotted(validator)))
+        if ttl and response_cache is not None:
+            decorators.append(cache_decorator(response_cache, ttl, vary_headers(cache_vary)))
+        if coalesce:
+            decorators.append(coalesce_decorator(coalescer, coalesce_headers(coalesce)))
+        if limit:
+            limit = concurrency_limits(config.registry).get(routes.label, action, limit, timeout)
+            decorators.append(limit_decorator(limit))
+        if pagination and action == 'index':
+            decorators.append(pagination_decorator(pagination))
+        if decorators or stream:
+            if stream:
+                decorators.append(stream_decorator(stream))
+            kw['decorator'] = compose_decorators(decorators)
+        if instances is not None and kw['view'] is handler:
+            if kw.get('mapper') is not None:
+                raise ConfigurationError("The action %r of a stateless resource can have no mapper." % action)
+            kw['mapper'] = StatelessViewMapper(instances)
+        if lazy and kw['view'] is handler:
+            kw['mapper'] = LazyViewMapper(config.maybe_dotted(kw.get('mapper')))
+        if method_dispatch:
+            kw['request_method'] = None
+        routes.add_view(**kw)
+    
+    # With method_dispatch, the view of each route and request method is
+    # named, and called by the route's MethodDispatcher
+    route_methods = {}
+    
+    def method_name(route_name, request_method):
+        if not method_dispatch:
+            return ''
+        name = method_view_name(request_method)
+        route_methods.setdefault(route_name, {})[request_method] = name
+        return name
 
-# Converters??
\ No newline at end of file
+    def add_route_and_view(action, route_name, path, request_method='any'):
+        if request_method != 'any':
+            request_method = request_method.upper()
+        else:
+            request_method = None
+        
+        if route_name in route_formats:
+            add_collapsed_route_and_view(action, route_name, path, request_method)
+            return
+        
+        routes.add_route(route_name, path, trie, **route_kwargs(path))
+        add_action_view(action, action_kwargs.get(action, {}).get('default', {}),
+                        view=handler, attr=action, route_name=route_name, request_method=request_method,
+                        name=method_name(route_name, request_method))
+        
+        for format_kwargs in action_kwargs.get(action, {}).get('formatted', []):
+            format_kwargs = format_kwargs.copy()
+            format = format_kwargs.pop('format')
+            formatted_route_name = "%s_formatted_%s" % (format, route_name)
+            
+            routes.add_route(formatted_route_name, "%s.%s" % (path, format), trie, **route_kwargs(path))
+            add_action_view(action, format_kwargs, format, view=handler, request_method=request_method,
+                            route_name=formatted_route_name,
+                            name=method_name(formatted_route_name, request_method))
+    
+    def add_collapsed_route_and_view(action, route_name, path, request_method):
+        formats = route_formats[route_name]
+        routes.add_route(route_name, format_pattern(path, formats), trie, url_pattern=path,
+                         **route_kwargs(path, FormatPregenerator(user_pregenerator)))
+        for format in formats:
+            routes.add_generator_route("%s_formatted_%s" % (format, route_name), "%s.%s" % (path, format),
+                                       kwargs.get('pregenerator'))
+        
+        name = method_name(route_name, request_method)
+        views = {'': name + format_view_name('')}
+        add_action_view(action, action_kwargs.get(action, {}).get('default', {}),
+                        view=handler, attr=action, route_name=route_name, request_method=request_method,
+                        name=views[''])
+        for format_kwargs in action_kwargs.get(action, {}).get('formatted', []):
+            format_kwargs = format_kwargs.copy()
+            format = format_kwargs.pop('format')
+            views[format] = name + format_view_name(format)
+            add_action_view(action, format_kwargs, format, view=handler, route_name=route_name,
+                            request_method=request_method, name=views[format])
+        if method_dispatch:
+            request_method = None
+        routes.add_view(view=FormatDispatcher(route_name, views), route_name=route_name,
+                        request_method=request_method, name=name)
+    
+    # Routes shared by several actions carry the formats of all of them
+    route_formats = {}
+    if collapse_formats:
+        for action, route_name, path in [entry[:3] for entry in actions]:
+            for format_kwargs in action_kwargs.get(action, {}).get('formatted', []):
+                formats = route_formats.setdefault(route_name, [])
+                if format_kwargs['format'] not in formats:
+                    formats.append(format_kwargs['format'])
+    
+    # The batch and job routes come first so that the member route does not
+    # match them
+    paths = dict([entry[1:3] for entry in actions])
+    if batch:
+        batch_route_name = name_prefix + 'batch_' + collection_name
+        batch_path = paths[name_prefix + collection_name] + '/batch'
+        routes.add_route(batch_route_name, batch_path, trie, **route_kwargs(batch_path))
+        routes.add_view(view=BatchView(name_prefix + collection_name, name_prefix + member_name,
+                                       batch is True and DEFAULT_LIMIT or batch),
+                        route_name=batch_route_name, request_method='POST', renderer='json')
+    if jobs is not None:
+        job_path = paths[name_prefix + collection_name] + '/jobs/:job_id'
+        routes.add_route(job_route_name, job_path, trie, **route_kwargs(job_path))
+        routes.add_view(view=JobView(jobs), route_name=job_route_name, request_method='GET',
+                        renderer='json')
+    
+    for entry in actions:
+        add_route_and_view(*entry)
+    
+    for route_name, views in route_methods.items():
+        routes.add_view(view=MethodDispatcher(route_name, views), route_name=route_name)
+    
+    # resource_path generates the URLs of routes with the caller's
+    # pregenerator through route_url, which calls it
+    if user_pregenerator is not None:
+        routes.url_patterns.clear()
+    
+    return routes
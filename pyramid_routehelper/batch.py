@@ -0,0 +1,109 @@
+import traceback
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from pyramid.httpexceptions import HTTPBadRequest
+from pyramid.request import Request
+from pyramid.router import Router
+
+from pyramid_routehelper.url import resource_path
+
+# methods of the operations of a batch and whether they apply to a member
+BATCH_METHODS = {'POST': False, 'PUT': True, 'DELETE': True}
+
+DEFAULT_LIMIT = 100
+
+# environ keys of a batch request which are not copied to its operations
+REQUEST_KEYS = ('PATH_INFO', 'QUERY_STRING', 'REQUEST_METHOD', 'CONTENT_TYPE',
+                'CONTENT_LENGTH', 'HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH',
+                'wsgi.input', 'bfg.routes.route', 'bfg.routes.matchdict')
+
+class BatchView(object):
+    """ View of the ``batch_<collection name>`` route of a resource added
+    with ``batch=True``.
+
+    The body of the request is a JSON list of operations, each a dict with
+    a ``method`` (``POST``, ``PUT`` or ``DELETE``), the ``id`` of the member
+    for ``PUT`` and ``DELETE``, and optionally the ``params`` posted to the
+    action and a ``format``.  Each operation is handled by the application
+    as a request to the collection or member route would be, with the
+    headers of the batch request, so the action's view settings (renderer,
+    permission, decorators, predicates) all apply.  The operations run in
+    turn and independently of each other; the response is a JSON list of
+    the ``status`` and ``body`` of each, the body decoded if it is JSON.  An
+    operation raising an exception which no exception view of the
+    application handles has status 500, its traceback written to
+    ``wsgi.errors``, and does not stop the others."""
+    def __init__(self, collection_route, member_route, limit=DEFAULT_LIMIT):
+        self.collection_route = collection_route
+        self.member_route = member_route
+        self.limit = limit
+        self.router = None
+
+    def operations(self, request):
+        """Return the operations of ``request``; raises a ``ValueError``
+        describing the first problem with them."""
+        try:
+            operations = json.loads(request.body)
+        except ValueError:
+            raise ValueError('The batch is not valid JSON.')
+        if not isinstance(operations, list):
+            raise ValueError('The batch is not a list of operations.')
+        if len(operations) > self.limit:
+            raise ValueError('The batch has more than %d operations.' % self.limit)
+        for i, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                raise ValueError('Operation %d is not an object.' % i)
+            method = str(operation.get('method', 'POST')).upper()
+            if method not in BATCH_METHODS:
+                raise ValueError('Operation %d has unsupported method %r.' % (i, method))
+            if BATCH_METHODS[method] != ('id' in operation):
+                raise ValueError('Operation %d must %shave an id.' % (
+                    i, not BATCH_METHODS[method] and 'not ' or ''))
+            params = operation.get('params')
+            if params is not None and not isinstance(params, dict):
+                raise ValueError('The params of operation %d are not an object.' % i)
+            operation['method'] = method
+        return operations
+
+    def __call__(self, context, request):
+        try:
+            operations = self.operations(request)
+        except ValueError, e:
+            return HTTPBadRequest(str(e))
+        if self.router is None:
+            self.router = Router(request.registry)
+        environ = dict([(key, value) for key, value in request.environ.items()
+                        if key not in REQUEST_KEYS and not key.startswith('webob')])
+        markers = dict(request.matchdict or {})
+        return [self.run(request, environ, markers, operation)
+                for operation in operations]
+
+    def run(self, request, environ, markers, operation):
+        kw = dict(markers)
+        if 'id' in operation:
+            route_name = self.member_route
+            kw['id'] = operation['id']
+        else:
+            route_name = self.collection_route
+        path = resource_path(route_name, request, format=operation.get('format'), **kw)
+        params = operation.get('params')
+        if params is not None:
+            params = dict([(key, isinstance(value, unicode) and value.encode('utf-8') or value)
+                           for key, value in params.items()])
+        subrequest = Request.blank(path, dict(environ), POST=params)
+        subrequest.method = operation['method']
+        try:
+            response = subrequest.get_response(self.router)
+            body = response.body
+            if response.content_type == 'application/json':
+                body = json.loads(body)
+        except Exception:
+            errors = request.environ.get('wsgi.errors')
+            if errors is not None:
+                traceback.print_exc(file=errors)
+            return {'status': 500, 'body': 'Internal Server Error'}
+        return {'status': response.status_int, 'body': body}
@@ -0,0 +1,154 @@
+import threading
+import time
+
+# methods whose requests are answered from the cache; a successful request
+# with any other method invalidates it
+READ_METHODS = ('GET', 'HEAD')
+
+DEFAULT_SIZE = 1000
+
+# request headers whose values must match for requests to share a response
+# unless the action names its own
+DEFAULT_VARY = ('Authorization', 'Cookie')
+
+class ResponseCache(object):
+    """ A least recently used cache of the responses of one resource's views,
+    each kept for at most its own time to live.
+
+    Entries are grouped by scope: the matchdict of a collection route
+    (``(parent markers, None)``) or of a member route (``(parent markers,
+    id)``), so that a write to a member can evict that member's entries and
+    those of its collection without touching any other."""
+    def __init__(self, size=DEFAULT_SIZE):
+        self.size = size
+        self.entries = {}
+        self.scopes = {}
+        # circular doubly linked list of [previous, next, key], most
+        # recently used last
+        self.head = head = []
+        head[:] = [head, head, None]
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the response cached for ``key``, or ``None``."""
+        self.lock.acquire()
+        try:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            link, scope, expires, response = entry
+            if expires < time.time():
+                self._remove(key)
+                return None
+            # move to the most recently used end
+            link[0][1] = link[1]
+            link[1][0] = link[0]
+            last = self.head[0]
+            link[0] = last
+            link[1] = self.head
+            last[1] = self.head[0] = link
+            return response
+        finally:
+            self.lock.release()
+
+    def set(self, key, scope, ttl, response):
+        """Cache ``response`` for ``key`` in ``scope`` for ``ttl``
+        seconds."""
+        self.lock.acquire()
+        try:
+            if key in self.entries:
+                self._remove(key)
+            elif len(self.entries) >= self.size:
+                self._remove(self.head[1][2])
+            last = self.head[0]
+            link = [last, self.head, key]
+            last[1] = self.head[0] = link
+            self.entries[key] = (link, scope, time.time() + ttl, response)
+            self.scopes.setdefault(scope, set()).add(key)
+        finally:
+            self.lock.release()
+
+    def _remove(self, key):
+        link, scope, expires, response = self.entries.pop(key)
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+        keys = self.scopes[scope]
+        keys.discard(key)
+        if not keys:
+            del self.scopes[scope]
+
+    def invalidate(self, matchdict):
+        """Evict the entries of the member and collection routes of the
+        resource matching ``matchdict``."""
+        parent, id = request_scope(matchdict)
+        self.lock.acquire()
+        try:
+            for scope in [(parent, None), (parent, id)]:
+                for key in list(self.scopes.get(scope, ())):
+                    self._remove(key)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            for key in list(self.entries):
+                self._remove(key)
+        finally:
+            self.lock.release()
+
+def request_scope(matchdict):
+    """Return the ``(parent markers, id)`` scope of ``matchdict``."""
+    matchdict = dict(matchdict or {})
+    matchdict.pop('format', None)
+    id = matchdict.pop('id', None)
+    return tuple(sorted(matchdict.items())), id
+
+def vary_headers(setting):
+    """Return the names of the request headers to vary on for a ``cache_vary``
+    or ``coalesce`` action setting: :data:`DEFAULT_VARY` for ``True``, or the
+    header (or sequence of headers) given."""
+    if setting is True:
+        return DEFAULT_VARY
+    if isinstance(setting, basestring):
+        return (setting,)
+    return tuple(setting)
+
+def cache_decorator(cache, ttl, headers=DEFAULT_VARY):
+    """Return a view decorator answering ``GET`` and ``HEAD`` requests from
+    ``cache``, and caching successful responses for ``ttl`` seconds.
+    Requests share a response only if their ``headers`` have the same
+    values; responses setting a cookie are never cached."""
+    def decorator(view):
+        def cached_view(context, request):
+            if request.method not in READ_METHODS:
+                return view(context, request)
+            matchdict = request.matchdict or {}
+            key = (cached_view, tuple(sorted(matchdict.items())),
+                   request.query_string,
+                   tuple([request.headers.get(name) for name in headers]))
+            response = cache.get(key)
+            if response is None:
+                response = view(context, request)
+                if (response.status_int == 200 and
+                    'Set-Cookie' not in response.headers):
+                    cache.set(key, request_scope(matchdict), ttl,
+                              response.copy())
+                return response
+            return response.copy()
+        return cached_view
+    return decorator
+
+def invalidate_decorator(cache):
+    """Return a view decorator invalidating the entries of ``cache`` for the
+    requested member and its collection after each successful request with a
+    method other than ``GET`` or ``HEAD``."""
+    def decorator(view):
+        def invalidating_view(context, request):
+            response = view(context, request)
+            if (request.method not in READ_METHODS and
+                response.status_int < 400):
+                cache.invalidate(request.matchdict)
+            return response
+        return invalidating_view
+    return decorator
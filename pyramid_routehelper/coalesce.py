@@ -0,0 +1,79 @@
+import sys
+import threading
+
+from pyramid_routehelper.cache import DEFAULT_VARY
+from pyramid_routehelper.cache import READ_METHODS
+from pyramid_routehelper.cache import vary_headers
+
+class Flight(object):
+    """One execution of a view shared by the requests waiting on it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.exc_info = None
+
+class Coalescer(object):
+    """ Runs a view once for concurrent identical requests, the first of
+    which (the leader) calls it while the others wait for its response.
+    ``shared`` counts the requests answered with another's response."""
+    def __init__(self):
+        self.flights = {}
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, key, call):
+        self.lock.acquire()
+        try:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                self.shared += 1
+        finally:
+            self.lock.release()
+
+        if not leader:
+            flight.done.wait()
+            if flight.exc_info is not None:
+                raise flight.exc_info[0], flight.exc_info[1], flight.exc_info[2]
+            return flight.response.copy()
+
+        try:
+            try:
+                response = call()
+            except:
+                flight.exc_info = sys.exc_info()
+                raise
+            # followers may join until the flight is removed below
+            flight.response = response.copy()
+            return response
+        finally:
+            self.lock.acquire()
+            try:
+                del self.flights[key]
+            finally:
+                self.lock.release()
+            flight.done.set()
+
+def coalesce_headers(setting):
+    """Return the names of the request headers to vary on for the
+    ``coalesce`` action setting."""
+    return vary_headers(setting)
+
+def coalesce_decorator(coalescer, headers=DEFAULT_VARY):
+    """Return a view decorator sharing the response of concurrent ``GET``
+    and ``HEAD`` requests to the same view, matchdict and query string whose
+    ``headers`` have the same values through ``coalescer``."""
+    def decorator(view):
+        def coalesced_view(context, request):
+            if request.method not in READ_METHODS:
+                return view(context, request)
+            route = getattr(request, 'matched_route', None)
+            key = (coalesced_view, request.method, route and route.name,
+                   tuple(sorted((request.matchdict or {}).items())),
+                   request.query_string,
+                   tuple([request.headers.get(name) for name in headers]))
+            return coalescer(key, lambda: view(context, request))
+        return coalesced_view
+    return decorator
@@ -0,0 +1,59 @@
+import calendar
+from datetime import datetime
+
+from pyramid.httpexceptions import HTTPNotModified
+
+from pyramid_routehelper.cache import READ_METHODS
+
+def timestamp(value):
+    """Return ``value``, a :class:`datetime.datetime` (UTC if naive) or a
+    number of seconds since the epoch, as whole seconds since the epoch."""
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple())
+    return int(value)
+
+def not_modified(request, etag, last_modified):
+    """Return whether the conditional headers of ``request`` show that the
+    client's copy of the response is current.  ``If-None-Match`` takes
+    precedence over ``If-Modified-Since``."""
+    if request.if_none_match:
+        return etag is not None and etag in request.if_none_match
+    if last_modified is not None and request.if_modified_since is not None:
+        return timestamp(last_modified) <= timestamp(request.if_modified_since)
+    return False
+
+def validator_decorator(validator):
+    """ Return a view decorator answering ``GET`` and ``HEAD`` requests with
+    ``304 Not Modified``, without calling the view, when their conditional
+    headers match the value ``validator(request)`` returns.
+
+    A string is used as the ETag of the response, a
+    :class:`datetime.datetime` or a number of seconds since the epoch as its
+    modification time; with ``None`` the view is always called.  The
+    ``ETag`` or ``Last-Modified`` header is set on the responses of the view
+    which do not already have one."""
+    def decorator(view):
+        def conditional_view(context, request):
+            if request.method not in READ_METHODS:
+                return view(context, request)
+            value = validator(request)
+            if value is None:
+                return view(context, request)
+            etag = last_modified = None
+            if isinstance(value, basestring):
+                etag = value
+            else:
+                last_modified = timestamp(value)
+            if not_modified(request, etag, last_modified):
+                response = HTTPNotModified()
+            else:
+                response = view(context, request)
+                if response.status_int != 200:
+                    return response
+            if etag is not None and 'ETag' not in response.headers:
+                response.etag = etag
+            if last_modified is not None and 'Last-Modified' not in response.headers:
+                response.last_modified = last_modified
+            return response
+        return conditional_view
+    return decorator
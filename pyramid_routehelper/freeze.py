@@ -0,0 +1,83 @@
+import gc
+from types import ClassType
+
+from zope.interface import implementedBy
+
+from pyramid.interfaces import IMultiView
+from pyramid.interfaces import IRootFactory
+from pyramid.interfaces import IRouteRequest
+from pyramid.interfaces import IRoutesMapper
+from pyramid.interfaces import IView
+from pyramid.interfaces import IViewClassifier
+from pyramid.traversal import DefaultRootFactory
+
+from pyramid_routehelper.interfaces import ILazyHandlers
+from pyramid_routehelper.urldispatch import ResourceRoutesMapper
+from pyramid_routehelper.view import Dispatcher
+
+def freeze_resources(config):
+    """ Build everything the resources of ``config`` would otherwise build
+    on their first requests, then make the routes read-only.
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``freeze_resources`` method of the configurator.  It is meant to be
+    called once the configuration is complete, in the parent process of
+    prefork workers, so that the workers share these structures instead of
+    each building (and so writing to the memory of) its own copy.  It
+
+    - commits the configuration,
+
+    - imports the handlers of lazy resources and maps their views,
+
+    - looks up the route interface of every ``collapse_formats`` and
+      ``method_dispatch`` dispatcher,
+
+    - fills the registry's lookup caches with the views of every route whose
+      context factory is a class,
+
+    - replaces the lists of a
+      :class:`~pyramid_routehelper.urldispatch.ResourceRoutesMapper` with
+      tuples, after which adding a route raises a
+      :exc:`~pyramid.exceptions.ConfigurationError`, and
+
+    - collects garbage left over from the configuration."""
+    config.commit()
+    registry = config.registry
+
+    for lazy in registry.queryUtility(ILazyHandlers, default={}).values():
+        lazy.prepare()
+
+    view_names = {}
+    for registration in registry.registeredAdapters():
+        required = registration.required
+        if (len(required) != 3 or required[0] is not IViewClassifier or
+            not registration.provided.isOrExtends(IView)):
+            continue
+        view_names.setdefault(required[1], set()).add(registration.name)
+        views = [registration.factory]
+        if IMultiView.providedBy(registration.factory):
+            views = [view for order, view, phash in registration.factory.views]
+        for view in views:
+            view = getattr(view, '__original_view__', view)
+            if isinstance(view, Dispatcher):
+                view.prepare(registry)
+
+    mapper = registry.queryUtility(IRoutesMapper)
+    if mapper is not None:
+        root_factory = registry.queryUtility(IRootFactory,
+                                             default=DefaultRootFactory)
+        for route in mapper.get_routes():
+            request_iface = registry.queryUtility(IRouteRequest,
+                                                  name=route.name)
+            factory = route.factory or root_factory
+            if request_iface is None or not isinstance(factory, (type, ClassType)):
+                continue
+            context_iface = implementedBy(factory)
+            for name in view_names.get(request_iface, ()):
+                registry.adapters.lookup(
+                    (IViewClassifier, request_iface, context_iface), IView,
+                    name=name, default=None)
+        if isinstance(mapper, ResourceRoutesMapper):
+            mapper.freeze()
+
+    gc.collect()
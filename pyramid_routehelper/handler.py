@@ -0,0 +1,74 @@
+import threading
+
+from pyramid.exceptions import ConfigurationError
+
+class StatelessHandler(object):
+    """ Base class of handlers which may be added with ``stateless=True``.
+
+    A stateless handler is built without arguments, once per thread (or per
+    process), and its action methods are called with the request, e.g.
+    ``def show(self, request)``.  It must keep nothing about a request on
+    the instance.  The empty ``__slots__`` lets subclasses declare their own
+    to do without an instance ``__dict__``."""
+    __slots__ = ()
+    __stateless__ = True
+
+def is_stateless(handler):
+    return getattr(handler, '__stateless__', False) is True
+
+class HandlerInstances(object):
+    """ The reused instances of the handler of one resource: one per thread
+    if ``scope`` is ``'thread'``, or one shared by every thread if it is
+    ``'process'``.  ``resolve`` returns the handler class."""
+    def __init__(self, resolve, scope='thread'):
+        if scope not in ('thread', 'process'):
+            raise ConfigurationError('Unknown stateless scope %r.' % scope)
+        self.resolve = resolve
+        self.scope = scope
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.instance = None
+
+    def get(self):
+        """Return this thread's instance, building it if necessary."""
+        if self.scope == 'process':
+            instance = self.instance
+            if instance is None:
+                self.lock.acquire()
+                try:
+                    if self.instance is None:
+                        self.instance = self.build()
+                    instance = self.instance
+                finally:
+                    self.lock.release()
+            return instance
+        try:
+            return self.local.instance
+        except AttributeError:
+            instance = self.local.instance = self.build()
+            return instance
+
+    def build(self):
+        handler = self.resolve()
+        if not is_stateless(handler):
+            raise ConfigurationError('Handler %r is not marked stateless.' % handler)
+        return handler()
+
+class StatelessViewMapper(object):
+    """ :term:`view mapper` factory for the views of a resource added with
+    ``stateless=True``, calling the ``attr`` method of the reused instance
+    of ``instances`` with the request instead of building the handler for
+    each request."""
+    def __init__(self, instances):
+        self.instances = instances
+
+    def __call__(self, **kw):
+        attr = kw.get('attr') or '__call__'
+        instances = self.instances
+        def map_stateless(view):
+            def stateless_view(context, request):
+                inst = instances.get()
+                request.__view__ = inst
+                return getattr(inst, attr)(request)
+            return stateless_view
+        return map_stateless
@@ -0,0 +1,68 @@
+from zope.interface import Attribute
+from zope.interface import Interface
+
+class IResourceStats(Interface):
+    """ Hit counts and latency histograms of the views generated by
+    :func:`~pyramid_routehelper.add_resource`."""
+    buckets = Attribute('Ascending upper bounds (in seconds) of the latency '
+                        'histogram buckets')
+
+    def record(route_name, action, elapsed):
+        """ Count one request to ``action`` through ``route_name`` which took
+        ``elapsed`` seconds."""
+
+    def snapshot():
+        """ Return the counts recorded so far as a dict keyed by route name
+        and then action name."""
+
+    def reset():
+        """ Forget every count recorded so far."""
+
+class IResourceURLs(Interface):
+    """ Marker interface of the dict mapping the names of the routes added by
+    :func:`~pyramid_routehelper.add_resource` to their precompiled
+    :class:`~pyramid_routehelper.url.URLGenerator`."""
+
+class ILazyHandlers(Interface):
+    """ Marker interface of the dict holding the
+    :class:`~pyramid_routehelper.lazy.LazyHandler` of each handler of the
+    resources added with ``lazy=True``."""
+
+class IResourceSnapshot(Interface):
+    """ The snapshot of the action tables and routes of the resources added
+    by :func:`~pyramid_routehelper.add_resource`."""
+    path = Attribute('The path of the snapshot file')
+
+    def lookup(key):
+        """ Return the up to date entry recorded for ``key``, or ``None``."""
+
+    def record(key, actions, routes, modules):
+        """ Record the action table and routes of a resource, valid until
+        one of ``modules`` changes."""
+
+    def save():
+        """ Write the snapshot file if anything was recorded."""
+
+class IRouteProfile(Interface):
+    """ Marker interface of the dict mapping route names to the hit counts
+    by which :func:`~pyramid_routehelper.add_resource` orders the routes it
+    registers."""
+
+class IConcurrencyLimits(Interface):
+    """ The concurrency limits of the actions of the resources added by
+    :func:`~pyramid_routehelper.add_resource` with ``max_concurrency``."""
+
+    def snapshot():
+        """ Return the requests in flight, waiting and rejected so far as a
+        dict keyed by resource name and then action name."""
+
+class IJobQueue(Interface):
+    """ The queue running the background actions of the resources added by
+    :func:`~pyramid_routehelper.add_resource`, and holding their jobs."""
+
+    def submit(call):
+        """ Return a job calling ``call`` on a worker thread, or ``None`` if
+        the queue is full."""
+
+    def get(job_id):
+        """ Return the job ``job_id``, or ``None``."""
@@ -0,0 +1,202 @@
+import Queue
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from zope.interface import implements
+
+from pyramid.exceptions import Forbidden
+from pyramid.httpexceptions import HTTPNotFound
+from pyramid.httpexceptions import HTTPServiceUnavailable
+from pyramid.httpexceptions import WSGIHTTPException
+from pyramid.response import Response
+from pyramid.security import has_permission
+from pyramid.threadlocal import manager
+
+from pyramid_routehelper.interfaces import IJobQueue
+from pyramid_routehelper.url import resource_url
+
+DEFAULT_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_KEEP = 1000
+
+class Job(object):
+    """ A call of a background action: ``'pending'`` until a worker runs
+    it, ``'running'``, then ``'done'`` with the ``status`` and ``body`` of
+    the response as its ``result``, or ``'failed'`` with the ``exc_info``
+    of the exception it raised.  ``permission`` is the one the action's
+    view was registered with, needed to look the job up."""
+    def __init__(self, call, permission=None):
+        self.id = uuid.uuid4().hex
+        self.call = call
+        self.permission = permission
+        self.status = 'pending'
+        self.result = None
+        self.exc_info = None
+        self.created = time.time()
+        self.finished = None
+
+    def run(self):
+        self.status = 'running'
+        try:
+            try:
+                try:
+                    response = self.call()
+                except WSGIHTTPException, response:
+                    # HTTP exceptions are responses
+                    pass
+                body = response.body
+                if response.content_type == 'application/json':
+                    body = json.loads(body)
+                self.result = {'status': response.status_int, 'body': body}
+            except:
+                self.exc_info = sys.exc_info()
+                self.status = 'failed'
+            else:
+                self.status = 'done'
+        finally:
+            self.call = None
+            self.finished = time.time()
+
+    def info(self):
+        info = {'id': self.id, 'status': self.status}
+        if self.result is not None:
+            info['result'] = self.result
+        return info
+
+class JobQueue(object):
+    """ Runs the jobs submitted to it on ``workers`` threads, holding up to
+    ``queue_size`` jobs waiting for one of them, and keeps the ``keep``
+    most recently finished jobs around to be looked up.
+
+    The queue is in-process: jobs are lost when the process exits, and the
+    job route only finds the jobs of the process which answers it."""
+    implements(IJobQueue)
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE, keep=DEFAULT_KEEP):
+        self.workers = workers
+        self.keep = keep
+        self.queue = Queue.Queue(queue_size)
+        self.jobs = {}
+        self.finished = []
+        self.lock = threading.Lock()
+        self.threads = []
+
+    def submit(self, call, permission=None):
+        """Return a :class:`Job` calling ``call`` on a worker thread, or
+        ``None`` if the queue is full."""
+        self.start()
+        job = Job(call, permission)
+        self.lock.acquire()
+        try:
+            self.jobs[job.id] = job
+        finally:
+            self.lock.release()
+        try:
+            self.queue.put_nowait(job)
+        except Queue.Full:
+            self.lock.acquire()
+            try:
+                del self.jobs[job.id]
+            finally:
+                self.lock.release()
+            return None
+        return job
+
+    def get(self, job_id):
+        """Return the job ``job_id``, or ``None``."""
+        return self.jobs.get(job_id)
+
+    def start(self):
+        if len(self.threads) >= self.workers:
+            return
+        self.lock.acquire()
+        try:
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.work)
+                thread.setDaemon(True)
+                thread.start()
+                self.threads.append(thread)
+        finally:
+            self.lock.release()
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            try:
+                job.run()
+            except:
+                # a job must never take its worker down with it
+                job.exc_info = sys.exc_info()
+                job.status = 'failed'
+            self.lock.acquire()
+            try:
+                self.finished.append(job.id)
+                while len(self.finished) > self.keep:
+                    self.jobs.pop(self.finished.pop(0), None)
+            finally:
+                self.lock.release()
+
+def job_queue(registry, settings=None):
+    """Return the :class:`JobQueue` of ``registry``, registering one sized
+    by the ``routehelper.jobs.workers``, ``routehelper.jobs.queue_size`` and
+    ``routehelper.jobs.keep`` settings if necessary."""
+    jobs = registry.queryUtility(IJobQueue)
+    if jobs is None:
+        settings = settings or {}
+        jobs = JobQueue(int(settings.get('routehelper.jobs.workers', DEFAULT_WORKERS)),
+                        int(settings.get('routehelper.jobs.queue_size', DEFAULT_QUEUE_SIZE)),
+                        int(settings.get('routehelper.jobs.keep', DEFAULT_KEEP)))
+        registry.registerUtility(jobs, IJobQueue)
+    return jobs
+
+def background_decorator(jobs, job_route, permission=None):
+    """Return a view decorator running the view as a job of ``jobs``, and
+    answering ``202 Accepted`` with the job's URL on ``job_route`` as its
+    ``Location``, or ``503 Service Unavailable`` if the queue is full.
+    Looking the job up requires ``permission``, that of the view."""
+    def decorator(view):
+        def background_view(context, request):
+            # the body is read before the server reuses its input
+            request.make_body_seekable()
+            registry = request.registry
+            def call():
+                manager.push({'registry': registry, 'request': request})
+                try:
+                    return view(context, request)
+                finally:
+                    manager.pop()
+            job = jobs.submit(call, permission)
+            if job is None:
+                return HTTPServiceUnavailable(headers=[('Retry-After', '1')])
+            kw = dict(request.matchdict or {})
+            kw.pop('id', None)
+            kw.pop('format', None)
+            return Response(json.dumps(job.info()), status=202,
+                            content_type='application/json',
+                            location=resource_url(job_route, request, job_id=job.id, **kw))
+        return background_view
+    return decorator
+
+class JobView(object):
+    """ View of the ``<member name>_job`` route of a resource with
+    background actions, returning the ``id``, ``status`` and, once it is
+    done, ``result`` of a job.  A job whose action requires a permission
+    is only returned to requests having it."""
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    def __call__(self, context, request):
+        job = self.jobs.get(request.matchdict['job_id'])
+        if job is None:
+            return HTTPNotFound()
+        if (job.permission is not None and
+            not has_permission(job.permission, context, request)):
+            raise Forbidden('Unauthorized: job %s requires permission %r' % (job.id, job.permission))
+        return job.info()
@@ -0,0 +1,94 @@
+import threading
+
+from pyramid.config import DefaultViewMapper
+from pyramid.interfaces import IViewMapperFactory
+
+from pyramid_routehelper.interfaces import ILazyHandlers
+
+class LazyHandler(object):
+    """ Stands in for the handler class named ``name`` in the views of a
+    resource added with ``lazy=True``, importing it when first resolved.
+
+    Resolution is guarded by a lock so that concurrent first requests import
+    the handler once."""
+    def __init__(self, name, resolver):
+        self.name = name
+        self.resolver = resolver
+        self.handler = None
+        self.lock = threading.Lock()
+        self.views = []
+
+    def __repr__(self):
+        return '<LazyHandler %s>' % self.name
+
+    def resolve(self):
+        """Return the handler class, importing it if necessary."""
+        handler = self.handler
+        if handler is None:
+            self.lock.acquire()
+            try:
+                if self.handler is None:
+                    self.handler = self.resolver.maybe_resolve(self.name)
+                handler = self.handler
+            finally:
+                self.lock.release()
+        return handler
+
+    def prepare(self):
+        """Resolve the handler and map each of its views now rather than on
+        their first request."""
+        self.resolve()
+        for prepare in self.views:
+            prepare()
+
+class LazyViewMapper(object):
+    """ :term:`view mapper` factory for the views of a :class:`LazyHandler`.
+
+    The view is mapped by ``mapper`` (by default the application's default
+    view mapper) the first time it is called, once the handler has been
+    resolved."""
+    def __init__(self, mapper=None):
+        self.mapper = mapper
+
+    def __call__(self, **kw):
+        mapper = self.mapper
+        if mapper is None:
+            mapper = kw['registry'].queryUtility(IViewMapperFactory,
+                                                 default=DefaultViewMapper)
+        def map_lazy(lazy):
+            mapped = []
+            def prepare():
+                if not mapped:
+                    mapped.append(mapper(**kw)(lazy.resolve()))
+                return mapped[0]
+            def lazy_view(context, request):
+                if not mapped:
+                    prepare()
+                return mapped[0](context, request)
+            lazy.views.append(prepare)
+            return lazy_view
+        return map_lazy
+
+def lazy_handler(config, name):
+    """ Return the :class:`LazyHandler` for the dotted name ``name``, shared
+    by every resource of ``config``'s registry using it."""
+    handlers = config.registry.queryUtility(ILazyHandlers)
+    if handlers is None:
+        handlers = {}
+        config.registry.registerUtility(handlers, ILazyHandlers)
+    key = (config.package_name, name)
+    handler = handlers.get(key)
+    if handler is None:
+        handler = handlers[key] = LazyHandler(name, config.name_resolver)
+    return handler
+
+def warm_resources(config):
+    """ Import the handlers of every resource added with ``lazy=True``, so
+    that a worker forked afterwards does not import them on its first
+    requests.
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``warm_resources`` method of the configurator.  Returns the handler
+    classes."""
+    handlers = config.registry.queryUtility(ILazyHandlers, default={})
+    return [handler.resolve() for key, handler in sorted(handlers.items())]
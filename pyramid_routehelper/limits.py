@@ -0,0 +1,141 @@
+import math
+import threading
+import time
+
+from zope.interface import implements
+
+from pyramid.httpexceptions import HTTPServiceUnavailable
+
+from pyramid_routehelper.interfaces import IConcurrencyLimits
+
+class ConcurrencyLimit(object):
+    """ Allows at most ``limit`` requests to run at once, making the others
+    wait for up to ``timeout`` seconds for one of them to finish."""
+    def __init__(self, limit, timeout=0):
+        if limit < 1:
+            raise ValueError('The concurrency limit must be at least 1, not %r.' % limit)
+        self.limit = limit
+        self.timeout = timeout
+        self.condition = threading.Condition(threading.Lock())
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Return whether a request may run, after waiting if necessary;
+        :meth:`release` must be called when it has if so."""
+        condition = self.condition
+        condition.acquire()
+        try:
+            if self.in_flight >= self.limit and self.timeout > 0:
+                deadline = time.time() + self.timeout
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.limit:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            if self.in_flight >= self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            return True
+        finally:
+            condition.release()
+
+    def release(self):
+        condition = self.condition
+        condition.acquire()
+        try:
+            self.in_flight -= 1
+            condition.notify()
+        finally:
+            condition.release()
+
+    def snapshot(self):
+        return {'limit': self.limit, 'in_flight': self.in_flight,
+                'waiting': self.waiting, 'rejected': self.rejected}
+
+class ConcurrencyLimits(object):
+    """ The :class:`ConcurrencyLimit` of each resource and action."""
+    implements(IConcurrencyLimits)
+
+    def __init__(self):
+        self.limits = {}
+        self.lock = threading.Lock()
+
+    def get(self, resource, action, limit, timeout=0):
+        """Return the limit of ``action`` of ``resource``, making it with
+        ``limit`` and ``timeout`` if there is none yet."""
+        self.lock.acquire()
+        try:
+            key = (resource, action)
+            if key not in self.limits:
+                self.limits[key] = ConcurrencyLimit(limit, timeout)
+            return self.limits[key]
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """ Return ``{resource: {action: counts}}`` where ``counts`` holds the
+        ``limit``, the number of requests ``in_flight`` and ``waiting``, and
+        the number ``rejected`` so far."""
+        result = {}
+        for (resource, action), limit in self.limits.items():
+            result.setdefault(resource, {})[action] = limit.snapshot()
+        return result
+
+def concurrency_limits(registry):
+    """Return the :class:`ConcurrencyLimits` of ``registry``, registering
+    it if necessary."""
+    limits = registry.queryUtility(IConcurrencyLimits)
+    if limits is None:
+        limits = ConcurrencyLimits()
+        registry.registerUtility(limits, IConcurrencyLimits)
+    return limits
+
+class ReleasingIterator(object):
+    """ Iterates over the ``app_iter`` of a streamed response, and calls
+    ``release`` once when the server closes it."""
+    def __init__(self, app_iter, release):
+        self.app_iter = app_iter
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.app_iter)
+
+    def close(self):
+        try:
+            if hasattr(self.app_iter, 'close'):
+                self.app_iter.close()
+        finally:
+            release, self.release = self.release, None
+            if release is not None:
+                release()
+
+def limit_decorator(limit):
+    """Return a view decorator answering ``503 Service Unavailable`` when
+    ``limit`` does not let the request run.  The request holds its place
+    until its response is returned or, for a response whose ``app_iter`` is
+    not a list, until the server closes that."""
+    retry_after = str(max(1, int(math.ceil(limit.timeout))))
+    def decorator(view):
+        def limited_view(context, request):
+            if not limit.acquire():
+                return HTTPServiceUnavailable(headers=[('Retry-After', retry_after)])
+            try:
+                response = view(context, request)
+                app_iter = getattr(response, 'app_iter', ())
+                if not isinstance(app_iter, (list, tuple)):
+                    response.app_iter = ReleasingIterator(app_iter, limit.release)
+                    return response
+            except:
+                limit.release()
+                raise
+            limit.release()
+            return response
+        return limited_view
+    return decorator
@@ -0,0 +1,216 @@
+import base64
+import datetime
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from pyramid.httpexceptions import HTTPBadRequest
+from webob.datetime_utils import UTC
+
+from pyramid_routehelper.url import resource_url
+
+DEFAULT_LIMIT = 20
+DEFAULT_MAX_LIMIT = 100
+
+# types of the key values a cursor holds as they are; dates and datetimes
+# are held as tagged lists of their fields
+KEY_TYPES = (int, long, float, basestring, bool, type(None))
+
+def encode_key(value):
+    """Return key ``value`` as a JSON value; a naive or aware (stored in
+    UTC) :class:`datetime.datetime` or a :class:`datetime.date` becomes a
+    dict tagged ``'dt'``, ``'dtz'`` or ``'d'``.  Raises a ``TypeError`` for any
+    other type than those of :data:`KEY_TYPES`."""
+    if isinstance(value, datetime.datetime):
+        tag = 'dt'
+        if value.tzinfo is not None:
+            tag = 'dtz'
+            value = value.astimezone(UTC)
+        return {tag: [value.year, value.month, value.day, value.hour,
+                      value.minute, value.second, value.microsecond]}
+    if isinstance(value, datetime.date):
+        return {'d': [value.year, value.month, value.day]}
+    if not isinstance(value, KEY_TYPES):
+        raise TypeError('A cursor cannot hold the key value %r: keys must be '
+                        'numbers, strings, booleans, None, dates or datetimes.' % (value,))
+    return value
+
+def decode_key(value):
+    """Return the key value encoded as ``value`` by :func:`encode_key`;
+    raises a ``ValueError`` if it is invalid."""
+    if isinstance(value, dict):
+        if len(value) != 1:
+            raise ValueError('Invalid cursor.')
+        tag, fields = value.items()[0]
+        if (tag not in ('dt', 'dtz', 'd') or not isinstance(fields, list) or
+            [field for field in fields if type(field) not in (int, long)]):
+            raise ValueError('Invalid cursor.')
+        try:
+            if tag == 'd':
+                return datetime.date(*fields)
+            value = datetime.datetime(*fields)
+        except TypeError:
+            raise ValueError('Invalid cursor.')
+        if tag == 'dtz':
+            value = value.replace(tzinfo=UTC)
+        return value
+    if not isinstance(value, KEY_TYPES):
+        raise ValueError('Invalid cursor.')
+    return value
+
+def encode_cursor(direction, bound):
+    """Return the opaque cursor for the page in ``direction`` (``'next'`` or
+    ``'prev'``) of the keyset ``bound``."""
+    data = json.dumps([direction == 'prev' and 'p' or 'n',
+                       [encode_key(value) for value in bound]],
+                      separators=(',', ':'))
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+def decode_cursor(cursor, size):
+    """Return the ``(direction, bound)`` of ``cursor``, whose bound must
+    hold ``size`` key values; raises a ``ValueError`` if it is invalid."""
+    if isinstance(cursor, unicode):
+        cursor = cursor.encode('ascii', 'replace')
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor.')
+    if (not isinstance(data, list) or len(data) != 2 or data[0] not in ('n', 'p')
+        or not isinstance(data[1], list) or len(data[1]) != size):
+        raise ValueError('Invalid cursor.')
+    bound = tuple([decode_key(value) for value in data[1]])
+    return data[0] == 'p' and 'prev' or 'next', bound
+
+class Pagination(object):
+    """ The pagination spec of a resource: the names of the ``keys`` which
+    order its collection (and the last of which is unique), and the default
+    and maximum ``limit`` of a page."""
+    def __init__(self, keys=('id',), limit=DEFAULT_LIMIT, max_limit=DEFAULT_MAX_LIMIT):
+        if isinstance(keys, basestring):
+            keys = (keys,)
+        self.keys = tuple(keys)
+        self.limit = limit
+        self.max_limit = max_limit
+
+    def page(self, request):
+        """Return the :class:`Page` requested by the ``cursor`` and
+        ``limit`` parameters of ``request``; raises a ``ValueError`` if
+        they are invalid."""
+        limit = request.params.get('limit')
+        if limit is None:
+            limit = self.limit
+        else:
+            try:
+                limit = int(limit)
+            except ValueError:
+                raise ValueError('Invalid limit.')
+            if not 0 < limit <= self.max_limit:
+                raise ValueError('The limit must be between 1 and %d.' % self.max_limit)
+        direction, bound = 'next', None
+        cursor = request.params.get('cursor')
+        if cursor:
+            direction, bound = decode_cursor(cursor, len(self.keys))
+        return Page(self, request, direction, bound, limit)
+
+class Page(object):
+    """ The page of a paginated ``index`` view, available to the handler as
+    ``request.page``.
+
+    ``bound`` is ``None`` for the first page, or the tuple of key values
+    after which (if ``direction`` is ``'next'``) or before which (if it is
+    ``'prev'``) the page's items are.  The handler should query up to
+    ``limit + 1`` items past the bound, in the order of the keys for
+    ``'next'`` and in reverse order for ``'prev'``, and pass them to
+    :meth:`paginate`; the cost of a page then does not depend on how deep
+    it is."""
+    def __init__(self, pagination, request, direction, bound, limit):
+        self.pagination = pagination
+        self.request = request
+        self.direction = direction
+        self.bound = bound
+        self.limit = limit
+        self.next = None
+        self.prev = None
+
+    @property
+    def after(self):
+        if self.direction == 'next':
+            return self.bound
+
+    @property
+    def before(self):
+        if self.direction == 'prev':
+            return self.bound
+
+    def key(self, item):
+        """Return the tuple of key values of ``item``, a dict or object."""
+        if isinstance(item, dict):
+            return tuple([item[name] for name in self.pagination.keys])
+        return tuple([getattr(item, name) for name in self.pagination.keys])
+
+    def paginate(self, items):
+        """Return the page of ``items``, queried as described above, in the
+        order of the keys, and set the :attr:`next` and :attr:`prev` cursors
+        of the pages around it (``None`` if there is none)."""
+        items = list(items)
+        more = len(items) > self.limit
+        items = items[:self.limit]
+        if self.direction == 'prev':
+            items.reverse()
+        if items:
+            first, last = self.key(items[0]), self.key(items[-1])
+            if self.direction == 'next':
+                self.next = more and encode_cursor('next', last) or None
+                self.prev = self.bound is not None and encode_cursor('prev', first) or None
+            else:
+                self.prev = more and encode_cursor('prev', first) or None
+                self.next = encode_cursor('next', last)
+        elif self.bound is not None:
+            # past either end; link back to the other side of the bound
+            opposite = self.direction == 'next' and 'prev' or 'next'
+            setattr(self, opposite, encode_cursor(opposite, self.bound))
+        return items
+
+    def url(self, cursor):
+        """Return the URL of the index with ``cursor`` (and the request's
+        other parameters), generated from the matched route, or ``None``
+        for no cursor."""
+        if cursor is None:
+            return None
+        request = self.request
+        query = [(name, value) for name, value in request.GET.items() if name != 'cursor']
+        query.append(('cursor', cursor))
+        kw = dict(request.matchdict or {})
+        format = kw.pop('format', None)
+        return resource_url(request.matched_route.name, request, format=format,
+                            _query=query, **kw)
+
+    @property
+    def next_url(self):
+        return self.url(self.next)
+
+    @property
+    def prev_url(self):
+        return self.url(self.prev)
+
+def pagination_decorator(pagination):
+    """Return a view decorator setting ``request.page`` for the view, which
+    responds with ``400 Bad Request`` to an invalid cursor or limit, and
+    adding ``Link`` headers to the pages around it to the response."""
+    def decorator(view):
+        def paginated_view(context, request):
+            try:
+                page = pagination.page(request)
+            except ValueError, e:
+                return HTTPBadRequest(str(e))
+            request.page = page
+            response = view(context, request)
+            links = ['<%s>; rel="%s"' % (url, rel) for url, rel in
+                     [(page.next_url, 'next'), (page.prev_url, 'prev')] if url]
+            if links and 'Link' not in response.headers:
+                response.headers['Link'] = ', '.join(links)
+            return response
+        return paginated_view
+    return decorator
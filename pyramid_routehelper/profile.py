@@ -0,0 +1,116 @@
+import heapq
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from pyramid_routehelper.interfaces import IRouteProfile
+from pyramid_routehelper.urldispatch import pattern_segments
+
+def load_route_profile(profile):
+    """ Return the ``{route name: hits}`` of ``profile``: the path of a JSON
+    file, a dict or an
+    :class:`~pyramid_routehelper.interfaces.IResourceStats`.
+
+    The file or dict may map route names to hit counts, or be a dump or
+    snapshot of the resource stats (route names mapped to the counts of
+    each action), whose hits are summed per route."""
+    if isinstance(profile, basestring):
+        f = open(profile)
+        try:
+            profile = json.load(f)
+        finally:
+            f.close()
+    elif hasattr(profile, 'snapshot'):
+        profile = profile.snapshot()
+    hits = {}
+    for name, value in profile.items():
+        if isinstance(value, dict):
+            value = sum([action.get('hits', 0) for action in value.values()])
+        hits[str(name)] = value
+    return hits
+
+def use_route_profile(config, profile):
+    """ Register the routes of later
+    :func:`~pyramid_routehelper.add_resource` and
+    :func:`~pyramid_routehelper.add_resources` calls hottest first according
+    to ``profile`` (see :func:`load_route_profile`).
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``use_route_profile`` method of the configurator, and calls it with
+    the ``routehelper.profile`` setting if it is set.  Returns the hit
+    counts."""
+    hits = load_route_profile(profile)
+    config.registry.registerUtility(hits, IRouteProfile)
+    return hits
+
+def patterns_overlap(a, b):
+    """Return whether a path may match both of the pattern segments ``a``
+    and ``b`` (from
+    :func:`~pyramid_routehelper.urldispatch.pattern_segments`).  Patterns
+    which cannot be split into segments may overlap with any other."""
+    if a is None or b is None:
+        return True
+    if len(a) != len(b):
+        return False
+    for (literal_a, segment_a), (literal_b, segment_b) in zip(a, b):
+        if literal_a and literal_b and segment_a != segment_b:
+            return False
+    return True
+
+def order_routes(routes, hits):
+    """ Return ``routes``, a list of ``(name, pattern, ...)`` tuples in
+    registration order, with the most requested according to ``hits`` first.
+
+    A route is only moved ahead of those which no path can match as well as
+    it, so the route matching any request is the same in both orders.  Among
+    the routes free to go next, the one with the most hits (its own or those
+    of a route it must stay ahead of) goes first, and ties keep their
+    registration order."""
+    segments = [pattern_segments(route[1]) for route in routes]
+    predecessors = [0] * len(routes)
+    successors = [[] for route in routes]
+    # earlier routes by segment count and first literal segment (None for a
+    # first segment with a marker), and those which cannot be split
+    buckets = {}
+    unsplit = []
+    for i, route_segments in enumerate(segments):
+        if route_segments is None:
+            earlier = range(i)
+        else:
+            size = len(route_segments)
+            literal, first = route_segments and route_segments[0] or (False, None)
+            if literal:
+                earlier = buckets.get((size, first), []) + buckets.get((size, None), [])
+            else:
+                earlier = []
+                for (bucket_size, bucket_first), bucket in buckets.items():
+                    if bucket_size == size:
+                        earlier.extend(bucket)
+            earlier = [j for j in earlier if patterns_overlap(segments[j], route_segments)] + unsplit
+        for j in earlier:
+            successors[j].append(i)
+        predecessors[i] = len(earlier)
+        if route_segments is None:
+            unsplit.append(i)
+        else:
+            buckets.setdefault((size, literal and first or None), []).append(i)
+
+    # a route which must stay ahead of a hotter one is as hot as it
+    priorities = [0] * len(routes)
+    for i in reversed(range(len(routes))):
+        priorities[i] = max([hits.get(routes[i][0], 0)] +
+                            [priorities[j] for j in successors[i]])
+    
+    ready = [(-priorities[i], i) for i in range(len(routes)) if not predecessors[i]]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        priority, i = heapq.heappop(ready)
+        ordered.append(routes[i])
+        for j in successors[i]:
+            predecessors[j] -= 1
+            if not predecessors[j]:
+                heapq.heappush(ready, (-priorities[j], j))
+    return ordered
@@ -0,0 +1,111 @@
+import atexit
+import cProfile
+import os
+import random
+import tempfile
+import threading
+import time
+
+DEFAULT_DIRECTORY = os.path.join(tempfile.gettempdir(), 'routehelper-profiles')
+
+# the statistics are written after this many new samples or seconds,
+# whichever comes first, and when the process exits
+DEFAULT_DUMP_SAMPLES = 100
+DEFAULT_DUMP_INTERVAL = 60
+
+def profile_rate(value):
+    """Return the fraction of requests to profile for the ``profile`` action
+    setting or ``routehelper.cprofile.<route name>`` setting ``value``."""
+    if value is True:
+        return 1.0
+    if isinstance(value, basestring):
+        value = value.strip().lower()
+        if value in ('true', 'on', 'yes'):
+            return 1.0
+        if value in ('false', 'off', 'no', ''):
+            return 0.0
+    rate = float(value)
+    if not 0 <= rate <= 1:
+        raise ValueError('The profiled fraction of requests must be between 0 and 1, not %r.' % value)
+    return rate
+
+class RouteProfiler(object):
+    """ Runs the sampled requests to the views of the route ``route_name``
+    under :mod:`cProfile`, and writes the statistics aggregated over every
+    profiled request to ``<directory>/<route name>.<pid>.pstats`` once
+    ``dump_samples`` requests have been profiled or ``dump_interval``
+    seconds have passed since it last did, and when the process exits.
+
+    A profiler can only profile one thread at a time, so a request sampled
+    while another is being profiled is not profiled."""
+    def __init__(self, route_name, directory=DEFAULT_DIRECTORY,
+                 dump_samples=DEFAULT_DUMP_SAMPLES, dump_interval=DEFAULT_DUMP_INTERVAL):
+        self.route_name = route_name
+        self.directory = directory
+        self.dump_samples = dump_samples
+        self.dump_interval = dump_interval
+        self.profile = cProfile.Profile()
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.dumped_samples = 0
+        self.dumped_at = time.time()
+        atexit.register(self.flush)
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, '%s.%d.pstats' % (self.route_name, os.getpid()))
+
+    def __call__(self, view, context, request):
+        if not self.lock.acquire(False):
+            return view(context, request)
+        try:
+            self.profile.enable()
+            try:
+                return view(context, request)
+            finally:
+                self.profile.disable()
+                self.samples += 1
+                if (self.samples - self.dumped_samples >= self.dump_samples or
+                    time.time() - self.dumped_at >= self.dump_interval):
+                    self.dump()
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """Write the statistics if requests were profiled since they were
+        last written."""
+        self.lock.acquire()
+        try:
+            if self.samples > self.dumped_samples:
+                self.dump()
+        finally:
+            self.lock.release()
+
+    def dump(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = self.path
+        fd, temp = tempfile.mkstemp(dir=self.directory, prefix='.' + self.route_name)
+        os.close(fd)
+        self.profile.dump_stats(temp)
+        os.rename(temp, path)
+        self.dumped_samples = self.samples
+        self.dumped_at = time.time()
+
+def profile_decorator(profiler, rate):
+    """Return a view decorator calling the view through ``profiler`` for a
+    random fraction ``rate`` of the requests."""
+    def decorator(view):
+        def profiled_view(context, request):
+            if random.random() < rate:
+                return profiler(view, context, request)
+            return view(context, request)
+        return profiled_view
+    return decorator
+
+def route_profilers(settings):
+    """Return the ``{route name: rate}`` of the ``routehelper.cprofile.*``
+    settings."""
+    prefix = 'routehelper.cprofile.'
+    return dict([(name[len(prefix):], profile_rate(value))
+                 for name, value in (settings or {}).items() if name.startswith(prefix)])
@@ -0,0 +1,171 @@
+import os
+import pkgutil
+import sys
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from zope.interface import implements
+
+from pyramid_routehelper.interfaces import IResourceSnapshot
+
+# Bumped whenever the layout of a snapshot changes; files written with any
+# other version are ignored
+SNAPSHOT_VERSION = 1
+
+def native(value):
+    """Return the JSON ``value`` with its unicode strings encoded."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [native(item) for item in value]
+    if isinstance(value, dict):
+        return dict([(native(key), native(item)) for key, item in value.items()])
+    return value
+
+def module_signature(name):
+    """Return the modification time and size of the source of the module
+    ``name``, without importing it, or ``None`` if it has no file."""
+    module = sys.modules.get(name)
+    if module is not None:
+        filename = getattr(module, '__file__', None)
+    else:
+        try:
+            loader = pkgutil.find_loader(name)
+        except ImportError:
+            loader = None
+        filename = loader is not None and loader.get_filename(name) or None
+    if filename is None:
+        return None
+    if filename[-4:] in ('.pyc', '.pyo') and os.path.exists(filename[:-1]):
+        filename = filename[:-1]
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [stat.st_mtime, stat.st_size]
+
+def handler_modules(handler):
+    """Return the names of the modules defining ``handler`` and its bases."""
+    modules = []
+    for klass in handler.__mro__:
+        if klass is not object and klass.__module__ not in modules:
+            modules.append(klass.__module__)
+    return modules
+
+class ResourceSnapshot(object):
+    """ The action tables and routes generated by
+    :func:`~pyramid_routehelper.add_resource`, kept in the JSON file at
+    ``path`` so that later processes can skip collecting them.
+
+    Each entry records the modification time and size of the modules
+    defining the handler and its bases, and is ignored once any of them has
+    changed, so editing the :class:`~pyramid_routehelper.action` decorators
+    of a handler invalidates its entries."""
+    implements(IResourceSnapshot)
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            fp = open(self.path)
+            try:
+                data = json.load(fp)
+            finally:
+                fp.close()
+        except (IOError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('version') != SNAPSHOT_VERSION:
+            return
+        for entry in data.get('resources', ()):
+            entry = native(entry)
+            self.entries[entry['key']] = entry
+
+    def lookup(self, key):
+        """ Return the entry for ``key`` if its modules are unchanged."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        for name, signature in entry['modules']:
+            if module_signature(name) != signature:
+                return None
+        return entry
+
+    def record(self, key, actions, routes, modules):
+        """ Record the ``actions`` table of a handler defined in (and with
+        bases defined in) ``modules``, and the ``routes`` of the resource.
+        ``actions`` is ``None`` if it was not collected from the handler.
+        Returns ``False`` if the entry cannot be saved as JSON, in which case
+        nothing is recorded."""
+        entry = dict(key=key, actions=actions, routes=routes,
+                     modules=[[name, module_signature(name)] for name in modules])
+        try:
+            json.dumps(entry)
+        except (TypeError, ValueError):
+            return False
+        self.entries[key] = native(json.loads(json.dumps(entry)))
+        self.dirty = True
+        return True
+
+    def save(self):
+        """ Write the snapshot if anything was recorded since it was loaded
+        or last saved; the file is replaced atomically."""
+        if not self.dirty:
+            return
+        data = dict(version=SNAPSHOT_VERSION,
+                    resources=[self.entries[key] for key in sorted(self.entries)])
+        temp = '%s.%d.tmp' % (self.path, os.getpid())
+        fp = open(temp, 'w')
+        try:
+            json.dump(data, fp, sort_keys=True, indent=1)
+        finally:
+            fp.close()
+        os.rename(temp, self.path)
+        self.dirty = False
+
+def handler_name(config, handler):
+    """Return the absolute dotted name of ``handler``, a handler class or
+    the dotted name of one relative to ``config``'s package."""
+    if isinstance(handler, basestring):
+        if handler.startswith('.'):
+            handler = config.package_name + handler
+        return handler
+    return '%s:%s' % (handler.__module__, handler.__name__)
+
+def snapshot_key(handler, args):
+    """Return the key of the snapshot entry for a resource of the dotted
+    ``handler`` name added with ``args``, or ``None`` if they cannot be
+    saved as JSON."""
+    try:
+        return json.dumps([handler] + list(args), sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+def use_resource_snapshot(config, path):
+    """ Use (and if necessary create) the snapshot file at ``path`` for the
+    resources added from now on.
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``use_resource_snapshot`` method of the configurator, and calls it
+    with the ``routehelper.snapshot`` setting if it is set.  Returns the
+    :class:`ResourceSnapshot`."""
+    snapshot = config.registry.queryUtility(IResourceSnapshot)
+    if snapshot is None or snapshot.path != path:
+        snapshot = ResourceSnapshot(path)
+        config.registry.registerUtility(snapshot, IResourceSnapshot)
+    return snapshot
+
+def save_resource_snapshot(config):
+    """ Save the snapshot in use, if any entry was added or replaced.
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``save_resource_snapshot`` method of the configurator."""
+    snapshot = config.registry.queryUtility(IResourceSnapshot)
+    if snapshot is not None:
+        snapshot.save()
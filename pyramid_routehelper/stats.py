@@ -0,0 +1,125 @@
+import threading
+import time
+from bisect import bisect_left
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from zope.interface import implements
+
+from pyramid_routehelper.interfaces import IResourceStats
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+class ResourceStats(object):
+    """ Per route and action hit counts and latency histograms.
+
+    Every thread records into its own counters, so recording a request takes
+    no lock; the lock is only taken the first time a thread records and when
+    the counters of all threads are merged by :meth:`snapshot`."""
+    implements(IResourceStats)
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            self.lock.acquire()
+            try:
+                self.shards.append(shard)
+            finally:
+                self.lock.release()
+            return shard
+
+    def record(self, route_name, action, elapsed):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._shard()
+        counts = shard.get((route_name, action))
+        if counts is None:
+            # one count per bucket, one for slower requests, then the total
+            counts = shard[(route_name, action)] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, elapsed)] += 1
+        counts[-1] += elapsed
+
+    def snapshot(self):
+        """ Return ``{route_name: {action: stats}}`` where ``stats`` holds the
+        number of ``hits``, their ``total`` time in seconds and the
+        cumulative ``histogram`` as ``[upper_bound, count]`` pairs ending with
+        ``None`` for requests slower than the last bucket."""
+        merged = {}
+        self.lock.acquire()
+        try:
+            shards = list(self.shards)
+        finally:
+            self.lock.release()
+        for shard in shards:
+            for key, counts in shard.items():
+                total = merged.setdefault(key, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+
+        result = {}
+        bounds = list(self.buckets) + [None]
+        for (route_name, action), counts in merged.items():
+            cumulative = 0
+            histogram = []
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                histogram.append([bound, cumulative])
+            result.setdefault(route_name, {})[action] = {
+                'hits': cumulative,
+                'total': counts[-1],
+                'histogram': histogram,
+                }
+        return result
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            for shard in self.shards:
+                shard.clear()
+        finally:
+            self.lock.release()
+
+    def dump(self, fp):
+        """ Write :meth:`snapshot` to the file-like object ``fp`` as JSON."""
+        json.dump(self.snapshot(), fp, sort_keys=True)
+
+def stats_decorator(stats, route_name, action):
+    """ Return a view decorator recording the latency of each call to the
+    view in ``stats``."""
+    def decorator(view):
+        def timed_view(context, request):
+            start = time.time()
+            try:
+                return view(context, request)
+            finally:
+                stats.record(route_name, action, time.time() - start)
+        return timed_view
+    return decorator
+
+def add_resource_stats(config, buckets=DEFAULT_BUCKETS):
+    """ Start recording hit counts and latencies for the views generated by
+    later :func:`~pyramid_routehelper.add_resource` calls.
+
+    This function should never be called directly; ``includeme`` adds it as
+    the ``add_resource_stats`` method of the configurator, and calls it when
+    the ``routehelper.stats`` setting is true.  The
+    :class:`ResourceStats` can then be read with
+    ``registry.getUtility(IResourceStats)``."""
+    stats = config.registry.queryUtility(IResourceStats)
+    if stats is None:
+        stats = ResourceStats(buckets)
+        config.registry.registerUtility(stats, IResourceStats)
+    return stats
@@ -0,0 +1,79 @@
+import csv
+from StringIO import StringIO
+
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
+from pyramid.response import Response
+
+# bytes of serialized items collected before a chunk is sent
+CHUNK_SIZE = 8192
+
+def ndjson_lines(items):
+    """Serialize each of ``items`` as a line of JSON."""
+    dumps = json.dumps
+    for item in items:
+        yield dumps(item) + '\n'
+
+def encode_row(row):
+    return [isinstance(value, unicode) and value.encode('utf-8') or value
+            for value in row]
+
+def csv_lines(items):
+    """Serialize ``items`` as CSV rows.  Items are sequences of values, or
+    dicts whose (sorted) keys are written as a header before the first."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    fields = None
+    for item in items:
+        if isinstance(item, dict):
+            if fields is None:
+                fields = sorted(item)
+                writer.writerow(encode_row(fields))
+            item = [item.get(field, '') for field in fields]
+        writer.writerow(encode_row(item))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+# serializer and content type of each stream format
+stream_formats = {
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+    'csv': (csv_lines, 'text/csv'),
+    }
+
+def chunks(lines, size=CHUNK_SIZE):
+    """Join ``lines`` into chunks of at least ``size`` bytes (but the last),
+    so that each holds many items without holding them all."""
+    chunk = []
+    length = 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield ''.join(chunk)
+
+def stream_decorator(format):
+    """ Return a view decorator turning the iterable returned by a view into
+    a response which serializes it in the stream ``format`` (``'ndjson'`` or
+    ``'csv'``) as its ``app_iter`` is consumed.
+
+    Only the items of the current chunk are held in memory, whatever the
+    length of the iterable.  Responses returned by the view are passed
+    through unchanged."""
+    serialize, content_type = stream_formats[format]
+    def decorator(view):
+        def streaming_view(context, request):
+            result = view(context, request)
+            if isinstance(result, Response):
+                return result
+            return Response(app_iter=chunks(serialize(result)),
+                            content_type=content_type, charset='utf-8')
+        return streaming_view
+    return decorator
@@ -1,9 +1,16 @@
+from __future__ import with_statement
 import unittest
 from pyramid import testing
 from pyramid.config import Configurator
-from pyramid_routehelper import includeme, add_resource, action, ConfigurationError
+from pyramid_routehelper import includeme, add_resource, action, get_action_table, ConfigurationError
+from pyramid_routehelper import StatelessHandler
 from pyramid.url import route_path
 
+try:
+    import json
+except ImportError: # pragma: no cover
+    import simplejson as json
+
 
 class TestResourceGeneration_add_resource(unittest.TestCase):
     def _create_config(self, autocommit=True):
@@ -104,6 +111,54 @@ class TestResourceGeneration_add_resource(unittest.TestCase):
         assert route_path('messages', testing.DummyRequest(), category_id=2) == '/categories/2/messages'
         assert route_path('message', testing.DummyRequest(), category_id=2, id=1) == '/categories/2/messages/1'
     
+    def test_resources_with_trie(self):
+        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages', path_prefix='/category/:category_id', trie=True)
+        
+        assert route_path('messages', testing.DummyRequest(), category_id=2) == '/category/2/messages'
+        assert route_path('json_formatted_message', testing.DummyRequest(), id=1, category_id=2) == '/category/2/messages/1.json'
+        assert route_path('edit_message', testing.DummyRequest(), id=1, category_id=2) == '/category/2/messages/1/edit'
+    
+    def test_resources_with_collapse_formats(self):
+        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages', path_prefix='/category/:category_id', collapse_formats=True)
+        
+        assert route_path('messages', testing.DummyRequest(), category_id=2) == '/category/2/messages'
+        assert route_path('messages', testing.DummyRequest(), category_id=2, format='json') == '/category/2/messages.json'
+        assert route_path('json_formatted_messages', testing.DummyRequest(), category_id=2) == '/category/2/messages.json'
+        assert route_path('xml_formatted_messages', testing.DummyRequest(), category_id=2) == '/category/2/messages.xml'
+        assert route_path('message', testing.DummyRequest(), id=1, category_id=2) == '/category/2/messages/1'
+        assert route_path('json_formatted_edit_message', testing.DummyRequest(), id=1, category_id=2) == '/category/2/messages/1/edit.json'
+        
+        names = [route.name for route in self.config.get_routes_mapper().get_routes()]
+        assert 'json_formatted_messages' not in names
+        assert len(names) == len(set(names)) == 4
+    
+    def test_collapsed_routes_keep_pregenerator(self):
+        def lang_pregenerator(request, elements, kw):
+            kw.setdefault('lang', 'en')
+            return elements, kw
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', path_prefix='/:lang',
+                                 pregenerator=lang_pregenerator, collapse_formats=True)
+        assert route_path('message', testing.DummyRequest(), id=1) == '/en/messages/1'
+        assert route_path('message', testing.DummyRequest(), id=1, format='json') == '/en/messages/1.json'
+        assert route_path('json_formatted_message', testing.DummyRequest(), id=1) == '/en/messages/1.json'
+    
+    def test_collapsed_sub_domain_routes_keep_pregenerator(self):
+        from pyramid.url import route_url
+        def lang_pregenerator(request, elements, kw):
+            kw.setdefault('lang', 'en')
+            return elements, kw
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', path_prefix='/:lang',
+                                 pregenerator=lang_pregenerator, collapse_formats=True, sub_domain='acme')
+        request = testing.DummyRequest()
+        assert route_path('message', request, id=1, format='json') == '/en/messages/1.json'
+        assert route_url('message', request, id=1, sub_domain='acme') == 'http://acme.example.com/en/messages/1'
+    
+    def test_show_route_is_get_only(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', member={'mark': 'POST', 'touch': 'PATCH'})
+        app = self.config.make_wsgi_app()
+        environ = dict(PATH_INFO='/messages/1', REQUEST_METHOD='GET')
+        assert app(environ, lambda status, headers: None)[0] == 'show'
+    
     def test_resources_with_double_default_views(self):
         class MessedUpHandler(object):
             @action(renderer='json')
@@ -116,7 +171,146 @@ class TestResourceGeneration_add_resource(unittest.TestCase):
         except ConfigurationError, e:
             assert str(e) == "Two methods have been decorated without specifying a format."
 
+class TestResourceGeneration_add_resources(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.begin()
+    
+    def tearDown(self):
+        self.config.end()
+        del self.config
+    
+    def test_add_resources(self):
+        self.config.add_resources([
+            dict(handler='pyramid_routehelper.tests:DummyCrudHandler',
+                 member_name='message', collection_name='messages'),
+            dict(handler=DummyCrudHandler, member_name='comment', collection_name='comments',
+                 parent_resource=dict(member_name='message', collection_name='messages'),
+                 member=dict(mark='POST')),
+            ])
+        
+        assert route_path('messages', testing.DummyRequest()) == '/messages'
+        assert route_path('json_formatted_message', testing.DummyRequest(), id=1) == '/messages/1.json'
+        assert route_path('message_comments', testing.DummyRequest(), message_id=1) == '/messages/1/comments'
+        assert route_path('message_mark_comment', testing.DummyRequest(), message_id=1, id=2) == '/messages/1/comments/2/mark'
+    
+    def test_add_resources_with_trie(self):
+        from pyramid_routehelper.urldispatch import ResourceRoutesMapper
+        self.config.add_resources([
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages', trie=True),
+            ])
+        
+        mapper = self.config.get_routes_mapper()
+        assert isinstance(mapper, ResourceRoutesMapper)
+        assert not mapper.unindexed
+    
+    def test_duplicate_route_name(self):
+        try:
+            self.config.add_resources([
+                dict(handler=DummyCrudHandler, member_name='message', collection_name='messages'),
+                dict(handler=DummyCrudHandler, member_name='message', collection_name='notes'),
+                ])
+        except ConfigurationError, e:
+            assert str(e) == "Route name 'new_message' is generated by both the 'messages' and 'notes' resources."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+        assert not self.config.get_routes_mapper().get_routes()
+    
+    def test_duplicate_route_pattern(self):
+        try:
+            self.config.add_resources([
+                dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                     path_prefix='/category/:category_id'),
+                dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                     path_prefix='/category/{id}', name_prefix='other_'),
+                ])
+        except ConfigurationError, e:
+            assert str(e).startswith("Route pattern '/category/{id}/messages")
+        else:
+            raise AssertionError('ConfigurationError not raised')
+    
+    def test_typed_markers_are_different_patterns(self):
+        from pyramid_routehelper.urldispatch import normalize_pattern
+        assert normalize_pattern('/messages/:id') == normalize_pattern('/messages/{name}')
+        assert normalize_pattern('/messages/{id}') == normalize_pattern('/messages/{key:[^/]+}')
+        assert normalize_pattern(r'/messages/{id:\d+}') != normalize_pattern('/messages/{id}')
+        self.config.add_resources([
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                 path_prefix=r'/category/{category_id:\d+}'),
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                 path_prefix='/category/{slug}', name_prefix='slug_'),
+            ])
+        assert route_path('slug_messages', testing.DummyRequest(), slug='news') == '/category/news/messages'
+
+class Test_resource_path(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.begin()
+    
+    def tearDown(self):
+        self.config.end()
+        del self.config
+    
+    def _callFUT(self, *arg, **kw):
+        from pyramid_routehelper.url import resource_path
+        return resource_path(*arg, **kw)
+    
+    def test_matches_route_path(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', path_prefix='/category/:category_id')
+        request = testing.DummyRequest()
+        
+        for name, kw in [('messages', {}), ('new_message', {}), ('json_formatted_messages', {}),
+                         ('message', {'id': 1}), ('json_formatted_edit_message', {'id': u'\xe9 /'})]:
+            kw['category_id'] = 'a b'
+            assert self._callFUT(name, request, **kw) == route_path(name, request, **kw)
+    
+    def test_format(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages')
+        
+        assert self._callFUT('message', testing.DummyRequest(), id=1, format='json') == '/messages/1.json'
+    
+    def test_collapsed_format(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', collapse_formats=True)
+        
+        assert self._callFUT('message', testing.DummyRequest(), id=1) == '/messages/1'
+        assert self._callFUT('message', testing.DummyRequest(), id=1, format='json') == '/messages/1.json'
+    
+    def test_query_and_anchor(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages')
+        
+        path = self._callFUT('messages', testing.DummyRequest(), _query={'page': 2}, _anchor='top')
+        assert path == '/messages?page=2#top'
+    
+    def test_pregenerator(self):
+        def category_pregenerator(request, elements, kw):
+            kw.setdefault('category_id', 7)
+            return elements, kw
+        for collapse_formats in (False, True):
+            config = Configurator(autocommit=True)
+            includeme(config)
+            config.add_resource(DummyCrudHandler, 'message', 'messages', path_prefix='/c/:category_id',
+                                pregenerator=category_pregenerator, collapse_formats=collapse_formats)
+            request = testing.DummyRequest(registry=config.registry)
+            assert self._callFUT('message', request, id=1) == '/c/7/messages/1'
+            assert self._callFUT('message', request, id=1, format='json') == '/c/7/messages/1.json'
+            assert self._callFUT('messages', request, category_id=8, _query={'page': 2}) == '/c/8/messages?page=2'
+    
+    def test_falls_back_to_route_path(self):
+        self.config.add_route('home', '/home/:section')
+        
+        assert self._callFUT('home', testing.DummyRequest(), section='x') == '/home/x'
+    
+    def test_resource_url(self):
+        from pyramid_routehelper.url import resource_url
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages')
+        
+        assert resource_url('message', testing.DummyRequest(), id=1) == 'http://example.com/messages/1'
+
 class TestResourceRecognition(unittest.TestCase):
+    resource_kwargs = {}
+    
     def _create_config(self, autocommit=True):
         config = Configurator(autocommit=autocommit)
         includeme(config)
@@ -124,7 +318,7 @@ class TestResourceRecognition(unittest.TestCase):
     
     def setUp(self):
         self.config = self._create_config()
-        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages')
+        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages', **self.resource_kwargs)
         self.config.begin()
         
         self.wsgi_app = self.config.make_wsgi_app()
@@ -190,6 +384,1666 @@ class TestResourceRecognition(unittest.TestCase):
         result = self._get('/messages/1/edit')
         assert result == 'edit'
 
+class TestTrieResourceRecognition(TestResourceRecognition):
+    resource_kwargs = {'trie': True}
+    
+    def test_mapper_replaced(self):
+        from pyramid.interfaces import IRoutesMapper
+        from pyramid_routehelper.urldispatch import ResourceRoutesMapper
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        assert isinstance(mapper, ResourceRoutesMapper)
+        assert not mapper.unindexed
+
+class TestCollapsedFormatResourceRecognition(TestResourceRecognition):
+    resource_kwargs = {'collapse_formats': True}
+    
+    def test_get_formatted_member(self):
+        result = self._get('/messages/1.json')
+        assert result == '"show"'
+    
+    def test_get_unknown_format(self):
+        result = self._get('/messages/1.csv')
+        assert result == 'show'
+    
+    def test_xml_format_keeps_predicates(self):
+        result = self._get('/messages.xml')
+        assert '404' in result
+
+class TestTrieCollapsedFormatResourceRecognition(TestCollapsedFormatResourceRecognition):
+    resource_kwargs = {'collapse_formats': True, 'trie': True}
+    
+    def test_collapsed_member_route_indexed(self):
+        from pyramid_routehelper.urldispatch import pattern_segments
+        mapper = self.config.get_routes_mapper()
+        assert not mapper.unindexed
+        route = mapper.get_route('message')
+        assert len(pattern_segments(route.pattern)) == 2
+
+class TestMethodDispatchResourceRecognition(TestResourceRecognition):
+    resource_kwargs = {'method_dispatch': True}
+    
+    def _call(self, path, request_method):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        environ = dict(PATH_INFO=path, REQUEST_METHOD=request_method)
+        response['body'] = ''.join(self.wsgi_app(environ, start_response))
+        return response
+    
+    def test_method_not_allowed(self):
+        response = self._call('/messages/1', 'PATCH')
+        assert response['status'].startswith('405')
+        assert response['headers']['Allow'] == 'DELETE, GET, HEAD, PUT'
+        response = self._call('/messages', 'DELETE')
+        assert response['headers']['Allow'] == 'GET, HEAD, POST'
+    
+    def test_head_answered_by_get_view(self):
+        response = self._call('/messages/1', 'HEAD')
+        assert response['status'].startswith('200')
+        assert response['body'] == 'show'
+    
+    def test_single_view_per_route(self):
+        from pyramid.interfaces import IRouteRequest, IView, IViewClassifier
+        from zope.interface import Interface
+        from pyramid_routehelper.view import MethodDispatcher
+        registry = self.config.registry
+        request_iface = registry.getUtility(IRouteRequest, name='message')
+        view = registry.adapters.lookup((IViewClassifier, request_iface, Interface), IView, name='')
+        view = getattr(view, '__original_view__', view)
+        assert isinstance(view, MethodDispatcher)
+        assert view.views == {'GET': '__method_GET__', 'HEAD': '__method_GET__',
+                              'PUT': '__method_PUT__', 'DELETE': '__method_DELETE__'}
+
+class TestMethodDispatchCollapsedResourceRecognition(TestMethodDispatchResourceRecognition):
+    resource_kwargs = {'method_dispatch': True, 'collapse_formats': True}
+    
+    def test_get_formatted_member(self):
+        result = self._get('/messages/1.json')
+        assert result == '"show"'
+
+class TestResourceStatsRecognition(TestResourceRecognition):
+    def _create_config(self, autocommit=True):
+        config = Configurator(autocommit=autocommit, settings={'routehelper.stats': 'true'})
+        includeme(config)
+        return config
+    
+    def _stats(self):
+        from pyramid_routehelper.interfaces import IResourceStats
+        return self.config.registry.getUtility(IResourceStats)
+    
+    def test_hits_recorded(self):
+        self._get('/messages')
+        self._get('/messages')
+        self._get('/messages.json')
+        self._put('/messages/1')
+        
+        snapshot = self._stats().snapshot()
+        assert snapshot['messages']['index']['hits'] == 2
+        assert snapshot['json_formatted_messages']['index']['hits'] == 1
+        assert snapshot['message']['update']['hits'] == 1
+        assert 'show' not in snapshot['message']
+        histogram = snapshot['messages']['index']['histogram']
+        assert histogram[-1] == [None, 2]
+
+class TestResourceStats(unittest.TestCase):
+    def _makeOne(self, buckets=(0.1, 1.0)):
+        from pyramid_routehelper.stats import ResourceStats
+        return ResourceStats(buckets)
+    
+    def test_snapshot(self):
+        stats = self._makeOne()
+        stats.record('message', 'show', 0.05)
+        stats.record('message', 'show', 0.1)
+        stats.record('message', 'show', 0.5)
+        stats.record('message', 'show', 2)
+        
+        show = stats.snapshot()['message']['show']
+        assert show['hits'] == 4
+        assert show['total'] == 2.65
+        assert show['histogram'] == [[0.1, 2], [1.0, 3], [None, 4]]
+    
+    def test_threads_merged(self):
+        import threading
+        stats = self._makeOne()
+        def record():
+            for i in range(100):
+                stats.record('messages', 'index', 0.01)
+        threads = [threading.Thread(target=record) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert len(stats.shards) == 4
+        assert stats.snapshot()['messages']['index']['hits'] == 400
+    
+    def test_reset_and_dump(self):
+        from StringIO import StringIO
+        stats = self._makeOne()
+        stats.record('messages', 'index', 0.01)
+        output = StringIO()
+        stats.dump(output)
+        assert output.getvalue() == '{"messages": {"index": {"histogram": [[0.1, 1], [1.0, 1], [null, 1]], "hits": 1, "total": 0.01}}}'
+        
+        stats.reset()
+        assert stats.snapshot() == {}
+    
+    def test_add_resource_stats_directive(self):
+        from pyramid_routehelper.interfaces import IResourceStats
+        config = Configurator(autocommit=True)
+        includeme(config)
+        assert config.registry.queryUtility(IResourceStats) is None
+        stats = config.add_resource_stats(buckets=(1,))
+        assert config.registry.getUtility(IResourceStats) is stats
+        assert config.add_resource_stats() is stats
+
+class TestConvertedResourceRecognition(TestResourceRecognition):
+    resource_kwargs = {'converters': {'id': 'int'}}
+    
+    def test_invalid_id_rejected(self):
+        result = self._get('/messages/abc')
+        assert '404' in result
+        result = self._get('/messages/abc/edit')
+        assert '404' in result
+    
+    def test_matchdict_converted(self):
+        from pyramid.interfaces import IRoutesMapper
+        mapper = self.config.registry.getUtility(IRoutesMapper)
+        request = testing.DummyRequest(environ={'PATH_INFO': '/messages/12.json', 'REQUEST_METHOD': 'GET'})
+        info = mapper(request)
+        assert info['route'].name == 'json_formatted_message'
+        assert info['match'] == {'id': 12}
+
+class TestLazyResourceRecognition(TestResourceRecognition):
+    @property
+    def resource_kwargs(self):
+        return {'lazy': True, 'actions': get_action_table(DummyCrudHandler)}
+    
+    def _lazy_handler(self):
+        from pyramid_routehelper.interfaces import ILazyHandlers
+        return self.config.registry.getUtility(ILazyHandlers).values()[0]
+    
+    def test_resolved_on_first_request(self):
+        lazy = self._lazy_handler()
+        assert lazy.handler is None
+        assert self._get('/messages/1') == 'show'
+        assert lazy.handler is DummyCrudHandler
+    
+    def test_warm_resources(self):
+        assert self.config.warm_resources() == [DummyCrudHandler]
+        assert self._lazy_handler().handler is DummyCrudHandler
+
+class TestLazyHandler(unittest.TestCase):
+    def test_resolved_once(self):
+        import threading
+        import time
+        from pyramid_routehelper.lazy import LazyHandler
+        class DummyResolver(object):
+            calls = 0
+            def maybe_resolve(self, name):
+                self.calls += 1
+                time.sleep(0.01)
+                return DummyCrudHandler
+        resolver = DummyResolver()
+        lazy = LazyHandler('pyramid_routehelper.tests:DummyCrudHandler', resolver)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(lazy.resolve())) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [DummyCrudHandler] * 5
+        assert resolver.calls == 1
+    
+    def test_actions_required(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        try:
+            config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages', lazy=True)
+        except ConfigurationError, e:
+            assert str(e) == "The actions of lazy resource 'messages' must be declared."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+    
+    def test_shared_per_handler(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        actions = get_action_table(DummyCrudHandler)
+        config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages',
+                            lazy=True, actions=actions)
+        config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'note', 'notes',
+                            lazy=True, actions=actions)
+        assert len(config.warm_resources()) == 1
+
+class TestResourceSnapshot(unittest.TestCase):
+    def setUp(self):
+        import os, sys, tempfile
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'resources.json')
+        self.module = os.path.join(self.directory, 'snapshot_handlers.py')
+        self._write_handler("@action(renderer='string')")
+        sys.path.insert(0, self.directory)
+    
+    def tearDown(self):
+        import shutil, sys
+        sys.path.remove(self.directory)
+        sys.modules.pop('snapshot_handlers', None)
+        shutil.rmtree(self.directory)
+    
+    def _write_handler(self, decorators):
+        import sys
+        sys.modules.pop('snapshot_handlers', None)
+        open(self.module, 'w').write(
+            "from pyramid_routehelper import action\n"
+            "class Handler(object):\n"
+            "    def __init__(self, request):\n"
+            "        self.request = request\n"
+            "    %s\n"
+            "    def show(self):\n"
+            "        return 'show'\n" % decorators)
+    
+    def _configure(self, **kw):
+        config = Configurator(autocommit=True, settings={'routehelper.snapshot': self.path})
+        includeme(config)
+        config.add_resource('snapshot_handlers:Handler', 'message', 'messages',
+                            member={'mark': 'POST'}, **kw)
+        return config
+    
+    def test_saved_and_reused(self):
+        import json
+        from pyramid_routehelper.interfaces import IResourceSnapshot
+        config = self._configure()
+        config.save_resource_snapshot()
+        data = json.load(open(self.path))
+        assert data['version'] == 1
+        assert data['resources'][0]['actions'] == {'show': {'default': {'renderer': 'string'}}}
+        assert ['mark', 'mark_message', '/messages/:id/mark'] in data['resources'][0]['routes']
+        
+        import snapshot_handlers
+        del snapshot_handlers.Handler.__action_table__
+        config = self._configure()
+        assert '__action_table__' not in snapshot_handlers.Handler.__dict__
+        assert not config.registry.getUtility(IResourceSnapshot).dirty
+        config.begin()
+        try:
+            assert route_path('mark_message', testing.DummyRequest(), id=1) == '/messages/1/mark'
+        finally:
+            config.end()
+        environ = dict(PATH_INFO='/messages/1', REQUEST_METHOD='GET')
+        assert config.make_wsgi_app()(environ, lambda status, headers: None)[0] == 'show'
+    
+    def test_lazy_handler_not_imported(self):
+        import sys
+        self._configure().save_resource_snapshot()
+        sys.modules.pop('snapshot_handlers')
+        config = self._configure(lazy=True)
+        assert 'snapshot_handlers' not in sys.modules
+        environ = dict(PATH_INFO='/messages/1', REQUEST_METHOD='GET')
+        assert config.make_wsgi_app()(environ, lambda status, headers: None)[0] == 'show'
+        assert 'snapshot_handlers' in sys.modules
+    
+    def test_invalidated_when_actions_change(self):
+        import json
+        from pyramid_routehelper.interfaces import IResourceSnapshot
+        self._configure().save_resource_snapshot()
+        self._write_handler("@action(renderer='json')")
+        config = self._configure()
+        assert config.registry.getUtility(IResourceSnapshot).dirty
+        config.save_resource_snapshot()
+        data = json.load(open(self.path))
+        assert data['resources'][0]['actions'] == {'show': {'default': {'renderer': 'json'}}}
+    
+    def test_other_version_ignored(self):
+        open(self.path, 'w').write('{"version": 0, "resources": [{"key": "x"}]}')
+        config = Configurator(autocommit=True)
+        includeme(config)
+        assert config.use_resource_snapshot(self.path).entries == {}
+
+class TestFreezeResources(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator()
+        includeme(self.config)
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages', trie=True, collapse_formats=True)
+        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'note', 'notes',
+                                 lazy=True, actions=get_action_table(DummyCrudHandler))
+    
+    def _get(self, path):
+        environ = dict(PATH_INFO=path, REQUEST_METHOD='GET')
+        return self.config.make_wsgi_app()(environ, lambda status, headers: None)[0]
+    
+    def test_freeze(self):
+        from pyramid.interfaces import IRouteRequest
+        from pyramid_routehelper.interfaces import ILazyHandlers
+        from pyramid_routehelper.view import FormatDispatcher
+        self.config.freeze_resources()
+        registry = self.config.registry
+        
+        lazy = registry.getUtility(ILazyHandlers).values()[0]
+        assert lazy.handler is DummyCrudHandler
+        assert [prepare() for prepare in lazy.views]
+        
+        dispatchers = [getattr(view, '__original_view__', None) for view in
+                       [registration.factory for registration in registry.registeredAdapters()]]
+        dispatchers = [view for view in dispatchers if isinstance(view, FormatDispatcher)]
+        assert dispatchers
+        for dispatcher in dispatchers:
+            assert dispatcher.request_iface is registry.getUtility(IRouteRequest, name=dispatcher.route_name)
+        
+        mapper = self.config.get_routes_mapper()
+        assert mapper.frozen
+        assert isinstance(mapper.index.root.static['messages'].routes, tuple)
+        assert self._get('/messages.json') == '{"format": "json"}'
+        assert self._get('/notes/1') == 'show'
+    
+    def test_routes_added_after_freeze(self):
+        self.config.freeze_resources()
+        try:
+            self.config.add_route('other', '/other')
+        except ConfigurationError, e:
+            assert str(e) == "Route 'other' added after the routes were frozen."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+
+class TestResponseCache(unittest.TestCase):
+    def _makeOne(self, size=2):
+        from pyramid_routehelper.cache import ResponseCache
+        return ResponseCache(size)
+    
+    def test_least_recently_used_evicted(self):
+        cache = self._makeOne()
+        cache.set('a', ((), None), 60, 'A')
+        cache.set('b', ((), None), 60, 'B')
+        assert cache.get('a') == 'A'
+        cache.set('c', ((), None), 60, 'C')
+        assert cache.get('b') is None
+        assert cache.get('a') == 'A'
+        assert cache.get('c') == 'C'
+        assert len(cache.entries) == 2
+    
+    def test_expired(self):
+        cache = self._makeOne()
+        cache.set('a', ((), None), -1, 'A')
+        assert cache.get('a') is None
+        assert cache.entries == {}
+        assert cache.scopes == {}
+    
+    def test_invalidate(self):
+        cache = self._makeOne(size=10)
+        cache.set('messages', ((('region_id', '1'),), None), 60, 'messages')
+        cache.set('message', ((('region_id', '1'),), '7'), 60, 'message')
+        cache.set('other', ((('region_id', '1'),), '8'), 60, 'other')
+        cache.set('region2', ((('region_id', '2'),), None), 60, 'region2')
+        cache.invalidate({'region_id': '1', 'id': '7', 'format': 'json'})
+        assert sorted(cache.entries) == ['other', 'region2']
+        cache.invalidate({'region_id': '1'})
+        assert sorted(cache.entries) == ['other', 'region2']
+        cache.clear()
+        assert cache.entries == {}
+
+class TestCachedResourceRecognition(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(CachedHandler, 'message', 'messages', collapse_formats=True)
+        self.wsgi_app = self.config.make_wsgi_app()
+        CachedHandler.calls = 0
+    
+    def _request(self, path, request_method='GET', query_string='', **headers):
+        environ = dict(PATH_INFO=path, REQUEST_METHOD=request_method, QUERY_STRING=query_string)
+        environ.update(headers)
+        def start_response(status, headers):
+            self.status = status
+            self.headers = headers
+        return self.wsgi_app(environ, start_response)[0]
+    
+    def test_cached(self):
+        assert self._request('/messages/1') == 'show 1'
+        assert self._request('/messages/1') == 'show 1'
+        assert self._request('/messages/1.json') == '"show 2"'
+        assert self._request('/messages/1.json') == '"show 2"'
+        assert self._request('/messages/2') == 'show 3'
+        assert self._request('/messages') == 'index 4'
+        assert self._request('/messages', query_string='page=2') == 'index 5'
+        assert self._request('/messages') == 'index 4'
+    
+    def test_cached_response_runs_user_decorator(self):
+        audited = []
+        def audit(view):
+            def audited_view(context, request):
+                audited.append(request.path_info)
+                return view(context, request)
+            return audited_view
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_resource(CachedHandler, 'message', 'messages',
+                            actions={'show': {'default': {'renderer': 'string', 'cache': 60,
+                                                          'decorator': audit}}})
+        self.wsgi_app = config.make_wsgi_app()
+        assert self._request('/messages/1') == 'show 1'
+        assert self._request('/messages/1') == 'show 1'
+        assert audited == ['/messages/1', '/messages/1']
+    
+    def test_users_do_not_share_responses(self):
+        assert self._request('/messages/1', query_string='login=1', HTTP_AUTHORIZATION='alice') == 'show 1'
+        assert ('Set-Cookie', 'sess=secret-of-alice') in self.headers
+        assert self._request('/messages/1', query_string='login=1', HTTP_AUTHORIZATION='bob') == 'show 2'
+        assert ('Set-Cookie', 'sess=secret-of-bob') in self.headers
+        assert self._request('/messages/1', HTTP_AUTHORIZATION='alice') == 'show 3'
+        assert self._request('/messages/1', HTTP_AUTHORIZATION='bob') == 'show 4'
+        assert self._request('/messages/1', HTTP_AUTHORIZATION='alice') == 'show 3'
+        assert self._request('/messages/1', HTTP_COOKIE='sess=secret-of-alice') == 'show 5'
+    
+    def test_cache_vary(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_resource(CachedHandler, 'message', 'messages',
+                            actions={'show': {'default': {'renderer': 'string', 'cache': 60,
+                                                          'cache_vary': 'Accept-Language'}}})
+        self.wsgi_app = config.make_wsgi_app()
+        assert self._request('/messages/1', HTTP_ACCEPT_LANGUAGE='en', HTTP_AUTHORIZATION='alice') == 'show 1'
+        assert self._request('/messages/1', HTTP_ACCEPT_LANGUAGE='en', HTTP_AUTHORIZATION='bob') == 'show 1'
+        assert self._request('/messages/1', HTTP_ACCEPT_LANGUAGE='fr') == 'show 2'
+    
+    def test_uncached_action(self):
+        assert self._request('/messages/1/edit') == 'edit 1'
+        assert self._request('/messages/1/edit') == 'edit 2'
+    
+    def test_write_invalidates_member_and_collection(self):
+        self._request('/messages')
+        self._request('/messages/1')
+        self._request('/messages/2')
+        assert self._request('/messages/1', 'PUT') == 'update 4'
+        assert self._request('/messages') == 'index 5'
+        assert self._request('/messages/1') == 'show 6'
+        assert self._request('/messages/2') == 'show 3'
+        assert self._request('/messages', 'POST') == 'create 7'
+        assert self._request('/messages') == 'index 8'
+        assert self._request('/messages/1') == 'show 6'
+    
+    def test_failed_write_keeps_cache(self):
+        self._request('/messages/1')
+        self._request('/messages/1', 'DELETE', 'fail=1')
+        assert self.status.startswith('409')
+        assert self._request('/messages/1') == 'show 1'
+        self._request('/messages/1', 'DELETE')
+        assert self._request('/messages/1') == 'show 3'
+
+class TestConditionalResourceRecognition(unittest.TestCase):
+    resource_kwargs = {'converters': {'id': 'int'}}
+    
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(ConditionalHandler, 'message', 'messages', **self.resource_kwargs)
+        self.wsgi_app = self.config.make_wsgi_app()
+        ConditionalHandler.calls = 0
+    
+    def _get(self, path, **headers):
+        from pyramid.request import Request
+        request = Request.blank(path, headers=headers)
+        return request.get_response(self.wsgi_app)
+    
+    def test_etag(self):
+        for path in ('/messages/1', '/messages/1.json'):
+            response = self._get(path)
+            assert response.status_int == 200
+            assert response.etag == 'message-1'
+            response = self._get(path, **{'If-None-Match': '"message-1"'})
+            assert response.status_int == 304
+            assert response.etag == 'message-1'
+            assert response.body == ''
+            response = self._get(path, **{'If-None-Match': '"message-2"'})
+            assert response.status_int == 200
+        assert ConditionalHandler.calls == 4
+    
+    def test_last_modified(self):
+        for path in ('/messages', '/messages.json'):
+            response = self._get(path)
+            assert response.status_int == 200
+            assert response.headers['Last-Modified'] == 'Sat, 01 Jan 2011 12:00:00 GMT'
+            response = self._get(path, **{'If-Modified-Since': 'Sat, 01 Jan 2011 12:00:00 GMT'})
+            assert response.status_int == 304
+            response = self._get(path, **{'If-Modified-Since': 'Sat, 01 Jan 2011 11:59:59 GMT'})
+            assert response.status_int == 200
+        assert ConditionalHandler.calls == 4
+    
+    def test_no_validator_value(self):
+        response = self._get('/messages/0', **{'If-None-Match': '*'})
+        assert response.status_int == 200
+        assert 'ETag' not in response.headers
+
+class TestCollapsedConditionalResourceRecognition(TestConditionalResourceRecognition):
+    resource_kwargs = {'converters': {'id': 'int'}, 'collapse_formats': True}
+
+class TestBatchResourceRecognition(unittest.TestCase):
+    resource_kwargs = {'converters': {'id': 'int'}}
+    
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(BatchHandler, 'message', 'messages', batch=2,
+                                 parent_resource=dict(member_name='region', collection_name='regions'),
+                                 **self.resource_kwargs)
+        self.wsgi_app = self.config.make_wsgi_app()
+    
+    def _batch(self, operations, path='/regions/7/messages/batch'):
+        from pyramid.request import Request
+        request = Request.blank(path, method='POST', headers={'X-Token': 'secret'})
+        if not isinstance(operations, str):
+            operations = json.dumps(operations)
+        request.body = operations
+        return request.get_response(self.wsgi_app)
+    
+    def test_route(self):
+        mapper = self.config.get_routes_mapper()
+        assert mapper.get_routes()[0].name == 'region_batch_messages'
+        assert mapper.generate('region_batch_messages', {'region_id': 7}) == '/regions/7/messages/batch'
+    
+    def test_operations(self):
+        response = self._batch([{'method': 'POST', 'params': {'title': u'caf\xe9'}},
+                                {'method': 'PUT', 'id': 3, 'params': {'title': 'b'}}])
+        assert response.status_int == 200
+        results = json.loads(response.body)
+        assert [result['status'] for result in results] == [200, 200]
+        assert results[0]['body'] == {'action': 'create', 'matchdict': {'region_id': '7'},
+                                      'params': {'title': u'caf\xe9'}, 'token': 'secret'}
+        update = results[1]['body']
+        assert update['action'] == 'update'
+        assert (update['matchdict']['region_id'], update['matchdict']['id']) == ('7', 3)
+        assert update['params'] == {'title': 'b'}
+    
+    def test_format_and_errors(self):
+        response = self._batch([{'method': 'DELETE', 'id': 3, 'format': 'txt'},
+                                {'method': 'DELETE', 'id': 404}])
+        results = json.loads(response.body)
+        assert results[0] == {'status': 200, 'body': 'deleted 3'}
+        assert results[1]['status'] == 404
+    
+    def test_raising_operation(self):
+        from pyramid.request import Request
+        from StringIO import StringIO
+        request = Request.blank('/regions/7/messages/batch', method='POST')
+        request.body = json.dumps([{'method': 'PUT', 'id': 3, 'params': {'fail': '1'}},
+                                   {'method': 'DELETE', 'id': 3}])
+        request.environ['wsgi.errors'] = errors = StringIO()
+        response = request.get_response(self.wsgi_app)
+        assert response.status_int == 200
+        assert json.loads(response.body) == [{'status': 500, 'body': 'Internal Server Error'},
+                                             {'status': 200, 'body': 'deleted 3'}]
+        assert 'RuntimeError: update failed' in errors.getvalue()
+    
+    def test_invalid_batch(self):
+        for operations in ('nope', {'method': 'POST'}, [{'method': 'GET'}], [{'method': 'PUT'}],
+                           [{'method': 'POST', 'id': 1}], [{'method': 'POST', 'params': []}],
+                           [{'method': 'POST'}] * 3):
+            if not isinstance(operations, str):
+                operations = json.dumps(operations)
+            assert self._batch(operations).status_int == 400
+    
+    def test_batch_is_not_a_member(self):
+        from pyramid.request import Request
+        response = Request.blank('/regions/7/messages/batch').get_response(self.wsgi_app)
+        assert response.status_int == 404
+
+class TestTrieBatchResourceRecognition(TestBatchResourceRecognition):
+    resource_kwargs = {'converters': {'id': 'int'}, 'trie': True, 'collapse_formats': True,
+                       'method_dispatch': True}
+
+class TestStreamResourceRecognition(unittest.TestCase):
+    resource_kwargs = {}
+    
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(StreamHandler, 'message', 'messages', **self.resource_kwargs)
+        self.wsgi_app = self.config.make_wsgi_app()
+        StreamHandler.produced = 0
+    
+    def _call(self, path, query_string=''):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        environ = dict(PATH_INFO=path, REQUEST_METHOD='GET', QUERY_STRING=query_string)
+        return response, self.wsgi_app(environ, start_response)
+    
+    def test_ndjson(self):
+        response, app_iter = self._call('/messages.ndjson', 'count=3')
+        assert response['headers']['Content-Type'] == 'application/x-ndjson; charset=utf-8'
+        assert 'Content-Length' not in response['headers']
+        assert ''.join(app_iter) == '{"id": 0, "title": "message 0"}\n' \
+                                    '{"id": 1, "title": "message 1"}\n' \
+                                    '{"id": 2, "title": "message 2"}\n'
+    
+    def test_csv(self):
+        response, app_iter = self._call('/messages.csv', 'count=2')
+        assert response['headers']['Content-Type'] == 'text/csv; charset=utf-8'
+        assert ''.join(app_iter) == 'id,title\r\n0,message 0\r\n1,message 1\r\n'
+    
+    def test_default_format_rendered(self):
+        response, app_iter = self._call('/messages')
+        assert ''.join(app_iter) == 'index'
+    
+    def test_memory_flat(self):
+        # Items are produced as the response is consumed, a chunk at a time
+        total = 1000000
+        response, app_iter = self._call('/messages.ndjson', 'count=%d' % total)
+        assert StreamHandler.produced == 0
+        chunks = iter(app_iter)
+        first = chunks.next()
+        assert len(first) >= 8192
+        produced = StreamHandler.produced
+        assert produced < 500
+        for i in range(100):
+            chunk = chunks.next()
+            assert len(chunk) < 2 * 8192
+        assert StreamHandler.produced - produced < 101 * 500
+    
+    def test_invalid_settings(self):
+        class Handler(object):
+            @action(format='xml', stream=True)
+            def index(self):
+                return []
+        self.assertRaises(ConfigurationError, self.config.add_resource, Handler, 'item', 'items')
+        class Handler(object):
+            @action(format='csv', stream=True, renderer='string')
+            def index(self):
+                return []
+        self.assertRaises(ConfigurationError, self.config.add_resource, Handler, 'item', 'items')
+
+class TestCollapsedStreamResourceRecognition(TestStreamResourceRecognition):
+    resource_kwargs = {'collapse_formats': True, 'trie': True}
+
+class TestPaginatedResourceRecognition(unittest.TestCase):
+    resource_kwargs = {}
+    
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(PagedHandler, 'message', 'messages', paginate=dict(limit=10, max_limit=20),
+                                 **self.resource_kwargs)
+        self.wsgi_app = self.config.make_wsgi_app()
+    
+    def _get(self, url):
+        from pyramid.request import Request
+        return Request.blank(url).get_response(self.wsgi_app)
+    
+    def _page(self, url):
+        response = self._get(url)
+        assert response.status_int == 200, response.status
+        return json.loads(response.body), response
+    
+    def test_pages(self):
+        for path in ('/messages.json', '/messages'):
+            page, response = self._page('http://localhost%s?q=x' % path)
+            assert page['ids'] == range(10)
+            assert page['prev'] is None
+            assert page['next'].startswith('http://localhost%s?q=x&cursor=' % path)
+            assert response.headers['Link'] == '<%s>; rel="next"' % page['next']
+            
+            page, response = self._page(page['next'])
+            assert page['ids'] == range(10, 20)
+            page, response = self._page(page['next'])
+            assert page['ids'] == range(20, 25)
+            assert page['next'] is None
+            
+            page, response = self._page(page['prev'])
+            assert page['ids'] == range(10, 20)
+            page, response = self._page(page['prev'])
+            assert page['ids'] == range(10)
+            assert page['prev'] is None
+            assert page['next']
+            
+            page, response = self._page(page['next'] + '&limit=20')
+            assert page['ids'] == range(10, 25)
+            assert '&limit=20&' in page['prev']
+    
+    def test_invalid_parameters(self):
+        import base64
+        from pyramid_routehelper.pagination import encode_cursor
+        for query in ('cursor=nope', 'cursor=' + encode_cursor('next', (1, 2)), 'limit=0',
+                      'limit=21', 'limit=x', 'cursor=' + base64.urlsafe_b64encode('["n",[[1]]]'),
+                      'cursor=' + base64.urlsafe_b64encode('["n",[{"dt":[2011,13,1]}]]'),
+                      'cursor=' + base64.urlsafe_b64encode('["n",[{"x":[2011,1,1]}]]')):
+            assert self._get('/messages.json?' + query).status_int == 400
+    
+    def test_cursor_round_trip(self):
+        from pyramid_routehelper.pagination import encode_cursor, decode_cursor
+        assert decode_cursor(encode_cursor('prev', (u'a', 3)), 2) == ('prev', (u'a', 3))
+        self.assertRaises(ValueError, decode_cursor, encode_cursor('prev', (3,)), 2)
+        self.assertRaises(TypeError, encode_cursor, 'next', ([1],))
+    
+    def test_datetime_keys(self):
+        import datetime
+        from webob.datetime_utils import UTC
+        from pyramid_routehelper.pagination import Pagination, encode_cursor, decode_cursor
+        created = datetime.datetime(2011, 2, 3, 4, 5, 6, 789)
+        bound = (created, created.replace(tzinfo=UTC), created.date(), 7)
+        assert decode_cursor(encode_cursor('next', bound), 4) == ('next', bound)
+        
+        pagination = Pagination(keys=('created', 'id'), limit=2)
+        items = [{'created': created + datetime.timedelta(days=i), 'id': i} for i in range(5)]
+        page = pagination.page(testing.DummyRequest())
+        assert page.paginate(items[:3]) == items[:2]
+        page = pagination.page(testing.DummyRequest(params={'cursor': page.next}))
+        assert page.after == (items[1]['created'], 1)
+        assert page.paginate(items[2:5]) == items[2:4]
+        page = pagination.page(testing.DummyRequest(params={'cursor': page.prev}))
+        assert page.before == (items[2]['created'], 2)
+
+class TestCollapsedPaginatedResourceRecognition(TestPaginatedResourceRecognition):
+    resource_kwargs = {'collapse_formats': True}
+
+class TestStatelessResourceRecognition(TestResourceRecognition):
+    resource_kwargs = {'stateless': True}
+    
+    def setUp(self):
+        StatelessCrudHandler.built = 0
+        self.config = self._create_config()
+        self.config.add_resource(StatelessCrudHandler, 'message', 'messages', **self.resource_kwargs)
+        self.config.begin()
+        self.wsgi_app = self.config.make_wsgi_app()
+    
+    def test_built_once_per_thread(self):
+        import threading
+        self._get('/messages')
+        self._get('/messages/1')
+        self._put('/messages/1')
+        assert StatelessCrudHandler.built == 1
+        threads = [threading.Thread(target=self._get, args=('/messages',)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert StatelessCrudHandler.built == 4
+    
+    def test_request_passed(self):
+        assert self._get('/messages/7/edit') == 'edit 7'
+    
+    def test_slots(self):
+        assert not hasattr(StatelessCrudHandler(), '__dict__')
+    
+    def test_not_marked_stateless(self):
+        self.assertRaises(ConfigurationError, self.config.add_resource, DummyCrudHandler,
+                          'item', 'items', stateless=True)
+
+class TestProcessStatelessResourceRecognition(TestStatelessResourceRecognition):
+    resource_kwargs = {'stateless': 'process', 'method_dispatch': True}
+    
+    def test_built_once_per_thread(self):
+        import threading
+        threads = [threading.Thread(target=self._get, args=('/messages',)) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._get('/messages/1')
+        assert StatelessCrudHandler.built == 1
+
+class TestLazyStatelessResourceRecognition(TestStatelessResourceRecognition):
+    def setUp(self):
+        StatelessCrudHandler.built = 0
+        self.config = self._create_config()
+        self.config.add_resource('pyramid_routehelper.tests:StatelessCrudHandler', 'message', 'messages',
+                                 lazy=True, stateless=True, actions=get_action_table(StatelessCrudHandler))
+        self.config.begin()
+        self.wsgi_app = self.config.make_wsgi_app()
+    
+    def test_not_marked_stateless(self):
+        self.config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'item', 'items',
+                                 lazy=True, stateless=True, actions=get_action_table(DummyCrudHandler))
+        self.wsgi_app = self.config.make_wsgi_app()
+        self.assertRaises(ConfigurationError, self._get, '/items')
+
+class TestRouteProfile(unittest.TestCase):
+    paths = ['/messages', '/messages.json', '/messages/new', '/messages/new.json', '/messages/1',
+             '/messages/1.json', '/messages/1/edit', '/messages/1/edit.json', '/messages/sorted',
+             '/messages/1/mark', '/regions/1/messages/2']
+    
+    def _routes(self, profile=None, **kw):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        if profile is not None:
+            config.use_route_profile(profile)
+        config.add_resources([
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                 collection={'sorted': 'GET'}, member={'mark': 'POST'}, **kw),
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                 parent_resource=dict(member_name='region', collection_name='regions'), **kw)])
+        return config.get_routes_mapper()
+    
+    def _matches(self, mapper):
+        matches = []
+        for path in self.paths:
+            info = mapper(testing.DummyRequest(environ={'PATH_INFO': path, 'REQUEST_METHOD': 'GET'}))
+            matches.append(info['route'] and info['route'].name)
+        return matches
+    
+    def test_order_routes(self):
+        from pyramid_routehelper.profile import order_routes
+        routes = [('messages', '/messages'), ('new_message', '/messages/new'),
+                  ('message', '/messages/:id'), ('edit_message', '/messages/:id/edit')]
+        hits = {'message': 100, 'edit_message': 50, 'messages': 1}
+        # new_message stays ahead of message, which it shadows
+        assert [route[0] for route in order_routes(routes, hits)] == [
+            'new_message', 'message', 'edit_message', 'messages']
+        assert order_routes(routes, {}) == routes
+    
+    def test_unsplit_patterns_keep_their_place(self):
+        from pyramid_routehelper.profile import order_routes
+        routes = [('a', '/a'), ('catchall', '/*path'), ('b', '/b')]
+        assert order_routes(routes, {'b': 10}) == routes
+        routes = [('file', '/files/{path:[ -~]+}'), ('file_info', '/files/:id/info')]
+        assert order_routes(routes, {'file_info': 10}) == routes
+    
+    def test_hottest_first_and_same_matches(self):
+        for kw in ({}, {'trie': True}, {'collapse_formats': True}):
+            default = self._routes(**kw)
+            profiled = self._routes({'region_message': 1000, 'message': 500,
+                                     'edit_message': 300, 'mark_message': 10}, **kw)
+            names = [route.name for route in profiled.get_routes()]
+            assert names[0] == 'region_new_message'
+            assert names.index('region_message') <= 2
+            assert names.index('edit_message') < names.index('messages')
+            assert names.index('new_message') < names.index('message')
+            assert sorted(names) == sorted([route.name for route in default.get_routes()])
+            assert self._matches(profiled) == self._matches(default)
+    
+    def test_load_profile(self):
+        import os
+        import tempfile
+        from pyramid_routehelper.profile import load_route_profile
+        from pyramid_routehelper.stats import ResourceStats
+        stats = ResourceStats((1,))
+        stats.record('message', 'show', 0.1)
+        stats.record('message', 'update', 0.1)
+        stats.record('messages', 'index', 0.1)
+        assert load_route_profile(stats) == {'message': 2, 'messages': 1}
+        fd, path = tempfile.mkstemp()
+        try:
+            f = os.fdopen(fd, 'w')
+            stats.dump(f)
+            f.close()
+            assert load_route_profile(path) == {'message': 2, 'messages': 1}
+        finally:
+            os.remove(path)
+        assert load_route_profile({u'message': 3}) == {'message': 3}
+
+class TestProfiledResourceRecognition(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+    
+    def _app(self, **settings):
+        settings['routehelper.cprofile_dir'] = self.directory
+        settings.setdefault('routehelper.cprofile_samples', '1')
+        config = Configurator(autocommit=True, settings=settings)
+        includeme(config)
+        config.add_resource(ProfiledHandler, 'message', 'messages')
+        return config.make_wsgi_app()
+    
+    def _call(self, app, path):
+        environ = dict(PATH_INFO=path, REQUEST_METHOD='GET')
+        return ''.join(app(environ, lambda status, headers: None))
+    
+    def _stats(self, route_name):
+        import os
+        import pstats
+        path = os.path.join(self.directory, '%s.%d.pstats' % (route_name, os.getpid()))
+        if not os.path.exists(path):
+            return None
+        return pstats.Stats(path)
+    
+    def test_profiled_action(self):
+        app = self._app()
+        assert self._call(app, '/messages') == 'index'
+        assert self._call(app, '/messages') == 'index'
+        stats = self._stats('messages')
+        calls = [(func[2], counts[1]) for func, counts in stats.stats.items()
+                 if func[2] == 'index']
+        assert calls == [('index', 2)]
+        assert self._call(app, '/messages/1') == 'show'
+        assert self._stats('message') is None
+    
+    def test_route_setting(self):
+        app = self._app(**{'routehelper.cprofile.messages': 'off',
+                           'routehelper.cprofile.message': 'on'})
+        self._call(app, '/messages')
+        self._call(app, '/messages/1')
+        assert self._stats('messages') is None
+        assert self._stats('message') is not None
+    
+    def test_statistics_are_written_in_batches(self):
+        import os
+        from pyramid_routehelper.sampling import RouteProfiler
+        profiler = RouteProfiler('messages', self.directory, dump_samples=3, dump_interval=3600)
+        view = lambda context, request: 'index'
+        for i in range(2):
+            profiler(view, None, None)
+        assert not os.path.exists(profiler.path)
+        profiler(view, None, None)
+        assert os.path.exists(profiler.path)
+        profiler(view, None, None)
+        assert (profiler.samples, profiler.dumped_samples) == (4, 3)
+        profiler.flush()
+        assert profiler.dumped_samples == 4
+        os.remove(profiler.path)
+        profiler.flush()
+        assert not os.path.exists(profiler.path)
+        
+        profiler = RouteProfiler('message', self.directory, dump_samples=100, dump_interval=0)
+        profiler(view, None, None)
+        assert os.path.exists(profiler.path)
+    
+    def test_unprofiled_view_is_not_decorated(self):
+        from pyramid_routehelper.sampling import RouteProfiler
+        calls = []
+        original = RouteProfiler.__call__
+        def __call__(self, view, context, request):
+            calls.append(self.route_name)
+            return original(self, view, context, request)
+        RouteProfiler.__call__ = __call__
+        try:
+            app = self._app(**{'routehelper.cprofile.messages': '0'})
+            self._call(app, '/messages')
+            self._call(app, '/messages/1')
+        finally:
+            RouteProfiler.__call__ = original
+        assert calls == []
+    
+    def test_profile_rate(self):
+        from pyramid_routehelper.sampling import profile_rate
+        assert profile_rate(True) == 1.0
+        assert profile_rate('yes') == 1.0
+        assert profile_rate(False) == 0.0
+        assert profile_rate('0.25') == 0.25
+        try:
+            profile_rate(2)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('ValueError not raised')
+
+class TestLimitedResourceRecognition(unittest.TestCase):
+    def setUp(self):
+        import threading
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.add_resource(LimitedHandler, 'message', 'messages',
+                                 member={'mark': 'POST'}, max_concurrency=2)
+        self.wsgi_app = self.config.make_wsgi_app()
+        LimitedHandler.started = threading.Semaphore(0)
+        LimitedHandler.proceed = threading.Event()
+    
+    def tearDown(self):
+        LimitedHandler.proceed.set()
+    
+    def _call(self, path, method='GET'):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        environ = dict(PATH_INFO=path, REQUEST_METHOD=method)
+        response['body'] = ''.join(self.wsgi_app(environ, start_response))
+        return response
+    
+    def _mark_in_thread(self, responses):
+        import threading
+        thread = threading.Thread(target=lambda: responses.append(self._call('/messages/1/mark', 'POST')))
+        thread.start()
+        return thread
+    
+    def _limits(self):
+        from pyramid_routehelper.interfaces import IConcurrencyLimits
+        return self.config.registry.getUtility(IConcurrencyLimits).snapshot()
+    
+    def test_shed_over_limit(self):
+        responses = []
+        thread = self._mark_in_thread(responses)
+        LimitedHandler.started.acquire()
+        response = self._call('/messages/1/mark', 'POST')
+        assert response['status'].startswith('503')
+        assert response['headers']['Retry-After'] == '1'
+        limits = self._limits()['messages']
+        assert limits['mark'] == {'limit': 1, 'in_flight': 1, 'waiting': 0, 'rejected': 1}
+        assert limits['show'] == {'limit': 2, 'in_flight': 0, 'waiting': 0, 'rejected': 0}
+        # other actions keep their own limit
+        assert self._call('/messages/1')['body'] == 'show'
+        LimitedHandler.proceed.set()
+        thread.join()
+        assert responses[0]['body'] == 'mark'
+        assert self._call('/messages/1/mark', 'POST')['body'] == 'mark'
+        assert self._limits()['messages']['mark']['in_flight'] == 0
+    
+    def test_streamed_response_holds_its_place(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_resource(StreamHandler, 'message', 'messages',
+                            actions={'index': {'formatted': [{'format': 'ndjson', 'attr': 'api_index',
+                                                              'stream': True, 'max_concurrency': 1}]}})
+        app = config.make_wsgi_app()
+        statuses = []
+        environ = dict(PATH_INFO='/messages.ndjson', REQUEST_METHOD='GET', QUERY_STRING='count=2')
+        start_response = lambda status, headers: statuses.append(status)
+        app_iter = app(dict(environ), start_response)
+        app(dict(environ), start_response)
+        assert statuses[-1].startswith('503')
+        assert ''.join(app_iter).count('\n') == 2
+        app_iter.close()
+        ''.join(app(dict(environ), start_response))
+        assert statuses[-1].startswith('200')
+    
+    def test_queue_timeout(self):
+        import threading
+        from pyramid_routehelper.limits import ConcurrencyLimit
+        limit = ConcurrencyLimit(1, timeout=5)
+        assert limit.acquire()
+        timer = threading.Timer(0.05, limit.release)
+        timer.start()
+        assert limit.acquire()
+        timer.join()
+        limit.timeout = 0.01
+        assert not limit.acquire()
+        assert limit.snapshot() == {'limit': 1, 'in_flight': 1, 'waiting': 0, 'rejected': 1}
+
+class TestCoalescedResourceRecognition(unittest.TestCase):
+    def setUp(self):
+        import threading
+        import pyramid_routehelper
+        coalescers = []
+        original = pyramid_routehelper.Coalescer
+        pyramid_routehelper.Coalescer = lambda: coalescers.append(original()) or coalescers[-1]
+        try:
+            self.config = Configurator(autocommit=True)
+            includeme(self.config)
+            self.config.add_resource(CoalescedHandler, 'message', 'messages')
+        finally:
+            pyramid_routehelper.Coalescer = original
+        self.coalescer = coalescers[0]
+        self.wsgi_app = self.config.make_wsgi_app()
+        CoalescedHandler.calls = 0
+        CoalescedHandler.proceed = threading.Event()
+        CoalescedHandler.proceed.set()
+    
+    def tearDown(self):
+        CoalescedHandler.proceed.set()
+    
+    def _call(self, path, method='GET', **headers):
+        environ = dict(PATH_INFO=path, REQUEST_METHOD=method)
+        for name, value in headers.items():
+            environ['HTTP_' + name.upper()] = value
+        return ''.join(self.wsgi_app(environ, lambda status, headers: None))
+    
+    def _wait(self, condition):
+        import time
+        for i in range(500):
+            if condition():
+                return
+            time.sleep(0.01)
+        raise AssertionError('timed out')
+    
+    def test_concurrent_requests_share_one_call(self):
+        import threading
+        CoalescedHandler.proceed.clear()
+        bodies = []
+        threads = [threading.Thread(target=lambda: bodies.append(self._call('/messages/1')))
+                   for i in range(5)]
+        threads[0].start()
+        self._wait(lambda: CoalescedHandler.calls == 1)
+        for thread in threads[1:]:
+            thread.start()
+        self._wait(lambda: self.coalescer.shared == 4)
+        CoalescedHandler.proceed.set()
+        for thread in threads:
+            thread.join()
+        assert bodies == ['show 1'] * 5
+        assert CoalescedHandler.calls == 1
+        assert self.coalescer.flights == {}
+    
+    def test_vary_headers(self):
+        import threading
+        CoalescedHandler.proceed.clear()
+        bodies = []
+        threads = [threading.Thread(target=lambda cookie=cookie: bodies.append(self._call('/messages/1', cookie=cookie)))
+                   for cookie in ('a', 'b')]
+        for thread in threads:
+            thread.start()
+        self._wait(lambda: CoalescedHandler.calls == 2)
+        CoalescedHandler.proceed.set()
+        for thread in threads:
+            thread.join()
+        assert self.coalescer.shared == 0
+    
+    def test_sequential_and_other_methods_are_not_shared(self):
+        assert self._call('/messages/1') == 'show 1'
+        assert self._call('/messages/1') == 'show 2'
+        assert self._call('/messages/1', 'PUT') == 'update'
+        assert self.coalescer.shared == 0
+    
+    def test_exception_raised_for_every_request(self):
+        import threading
+        from pyramid_routehelper.coalesce import Coalescer
+        coalescer = Coalescer()
+        proceed = threading.Event()
+        errors = []
+        def fail():
+            proceed.wait()
+            raise ValueError('failed')
+        def call():
+            try:
+                coalescer('key', fail)
+            except ValueError, e:
+                errors.append(str(e))
+        threads = [threading.Thread(target=call) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        self._wait(lambda: coalescer.shared == 2)
+        proceed.set()
+        for thread in threads:
+            thread.join()
+        assert errors == ['failed'] * 3
+    
+    def test_stream_cannot_be_coalesced(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        try:
+            config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages',
+                                actions={'index': {'formatted': [{'format': 'ndjson', 'attr': 'index',
+                                                                  'stream': True, 'coalesce': True}]}})
+        except ConfigurationError, e:
+            assert str(e) == "The streamed action 'index' can have no renderer, cache, coalesce or background."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+
+class TestBackgroundResourceRecognition(unittest.TestCase):
+    resource_kwargs = {}
+    
+    def setUp(self):
+        import threading
+        self.config = Configurator(autocommit=True, settings={'routehelper.jobs.workers': '1',
+                                                             'routehelper.jobs.queue_size': '1'})
+        includeme(self.config)
+        self.config.add_resource(BackgroundHandler, 'message', 'messages',
+                                 collection={'export': 'POST'}, member={'reindex': 'POST'},
+                                 **self.resource_kwargs)
+        self.config.add_resource(BackgroundHandler, 'message', 'messages',
+                                 parent_resource=dict(member_name='region', collection_name='regions'),
+                                 collection={'export': 'POST'}, **self.resource_kwargs)
+        self.wsgi_app = self.config.make_wsgi_app()
+        BackgroundHandler.proceed = threading.Event()
+        BackgroundHandler.proceed.set()
+    
+    def tearDown(self):
+        BackgroundHandler.proceed.set()
+    
+    def _call(self, path, method='GET', body=None, **extra):
+        response = {}
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        from StringIO import StringIO
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': method, 'SERVER_NAME': 'localhost',
+                   'SERVER_PORT': '80', 'HTTP_HOST': 'localhost', 'wsgi.url_scheme': 'http',
+                   'wsgi.input': StringIO(body or '')}
+        environ.update(extra)
+        if body is not None:
+            environ.update(CONTENT_TYPE='application/x-www-form-urlencoded',
+                           CONTENT_LENGTH=str(len(body)))
+        response['body'] = ''.join(self.wsgi_app(environ, start_response))
+        return response
+    
+    def _wait(self, path):
+        import time
+        for i in range(500):
+            job = json.loads(self._call(path)['body'])
+            if job['status'] in ('done', 'failed'):
+                return job
+            time.sleep(0.01)
+        raise AssertionError('timed out')
+    
+    def _jobs(self):
+        from pyramid_routehelper.interfaces import IJobQueue
+        return self.config.registry.getUtility(IJobQueue)
+    
+    def test_collection_action(self):
+        BackgroundHandler.proceed.clear()
+        response = self._call('/messages/export', 'POST', 'since=2011')
+        assert response['status'].startswith('202')
+        job = json.loads(response['body'])
+        assert job['status'] in ('pending', 'running')
+        location = response['headers']['Location']
+        assert location == 'http://localhost/messages/jobs/%s' % job['id']
+        path = location[len('http://localhost'):]
+        assert json.loads(self._call(path)['body'])['status'] in ('pending', 'running')
+        BackgroundHandler.proceed.set()
+        assert self._wait(path) == {'id': job['id'], 'status': 'done',
+                                    'result': {'status': 200, 'body': {'since': '2011'}}}
+    
+    def test_member_action_and_parent(self):
+        response = self._call('/messages/7/reindex', 'POST')
+        path = response['headers']['Location'][len('http://localhost'):]
+        assert path.startswith('/messages/jobs/')
+        assert self._wait(path)['result'] == {'status': 200, 'body': 'reindex 7'}
+        response = self._call('/regions/3/messages/export', 'POST', 'since=1')
+        path = response['headers']['Location'][len('http://localhost'):]
+        assert path.startswith('/regions/3/messages/jobs/')
+        assert self._wait(path)['result']['body'] == {'since': '1'}
+    
+    def test_failed_job(self):
+        response = self._call('/messages/export', 'POST')
+        path = response['headers']['Location'][len('http://localhost'):]
+        job = self._wait(path)
+        assert job['status'] == 'failed'
+        assert 'result' not in job
+        assert self._jobs().get(job['id']).exc_info[0] is KeyError
+    
+    def test_full_queue(self):
+        BackgroundHandler.proceed.clear()
+        jobs = self._jobs()
+        running = json.loads(self._call('/messages/7/reindex', 'POST')['body'])
+        import time
+        for i in range(500):
+            if jobs.get(running['id']).status == 'running':
+                break
+            time.sleep(0.01)
+        assert self._call('/messages/8/reindex', 'POST')['status'].startswith('202')
+        response = self._call('/messages/9/reindex', 'POST')
+        assert response['status'].startswith('503')
+        assert response['headers']['Retry-After'] == '1'
+    
+    def test_unknown_job(self):
+        assert self._call('/messages/jobs/nope')['status'].startswith('404')
+        assert self._call('/messages/7')['body'] == 'show 7'
+    
+    def test_job_requires_the_action_permission(self):
+        from pyramid.authentication import RemoteUserAuthenticationPolicy
+        from pyramid.authorization import ACLAuthorizationPolicy
+        from pyramid.security import Allow
+        class Root(object):
+            __acl__ = [(Allow, 'admin', 'edit')]
+            def __init__(self, request):
+                pass
+        config = Configurator(autocommit=True, root_factory=Root,
+                              authentication_policy=RemoteUserAuthenticationPolicy(),
+                              authorization_policy=ACLAuthorizationPolicy())
+        includeme(config)
+        config.add_resource(BackgroundHandler, 'message', 'messages', collection={'export': 'POST'},
+                            actions={'export': {'default': {'renderer': 'json', 'background': True,
+                                                            'permission': 'edit'}}},
+                            **self.resource_kwargs)
+        self.wsgi_app = config.make_wsgi_app()
+        assert self._call('/messages/export', 'POST', 'since=1')['status'].startswith('403')
+        response = self._call('/messages/export', 'POST', 'since=1', REMOTE_USER='admin')
+        assert response['status'].startswith('202')
+        path = response['headers']['Location'][len('http://localhost'):]
+        assert self._call(path)['status'].startswith('403')
+        assert self._call(path, REMOTE_USER='bob')['status'].startswith('403')
+        import time
+        for i in range(500):
+            job = json.loads(self._call(path, REMOTE_USER='admin')['body'])
+            if job['status'] == 'done':
+                break
+            time.sleep(0.01)
+        assert job['result'] == {'status': 200, 'body': {'since': '1'}}
+    
+    def test_forgets_old_jobs(self):
+        from pyramid.response import Response
+        from pyramid_routehelper.jobs import JobQueue
+        jobs = JobQueue(workers=1, keep=2)
+        submitted = [jobs.submit(lambda: Response('done')) for i in range(3)]
+        import time
+        for i in range(500):
+            if len(jobs.finished) == 2 and submitted[-1].status == 'done':
+                break
+            time.sleep(0.01)
+        assert jobs.get(submitted[0].id) is None
+        assert jobs.get(submitted[2].id).result == {'status': 200, 'body': 'done'}
+    
+    def test_bad_results_fail_without_stopping_the_worker(self):
+        from pyramid.response import Response
+        from pyramid_routehelper.jobs import JobQueue
+        jobs = JobQueue(workers=1)
+        invalid = jobs.submit(lambda: Response('{', content_type='application/json'))
+        not_response = jobs.submit(lambda: 'done')
+        valid = jobs.submit(lambda: Response('[1]', content_type='application/json'))
+        import time
+        for i in range(500):
+            if valid.status == 'done':
+                break
+            time.sleep(0.01)
+        assert invalid.status == 'failed'
+        assert invalid.exc_info[0] is ValueError
+        assert not_response.status == 'failed'
+        assert not_response.exc_info[0] is AttributeError
+        assert valid.result == {'status': 200, 'body': [1]}
+        assert [thread.isAlive() for thread in jobs.threads] == [True]
+
+class TestTrieBackgroundResourceRecognition(TestBackgroundResourceRecognition):
+    resource_kwargs = {'trie': True, 'collapse_formats': True}
+
+class TestConverters(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.begin()
+    
+    def tearDown(self):
+        self.config.end()
+        del self.config
+    
+    def _match(self, path):
+        request = testing.DummyRequest(environ={'PATH_INFO': path, 'REQUEST_METHOD': 'GET'})
+        return self.config.get_routes_mapper()(request)
+    
+    def test_parent_resource_converter(self):
+        import uuid
+        self.config.add_resource(DummyCrudHandler, 'location', 'locations',
+                                 parent_resource=dict(member_name='region', collection_name='regions'),
+                                 converters=dict(id='int', region_id='uuid'))
+        region = uuid.UUID('12345678-1234-5678-1234-567812345678')
+        
+        info = self._match('/regions/%s/locations/7' % region)
+        assert info['route'].name == 'region_location'
+        assert info['match'] == {'region_id': region, 'id': 7}
+        info = self._match('/regions/%s/locations' % region)
+        assert info['match'] == {'region_id': region}
+        assert self._match('/regions/1234-abcd/locations')['route'] is None
+        assert route_path('region_location', testing.DummyRequest(), region_id=region, id=7) == '/regions/%s/locations/7' % region
+    
+    def test_custom_converter(self):
+        self.config.add_resource(DummyCrudHandler, 'message', 'messages',
+                                 converters=dict(id=(r'[a-z]+', unicode.upper)), collapse_formats=True, trie=True)
+        
+        info = self._match('/messages/abc.json')
+        assert info['match'] == {'id': 'ABC', 'format': '.json'}
+        assert self._match('/messages/123')['route'] is None
+    
+    def test_unknown_converter(self):
+        try:
+            self.config.add_resource(DummyCrudHandler, 'message', 'messages', converters=dict(id='float'))
+        except ConfigurationError, e:
+            assert str(e) == "Unknown converter 'float' for 'id'."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+
+class TestSubDomains(unittest.TestCase):
+    settings = None
+    domain = 'example.com'
+    
+    def setUp(self):
+        self.config = Configurator(autocommit=True, settings=self.settings)
+        includeme(self.config)
+        self.config.add_resources([
+            dict(handler=DummyCrudHandler, member_name='message', collection_name='messages',
+                 name_prefix='%s_' % tenant, sub_domain=tenant)
+            for tenant in ('acme', 'globex')])
+        self.config.begin()
+        self.wsgi_app = self.config.make_wsgi_app()
+    
+    def tearDown(self):
+        self.config.end()
+        del self.config
+    
+    def _get(self, host, path):
+        environ = dict(HTTP_HOST=host, PATH_INFO=path, REQUEST_METHOD='GET')
+        return self.wsgi_app(environ, lambda status, headers: None)[0]
+    
+    def test_routed_by_host(self):
+        assert self._get('acme.example.com', '/messages') == 'index'
+        assert self._get('GLOBEX.example.com:8080', '/messages/1') == 'show'
+        assert '404' in self._get('initech.example.com', '/messages')
+        assert '404' in self._get('example.com', '/messages')
+    
+    def test_tenant_routes_only(self):
+        mapper = self.config.get_routes_mapper()
+        names = [route.name for route in mapper.candidates('/messages/1', 'acme')]
+        assert names == ['acme_message', 'json_formatted_acme_message']
+        assert mapper.candidates('/messages/1') == []
+        
+        request = testing.DummyRequest(environ={'HTTP_HOST': 'acme.' + self.domain, 'PATH_INFO': '/messages/1',
+                                                'REQUEST_METHOD': 'GET'})
+        info = mapper(request)
+        assert info['route'].name == 'acme_message'
+        assert info['match'] == {'id': '1', 'sub_domain': 'acme'}
+    
+    def test_url_generation(self):
+        from pyramid.url import route_url
+        from pyramid_routehelper.url import resource_path, resource_url
+        request = testing.DummyRequest()
+        assert route_url('acme_message', request, id=1, sub_domain='acme') == 'http://acme.example.com/messages/1'
+        assert route_url('json_formatted_acme_message', request, id=1, sub_domain='acme') == \
+            'http://acme.example.com/messages/1.json'
+        assert route_path('acme_message', request, id=1, sub_domain='acme') == '/messages/1'
+        assert resource_url('acme_message', request, id=1, sub_domain='acme') == 'http://acme.example.com/messages/1'
+        assert resource_path('acme_message', request, id=1, sub_domain='acme') == '/messages/1'
+        from pyramid.request import Request
+        request = Request.blank('/', environ={'HTTP_HOST': 'globex.example.com:8080'})
+        assert resource_url('acme_messages', request, sub_domain='acme') == 'http://acme.example.com:8080/messages'
+
+class TestSubDomainsWithDomain(TestSubDomains):
+    settings = {'routehelper.domain': 'example.co.uk'}
+    domain = 'example.co.uk'
+    
+    def test_routed_by_host(self):
+        assert self._get('acme.example.co.uk', '/messages') == 'index'
+        assert '404' in self._get('acme.example.com', '/messages')
+    
+    def test_url_generation(self):
+        from pyramid_routehelper.url import resource_url
+        from pyramid.request import Request
+        request = Request.blank('/', environ={'HTTP_HOST': 'example.co.uk'})
+        assert resource_url('acme_message', request, id=1, sub_domain='acme') == 'http://acme.example.co.uk/messages/1'
+
+class TestResourceGroup(unittest.TestCase):
+    def setUp(self):
+        self.config = Configurator(autocommit=True)
+        includeme(self.config)
+        self.config.begin()
+    
+    def tearDown(self):
+        self.config.end()
+        del self.config
+    
+    def _get(self, path):
+        environ = dict(PATH_INFO=path, REQUEST_METHOD='GET')
+        return self.config.make_wsgi_app()(environ, lambda status, headers: None)[0]
+    
+    def test_group(self):
+        with self.config.resource_group('/regions/:region_id/', name_prefix='region_') as regions:
+            regions.add_resource(DummyCrudHandler, 'location', 'locations')
+            with regions.resource_group('areas/:area_id', name_prefix='area_') as areas:
+                areas.add_resource(DummyCrudHandler, 'site', 'sites')
+            regions.add_resource(DummyCrudHandler, 'office', 'offices', path_prefix='/hq')
+        
+        request = testing.DummyRequest()
+        assert route_path('region_locations', request, region_id=13) == '/regions/13/locations'
+        assert route_path('region_area_site', request, region_id=13, area_id=5, id=1) == '/regions/13/areas/5/sites/1'
+        assert route_path('region_offices', request, region_id=13) == '/regions/13/hq/offices'
+        assert self._get('/regions/13/locations') == 'index'
+        assert self._get('/regions/13/areas/5/sites/1/edit') == 'edit'
+        assert self._get('/regions/13/hq/offices/1') == 'show'
+    
+    def test_unmatched_prefix_skips_group(self):
+        with self.config.resource_group('/regions/:region_id', name_prefix='region_', trie=True) as regions:
+            regions.add_resource(DummyCrudHandler, 'location', 'locations')
+        
+        mapper = self.config.get_routes_mapper()
+        assert mapper.index.root.static == {}
+        assert [group.prefix for group in mapper.groups] == ['/regions/:region_id']
+        assert mapper.candidates('/locations/1') == []
+        names = [route.name for route in mapper.candidates('/regions/13/locations/1')]
+        assert names == ['region_location', 'json_formatted_region_location']
+    
+    def test_not_registered_on_error(self):
+        try:
+            with self.config.resource_group('/regions/:region_id', name_prefix='region_') as regions:
+                regions.add_resource(DummyCrudHandler, 'location', 'locations')
+                raise ValueError
+        except ValueError:
+            pass
+        assert self.config.get_routes_mapper().get_routes() == []
+    
+    def test_duplicate_route_name(self):
+        try:
+            with self.config.resource_group('/regions/:region_id', name_prefix='region_') as regions:
+                regions.add_resource(DummyCrudHandler, 'location', 'locations')
+                regions.add_resource(DummyCrudHandler, 'location', 'locations', path_prefix='other')
+        except ConfigurationError, e:
+            assert str(e) == "Route name 'region_locations' is generated by both the 'region_locations' and 'region_locations' resources."
+        else:
+            raise AssertionError('ConfigurationError not raised')
+
+class TestResourceRoutesMapper(unittest.TestCase):
+    def _makeOne(self):
+        from pyramid_routehelper.urldispatch import ResourceRoutesMapper
+        return ResourceRoutesMapper()
+    
+    def _connect(self, mapper, name, pattern, index=True):
+        route = mapper.connect(name, pattern)
+        if index:
+            mapper.index_route(route)
+        return route
+    
+    def test_candidates_follow_static_and_dynamic_segments(self):
+        mapper = self._makeOne()
+        self._connect(mapper, 'messages', '/messages')
+        self._connect(mapper, 'new_message', '/messages/new')
+        self._connect(mapper, 'message', '/messages/:id')
+        self._connect(mapper, 'edit_message', '/messages/:id/edit')
+        
+        names = [route.name for route in mapper.candidates('/messages/new')]
+        assert names == ['new_message', 'message']
+        names = [route.name for route in mapper.candidates('/messages/1/edit')]
+        assert names == ['edit_message']
+        assert mapper.candidates('/comments') == []
+    
+    def test_unindexed_routes_keep_registration_order(self):
+        mapper = self._makeOne()
+        self._connect(mapper, 'message', '/messages/:id')
+        self._connect(mapper, 'catchall', '/*subpath')
+        self._connect(mapper, 'comment', '/comments/:id')
+        
+        assert [route.name for order, route in mapper.unindexed] == ['catchall']
+        names = [route.name for route in mapper.candidates('/messages/1')]
+        assert names == ['message', 'catchall']
+        names = [route.name for route in mapper.candidates('/comments/1')]
+        assert names == ['catchall', 'comment']
+    
+    def test_markers_which_may_match_a_slash_are_not_indexed(self):
+        from pyramid_routehelper.urldispatch import pattern_segments
+        for regex in (r'[ -~]+', r'.+', r'\D+', r'[^a]+', r'a|b/c', r'[-/]+'):
+            assert pattern_segments('/files/{path:%s}' % regex) is None, regex
+        for regex in (r'\d+', r'[^/]+', r'[a-z-]+', r'[^/.]+', r'(\.(json|xml))?'):
+            assert pattern_segments('/files/{path:%s}' % regex) is not None, regex
+        mapper = self._makeOne()
+        self._connect(mapper, 'file', '/files/{path:[ -~]+}')
+        self._connect(mapper, 'file_info', '/files/:id/info')
+        names = [route.name for route in mapper.candidates('/files/a/b/info')]
+        assert names == ['file']
+        names = [route.name for route in mapper.candidates('/files/a/info')]
+        assert names == ['file', 'file_info']
+    
+    def test_reconnect_replaces_indexed_route(self):
+        mapper = self._makeOne()
+        self._connect(mapper, 'message', '/messages/:id')
+        self._connect(mapper, 'message', '/notes/:id')
+        
+        assert mapper.candidates('/messages/1') == []
+        assert [route.name for route in mapper.candidates('/notes/1')] == ['message']
+        assert len(mapper.get_routes()) == 1
+    
+    def test_earlier_route_still_wins(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_route('special', '/messages/special', view=lambda request: 'special', view_renderer='string')
+        config.add_resource('pyramid_routehelper.tests:DummyCrudHandler', 'message', 'messages', trie=True)
+        app = config.make_wsgi_app()
+        
+        environ = dict(PATH_INFO='/messages/special', REQUEST_METHOD='GET')
+        assert app(environ, lambda status, headers: None)[0] == 'special'
+        environ = dict(PATH_INFO='/messages/1', REQUEST_METHOD='GET')
+        assert app(environ, lambda status, headers: None)[0] == 'show'
+
+class Test_get_action_table(unittest.TestCase):
+    def test_table(self):
+        table = get_action_table(DummyCrudHandler)
+        
+        assert table['show']['default'] == {'renderer': 'string'}
+        assert table['show']['formatted'] == [{'renderer': 'json', 'format': 'json', 'attr': 'show'}]
+        assert [kw['format'] for kw in table['index']['formatted']] == ['json', 'xml']
+        assert 'api_index' not in table
+    
+    def test_table_is_cached_per_class(self):
+        table = get_action_table(DummyCrudHandler)
+        assert get_action_table(DummyCrudHandler) is table
+        
+        class SubHandler(DummyCrudHandler):
+            @action(renderer='json')
+            def sorted(self):
+                return []
+            
+            def show(self):
+                return 'undecorated'
+        
+        subtable = get_action_table(SubHandler)
+        assert subtable is not get_action_table(DummyCrudHandler)
+        assert subtable['sorted']['default'] == {'renderer': 'json'}
+        assert 'show' not in subtable
+        assert get_action_table(DummyCrudHandler)['sorted']['default'] == {'renderer': 'string'}
+    
+    def test_classmethod_actions(self):
+        class Handler(object):
+            def __init__(self, request):
+                self.request = request
+            
+            @classmethod
+            @action(renderer='string')
+            def index(cls):
+                return cls.__name__
+            
+            @staticmethod
+            @action(renderer='json', format='json', alt_for='index')
+            def api_index():
+                return {}
+        
+        # as with inspect.getmembers(handler, inspect.ismethod), static
+        # methods are not actions
+        table = get_action_table(Handler)
+        assert table == {'index': {'default': {'renderer': 'string'}}}
+        
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_resource(Handler, 'message', 'messages')
+        app = config.make_wsgi_app()
+        environ = dict(PATH_INFO='/messages', REQUEST_METHOD='GET')
+        assert app(environ, lambda status, headers: None)[0] == 'Handler'
+    
+    def test_table_rebuilt_after_decoration(self):
+        class Handler(object):
+            def index(self):
+                return {}
+        
+        assert get_action_table(Handler) == {}
+        action(renderer='json')(Handler.__dict__['index'])
+        assert get_action_table(Handler) == {'index': {'default': {'renderer': 'json'}}}
+    
+    def test_table_not_modified_by_add_resource(self):
+        config = Configurator(autocommit=True)
+        includeme(config)
+        config.add_resource(DummyCrudHandler, 'message', 'messages')
+        config.add_resource(DummyCrudHandler, 'message', 'messages', name_prefix='other_', path_prefix='/other')
+        config.begin()
+        try:
+            assert route_path('json_formatted_other_message', testing.DummyRequest(), id=1) == '/other/messages/1.json'
+        finally:
+            config.end()
+        assert get_action_table(DummyCrudHandler)['show']['formatted'] == [{'renderer': 'json', 'format': 'json', 'attr': 'show'}]
+
 class Test_includeme(unittest.TestCase):
     def test_includme(self):
         config = Configurator(autocommit=True)
@@ -238,4 +2092,235 @@ class DummyCrudHandler(object):
     
     @action(renderer='string')
     def sorted(self):
-        return "sorted"
\ No newline at end of file
+        return "sorted"
+
+class CachedHandler(object):
+    calls = 0
+    
+    def __init__(self, request):
+        self.request = request
+    
+    def _count(self, name):
+        CachedHandler.calls += 1
+        return '%s %d' % (name, CachedHandler.calls)
+    
+    @action(renderer='string', cache=60)
+    def index(self):
+        return self._count('index')
+    
+    @action(renderer='string')
+    def create(self):
+        return self._count('create')
+    
+    @action(renderer='json', format='json', cache=60)
+    @action(renderer='string', cache=60)
+    def show(self):
+        if 'login' in self.request.params:
+            self.request.response_headerlist = [
+                ('Set-Cookie', 'sess=secret-of-%s' % self.request.headers['Authorization'])]
+        return self._count('show')
+    
+    @action(renderer='string')
+    def edit(self):
+        return self._count('edit')
+    
+    @action(renderer='string')
+    def update(self):
+        return self._count('update')
+    
+    @action(renderer='string')
+    def delete(self):
+        from pyramid.httpexceptions import HTTPConflict
+        if 'fail' in self.request.params:
+            return HTTPConflict()
+        return self._count('delete')
+
+def message_etag(request):
+    if request.matchdict['id']:
+        return 'message-%d' % request.matchdict['id']
+
+def messages_modified(request):
+    import datetime
+    return datetime.datetime(2011, 1, 1, 12, 0, 0, 250)
+
+class ConditionalHandler(object):
+    calls = 0
+    
+    def __init__(self, request):
+        self.request = request
+        ConditionalHandler.calls += 1
+    
+    @action(renderer='json', format='json', validator=messages_modified)
+    @action(renderer='string', validator='pyramid_routehelper.tests.messages_modified')
+    def index(self):
+        return 'index'
+    
+    @action(renderer='json', format='json', validator=message_etag)
+    @action(renderer='string', validator=message_etag)
+    def show(self):
+        return 'show'
+
+class BatchHandler(object):
+    def __init__(self, request):
+        self.request = request
+    
+    def _echo(self, action):
+        return {'action': action, 'matchdict': self.request.matchdict,
+                'params': dict(self.request.params), 'token': self.request.headers.get('X-Token')}
+    
+    @action(renderer='json')
+    def create(self):
+        return self._echo('create')
+    
+    @action(renderer='json')
+    def show(self):
+        return self._echo('show')
+    
+    @action(renderer='json')
+    def update(self):
+        if self.request.params.get('fail'):
+            raise RuntimeError('update failed')
+        return self._echo('update')
+    
+    @action(renderer='string', format='txt')
+    @action(renderer='string')
+    def delete(self):
+        from pyramid.exceptions import NotFound
+        if self.request.matchdict['id'] == 404:
+            raise NotFound()
+        return 'deleted %s' % self.request.matchdict['id']
+
+class StreamHandler(object):
+    produced = 0
+    
+    def __init__(self, request):
+        self.request = request
+    
+    @action(alt_for='index', format='csv', stream=True)
+    @action(alt_for='index', format='ndjson', stream=True)
+    def api_index(self):
+        for i in xrange(int(self.request.params['count'])):
+            StreamHandler.produced += 1
+            yield {'id': i, 'title': 'message %d' % i}
+    
+    @action(renderer='string')
+    def index(self):
+        return 'index'
+
+class PagedHandler(object):
+    items = [{'id': i} for i in range(25)]
+    
+    def __init__(self, request):
+        self.request = request
+    
+    @action(renderer='json', format='json')
+    @action(renderer='json')
+    def index(self):
+        page = self.request.page
+        if page.direction == 'next':
+            items = [item for item in self.items if page.after is None or (item['id'],) > page.after]
+        else:
+            items = [item for item in reversed(self.items) if (item['id'],) < page.before]
+        items = page.paginate(items[:page.limit + 1])
+        return {'ids': [item['id'] for item in items], 'next': page.next_url, 'prev': page.prev_url}
+
+class StatelessCrudHandler(StatelessHandler):
+    __slots__ = ('prefix',)
+    built = 0
+    
+    def __init__(self):
+        StatelessCrudHandler.built += 1
+        self.prefix = ''
+    
+    @action(renderer='string')
+    def index(self, request):
+        return self.prefix + "index"
+    
+    @action(alt_for='index', renderer='json', format='json')
+    def api_index(self, request):
+        return {'format': 'json'}
+    
+    @action(renderer='string')
+    def create(self, request):
+        return "create"
+    
+    @action(renderer='string')
+    def show(self, request):
+        return "show"
+    
+    @action(renderer='string')
+    def update(self, request):
+        return "update"
+    
+    @action(renderer='string')
+    def delete(self, request):
+        return "delete"
+    
+    @action(renderer='string')
+    def new(self, request):
+        return "new"
+    
+    @action(renderer='string')
+    def edit(self, request):
+        if request.matchdict['id'] == '1':
+            return "edit"
+        return "edit %s" % request.matchdict['id']
+
+class ProfiledHandler(object):
+    def __init__(self, request):
+        self.request = request
+    
+    @action(renderer='string', profile=True)
+    def index(self):
+        return 'index'
+    
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+
+class LimitedHandler(object):
+    def __init__(self, request):
+        self.request = request
+    
+    @action(renderer='string', max_concurrency=1)
+    def mark(self):
+        LimitedHandler.started.release()
+        LimitedHandler.proceed.wait()
+        return 'mark'
+    
+    @action(renderer='string')
+    def show(self):
+        return 'show'
+
+class CoalescedHandler(object):
+    def __init__(self, request):
+        self.request = request
+    
+    @action(renderer='string', coalesce=('Cookie',))
+    def show(self):
+        CoalescedHandler.calls += 1
+        calls = CoalescedHandler.calls
+        CoalescedHandler.proceed.wait()
+        return 'show %d' % calls
+    
+    @action(renderer='string', coalesce=True)
+    def update(self):
+        return 'update'
+
+class BackgroundHandler(object):
+    def __init__(self, request):
+        self.request = request
+    
+    @action(renderer='json', background=True)
+    def export(self):
+        BackgroundHandler.proceed.wait()
+        return {'since': self.request.params['since']}
+    
+    @action(renderer='string', background=True)
+    def reindex(self):
+        BackgroundHandler.proceed.wait()
+        return 'reindex %s' % self.request.matchdict['id']
+    
+    @action(renderer='string')
+    def show(self):
+        return 'show %s' % self.request.matchdict['id']
@@ -0,0 +1,101 @@
+from pyramid.encode import url_quote
+from pyramid.encode import urlencode
+from pyramid.threadlocal import get_current_registry
+from pyramid.url import route_url
+from pyramid.urldispatch import route_re
+
+from pyramid_routehelper.interfaces import IResourceURLs
+from pyramid_routehelper.urldispatch import new_style_pattern
+from pyramid_routehelper.urldispatch import sub_domain_url
+
+class URLGenerator(object):
+    """ Generate the path of one route from a precompiled template.
+
+    Values are quoted exactly as :func:`pyramid.url.route_path` would quote
+    them, without the route lookup, pregenerator and keyword copying that
+    come with it."""
+    __slots__ = ('template', 'names')
+
+    def __init__(self, pattern):
+        pattern = new_style_pattern(pattern)
+        if not pattern.startswith('/'):
+            pattern = '/' + pattern
+        parts = route_re.split(pattern)
+        template = []
+        names = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                names.append(part[1:-1].split(':', 1)[0])
+                template.append('%s')
+            else:
+                template.append(part.replace('%', '%%'))
+        self.template = ''.join(template)
+        self.names = tuple(names)
+
+    def __call__(self, kw):
+        return self.template % tuple([quote(kw[name]) for name in self.names])
+
+def quote(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    elif not isinstance(value, str):
+        return str(value)
+    return url_quote(value)
+
+def add_url_generators(config, paths):
+    """ Precompile a :class:`URLGenerator` for each ``{route_name: pattern}``
+    in ``paths``."""
+    generators = config.registry.queryUtility(IResourceURLs)
+    if generators is None:
+        generators = {}
+        config.registry.registerUtility(generators, IResourceURLs)
+    for name, pattern in paths.items():
+        generators[name] = URLGenerator(pattern)
+
+def resource_path(route_name, request, format=None, **kw):
+    """ Generate the path of a route added by
+    :func:`~pyramid_routehelper.add_resource`, e.g.
+    ``resource_path('message', request, id=1, format='json')``.
+
+    This is the equivalent of :func:`pyramid.url.route_path` using the
+    generator precompiled when the route was added.  ``format`` selects the
+    ``<format>_formatted_<route_name>`` route, and ``_query`` and
+    ``_anchor`` are supported as they are by ``route_path``.  Routes which
+    were not added by ``add_resource``, or were added with a
+    ``pregenerator``, fall back to ``route_path``.  A
+    ``sub_domain`` argument is ignored, as paths do not include the host."""
+    kw.pop('sub_domain', None)
+    try:
+        registry = request.registry
+    except AttributeError:
+        registry = get_current_registry()
+    if format is not None:
+        route_name = '%s_formatted_%s' % (format, route_name)
+    generator = registry.queryUtility(IResourceURLs, default={}).get(route_name)
+    if generator is None:
+        kw['_app_url'] = ''
+        return route_url(route_name, request, **kw)
+    qs = anchor = ''
+    if kw:
+        if '_query' in kw:
+            qs = '?' + urlencode(kw.pop('_query'), doseq=True)
+        if '_anchor' in kw:
+            anchor = kw.pop('_anchor')
+            if isinstance(anchor, unicode):
+                anchor = anchor.encode('utf-8')
+            anchor = '#' + anchor
+    return generator(kw) + qs + anchor
+
+def resource_url(route_name, request, format=None, **kw):
+    """ Like :func:`resource_path`, but returns an absolute URL as
+    :func:`pyramid.url.route_url` does.  ``sub_domain`` generates the URL on
+    that sub domain of the request's host, for routes added with the
+    ``sub_domain`` option."""
+    sub_domain = kw.pop('sub_domain', None)
+    if '_app_url' in kw:
+        app_url = kw.pop('_app_url')
+    elif sub_domain is not None:
+        app_url = sub_domain_url(request, sub_domain)
+    else:
+        app_url = request.application_url
+    return app_url + resource_path(route_name, request, format, **kw)
@@ -0,0 +1,551 @@
+import re
+import sre_constants
+import sre_parse
+import uuid
+from bisect import insort
+
+from pyramid.compat import all
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IRoutesMapper
+from pyramid.threadlocal import get_current_registry
+from pyramid.urldispatch import Route
+from pyramid.urldispatch import RoutesMapper
+from pyramid.urldispatch import old_route_re
+from pyramid.urldispatch import route_re
+from pyramid.urldispatch import update_pattern
+
+SLASH = ord('/')
+
+# character class categories which include the slash
+SLASH_CATEGORIES = (sre_constants.CATEGORY_NOT_DIGIT, sre_constants.CATEGORY_NOT_SPACE,
+                    sre_constants.CATEGORY_NOT_WORD, sre_constants.CATEGORY_UNI_NOT_DIGIT,
+                    sre_constants.CATEGORY_UNI_NOT_SPACE, sre_constants.CATEGORY_UNI_NOT_WORD,
+                    sre_constants.CATEGORY_LOC_NOT_WORD)
+
+def class_matches_slash(items):
+    """Return whether the parsed character class ``items`` matches a
+    slash."""
+    negate = False
+    matches = False
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            matches = matches or av == SLASH
+        elif op == sre_constants.RANGE:
+            matches = matches or av[0] <= SLASH <= av[1]
+        elif op == sre_constants.CATEGORY:
+            matches = matches or av in SLASH_CATEGORIES
+    return matches != negate
+
+def parsed_may_match_slash(items):
+    for op, av in items:
+        if op == sre_constants.ANY:
+            return True
+        if op == sre_constants.LITERAL and av == SLASH:
+            return True
+        if op == sre_constants.NOT_LITERAL and av != SLASH:
+            return True
+        if op == sre_constants.IN and class_matches_slash(av):
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            if parsed_may_match_slash(av[2]):
+                return True
+        elif op == sre_constants.SUBPATTERN:
+            if parsed_may_match_slash(av[-1]):
+                return True
+        elif op == sre_constants.BRANCH:
+            for branch in av[1]:
+                if parsed_may_match_slash(branch):
+                    return True
+        elif op == sre_constants.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None and parsed_may_match_slash(branch):
+                    return True
+    return False
+
+def regex_may_match_slash(regex):
+    """Return whether the marker regex ``regex`` may match a slash, and so
+    change the number of segments a pattern spans.  Regexes which cannot be
+    parsed are assumed to."""
+    try:
+        return parsed_may_match_slash(sre_parse.parse(regex))
+    except sre_constants.error:
+        return True
+
+# slashes separating segments, as opposed to those in a marker regex
+segment_sep_re = re.compile(r'/(?![^{]*\})')
+
+def pattern_segments(pattern):
+    """Split a route pattern into ``(literal, segment)`` pairs.
+
+    ``literal`` is ``True`` for a segment which only matches itself and
+    ``False`` for one which contains a marker.  ``None`` is returned for
+    patterns which cannot be indexed by segment, such as those with a
+    remainder (``*``) marker or a marker regex that may match a slash."""
+    pattern = new_style_pattern(pattern)
+    if not pattern.startswith('/'):
+        pattern = '/' + pattern
+    if '*' in pattern:
+        return None
+    segments = []
+    for segment in segment_sep_re.split(pattern)[1:]:
+        markers = route_re.findall(segment)
+        for marker in markers:
+            if ':' in marker and regex_may_match_slash(marker.split(':', 1)[1]):
+                return None
+        segments.append((not markers, segment))
+    return segments
+
+class TrieNode(object):
+    __slots__ = ('static', 'dynamic', 'routes')
+
+    def __init__(self):
+        self.static = {}
+        self.dynamic = None
+        self.routes = []
+
+class RouteIndex(object):
+    """``(order, route)`` entries indexed by the segments of their pattern,
+    plus those which cannot be indexed."""
+    def __init__(self):
+        self.root = TrieNode()
+        self.unindexed = []
+
+    def _node(self, segments, create=False):
+        node = self.root
+        for literal, segment in segments:
+            if literal:
+                child = node.static.get(segment)
+                if child is None and create:
+                    child = node.static[segment] = TrieNode()
+            else:
+                child = node.dynamic
+                if child is None and create:
+                    child = node.dynamic = TrieNode()
+            if child is None:
+                return None
+            node = child
+        return node
+
+    def add(self, entry, segments):
+        if segments is None:
+            insort(self.unindexed, entry)
+        else:
+            self._node(segments, create=True).routes.append(entry)
+
+    def remove(self, entry, segments):
+        if self.unindexed and self.unindexed[-1] == entry:
+            self.unindexed.pop()
+        elif entry in self.unindexed:
+            self.unindexed.remove(entry)
+        else:
+            node = segments is not None and self._node(segments)
+            if node and entry in node.routes:
+                node.routes.remove(entry)
+
+    def freeze(self):
+        """Replace the lists of the index by tuples; it may not be changed
+        afterwards."""
+        self.unindexed = tuple(self.unindexed)
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            node.routes = tuple(node.routes)
+            nodes.extend(node.static.values())
+            if node.dynamic is not None:
+                nodes.append(node.dynamic)
+
+    def lookup(self, path):
+        """Return the entries which may match ``path``, unordered."""
+        found = []
+        if path.startswith('/'):
+            nodes = [self.root]
+            for segment in path.split('/')[1:]:
+                following = []
+                for node in nodes:
+                    child = node.static.get(segment)
+                    if child is not None:
+                        following.append(child)
+                    if node.dynamic is not None:
+                        following.append(node.dynamic)
+                nodes = following
+                if not nodes:
+                    break
+            for node in nodes:
+                found.extend(node.routes)
+        found.extend(self.unindexed)
+        return found
+
+def prefix_regex(prefix):
+    """Compile a regex matching the paths which start with the segments of
+    the pattern ``prefix``."""
+    parts = route_re.split(new_style_pattern(prefix))
+    regex = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            marker = part[1:-1].split(':', 1)
+            if len(marker) == 2:
+                regex.append('(?:%s)' % marker[1])
+            else:
+                regex.append('[^/]+')
+        else:
+            regex.append(re.escape(part))
+    return re.compile('%s(?=/|$)' % ''.join(regex))
+
+class RouteGroup(object):
+    """The routes under a common path ``prefix``, which are only searched
+    for paths matching the prefix, and the groups nested under it."""
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.match = prefix_regex(prefix).match
+        self.index = RouteIndex()
+        self.groups = []
+
+class ResourceRoutesMapper(RoutesMapper):
+    """A :term:`routes mapper` which indexes the routes generated by
+    :func:`~pyramid_routehelper.add_resource` in a segment trie.
+
+    A request path is walked down the trie one segment at a time to find the
+    routes which could possibly match it, so the cost of matching depends on
+    the depth of the path rather than the number of routes.  Routes which
+    were not indexed are still tried, and candidates are always tried in
+    registration order so the first matching route wins just as it does with
+    the default mapper.
+
+    Routes restricted to sub domains are kept in a separate index per sub
+    domain, which is only searched for requests to that sub domain.  The sub
+    domain of a request is the part of its host before ``domain`` or, if
+    ``domain`` is ``None``, the first label of a host with three or more.
+
+    Routes may also be indexed in a :class:`RouteGroup`, whose prefix is
+    matched once per request; none of its routes are tried for a path which
+    does not start with the prefix."""
+    def __init__(self, domain=None):
+        RoutesMapper.__init__(self)
+        self.index = RouteIndex()
+        self.hosts = {}
+        self.route_hosts = {}
+        self.route_indexes = {}
+        self.groups = []
+        self.order = {}
+        self.counter = 0
+        self.domain = domain
+        self.frozen = False
+
+    @property
+    def root(self):
+        return self.index.root
+
+    @property
+    def unindexed(self):
+        return self.index.unindexed
+
+    def adopt(self, mapper):
+        """Take over the routes already connected to ``mapper``."""
+        for route in mapper.get_routes():
+            self._append(route)
+        for name, route in mapper.routes.items():
+            self.routes.setdefault(name, route)
+
+    def _append(self, route):
+        self.counter += 1
+        self.order[route] = self.counter
+        self.routelist.append(route)
+        self.routes[route.name] = route
+        self.index.unindexed.append((self.counter, route))
+
+    def connect(self, name, pattern, factory=None, predicates=(),
+                pregenerator=None):
+        if self.frozen:
+            raise ConfigurationError('Route %r added after the routes were frozen.' % name)
+        if name in self.routes:
+            oldroute = self.routes[name]
+            if oldroute in self.order:
+                self.routelist.remove(oldroute)
+                self._forget(oldroute)
+        route = Route(name, pattern, factory, predicates, pregenerator)
+        self._append(route)
+        return route
+
+    def _forget(self, route):
+        entry = (self.order.pop(route), route)
+        segments = pattern_segments(route.pattern)
+        self.route_hosts.pop(route, None)
+        for index in self.route_indexes.pop(route, [self.index]):
+            index.remove(entry, segments)
+
+    def group(self, prefix, parent=None):
+        """Return the :class:`RouteGroup` for ``prefix``, nested under the
+        group ``parent`` if given, creating it if necessary.  ``prefix`` is
+        the full prefix of the group, including that of ``parent``."""
+        if parent is None:
+            groups = self.groups
+        else:
+            groups = parent.groups
+        for group in groups:
+            if group.prefix == prefix:
+                return group
+        group = RouteGroup(prefix)
+        groups.append(group)
+        return group
+
+    def index_route(self, route, sub_domains=None, group=None):
+        """Move ``route`` into the trie, into the index of each of
+        ``sub_domains`` so that it only matches requests to those sub
+        domains, or else into the index of the :class:`RouteGroup`
+        ``group``.  Returns ``False`` if the route's pattern cannot be
+        indexed, in which case it is still matched by trying it against
+        every request (to its sub domains, or matching its group)."""
+        if self.frozen:
+            raise ConfigurationError('Route %r indexed after the routes were frozen.' % route.name)
+        segments = pattern_segments(route.pattern)
+        if segments is None and not sub_domains and group is None:
+            return False
+        entry = (self.order[route], route)
+        if route in self.route_indexes:
+            return segments is not None
+        self.index.remove(entry, segments)
+        if sub_domains:
+            self.route_hosts[route] = tuple(sub_domains)
+            indexes = []
+            for sub_domain in sub_domains:
+                index = self.hosts.get(sub_domain)
+                if index is None:
+                    index = self.hosts[sub_domain] = RouteIndex()
+                indexes.append(index)
+        elif group is not None:
+            indexes = [group.index]
+        else:
+            indexes = [self.index]
+        self.route_indexes[route] = indexes
+        for index in indexes:
+            index.add(entry, segments)
+        return segments is not None
+
+    def freeze(self):
+        """Make every index read-only; no route may be added afterwards."""
+        indexes = [self.index] + self.hosts.values()
+        groups = list(self.groups)
+        while groups:
+            group = groups.pop()
+            indexes.append(group.index)
+            groups.extend(group.groups)
+        for index in indexes:
+            index.freeze()
+        self.frozen = True
+
+    def sub_domain(self, environ):
+        """Return the sub domain requested in ``environ``, or ``None``."""
+        host = environ.get('HTTP_HOST') or environ.get('SERVER_NAME') or ''
+        host = host.split(':', 1)[0].lower()
+        if self.domain is not None:
+            if host.endswith('.' + self.domain):
+                return host[:-len(self.domain) - 1]
+            return None
+        labels = host.split('.', 2)
+        if len(labels) == 3:
+            return labels[0]
+        return None
+
+    def candidates(self, path, sub_domain=None):
+        """Return the routes which may match ``path`` (on ``sub_domain``), in
+        registration order."""
+        found = self.index.lookup(path)
+        if sub_domain is not None:
+            index = self.hosts.get(sub_domain)
+            if index is not None:
+                found.extend(index.lookup(path))
+        groups = self.groups
+        while groups:
+            matched = []
+            for group in groups:
+                if group.match(path) is not None:
+                    found.extend(group.index.lookup(path))
+                    matched.extend(group.groups)
+            groups = matched
+        found.sort()
+        return [route for order, route in found]
+
+    def __call__(self, request):
+        environ = request.environ
+        try:
+            # empty if mounted under a path in mod_wsgi, for example
+            path = environ['PATH_INFO'] or '/'
+        except KeyError:
+            path = '/'
+        sub_domain = None
+        if self.hosts:
+            sub_domain = self.sub_domain(environ)
+
+        for route in self.candidates(path, sub_domain):
+            match = route.match(path)
+            if match is not None:
+                if route in self.route_hosts:
+                    match['sub_domain'] = sub_domain
+                preds = route.predicates
+                info = {'match':match, 'route':route}
+                if preds and not all((p(info, request) for p in preds)):
+                    continue
+                return info
+
+        return {'route':None, 'match':None}
+
+def new_style_pattern(pattern):
+    """Convert the ``:marker`` syntax of ``pattern`` to ``{marker}`` so that it
+    can be combined with markers which use a regex."""
+    if old_route_re.search(pattern) and not route_re.search(pattern):
+        pattern = old_route_re.sub(update_pattern, pattern)
+    return pattern
+
+def normalize_marker(match):
+    marker = match.group(0)[1:-1]
+    if ':' in marker:
+        return '{:%s}' % marker.split(':', 1)[1]
+    return '{:[^/]+}'
+
+def normalize_pattern(pattern):
+    """Return ``pattern`` with its markers unnamed, so that two patterns which
+    match the same paths compare equal.  The regex of each marker is kept
+    (``[^/]+`` for those without one), so that patterns whose markers match
+    different values do not."""
+    pattern = new_style_pattern(pattern)
+    if not pattern.startswith('/'):
+        pattern = '/' + pattern
+    return route_re.sub(normalize_marker, pattern)
+
+def format_pattern(pattern, formats):
+    """Return ``pattern`` with an optional ``.<format>`` suffix for each of
+    ``formats``, matched as the ``format`` marker.  A marker ending the
+    pattern is made non-greedy so ``/messages/1.json`` matches as ``id`` 1
+    in the ``json`` format."""
+    pattern = new_style_pattern(pattern)
+    pattern = re.sub(r'\{(\w+)\}$', r'{\1:[^/]+?}', pattern)
+    return r'%s{format:(\.(%s))?}' % (
+        pattern, '|'.join([re.escape(format) for format in formats]))
+
+def format_pregenerator(request, elements, kw):
+    """:term:`pregenerator` for routes built by :func:`format_pattern` which
+    accepts ``format='json'`` (or no format at all)."""
+    format = kw.get('format')
+    kw['format'] = format and '.' + format or ''
+    return elements, kw
+
+class FormatPregenerator(object):
+    """:func:`format_pregenerator` calling the pregenerator ``wrapped``, if
+    any, first."""
+    def __init__(self, wrapped=None):
+        self.wrapped = wrapped
+
+    def __call__(self, request, elements, kw):
+        if self.wrapped is not None:
+            elements, kw = self.wrapped(request, elements, kw)
+        return format_pregenerator(request, elements, kw)
+
+def add_generator_route(config, name, pattern, pregenerator=None):
+    """Register a route named ``name`` which is only used for URL generation
+    and is never tried when matching a request."""
+    mapper = config.get_routes_mapper()
+    mapper.routes[name] = Route(name, pattern, pregenerator=pregenerator)
+
+class Converter(object):
+    """Restrict a marker to values matching ``regex`` and replace the
+    matched value with ``to_python(value)``.  A route whose marker cannot be
+    converted (``to_python`` raises :exc:`ValueError`) does not match.
+
+    ``regex`` is placed in the route pattern, so it may contain neither
+    ``:`` nor ``}``."""
+    def __init__(self, regex, to_python):
+        if ':' in regex or '}' in regex:
+            raise ValueError('Converter regex %r may not contain ":" or "}"'
+                             % regex)
+        self.regex = regex
+        self.to_python = to_python
+
+# built-in converters which may be named in ``add_resource(converters=...)``
+builtin_converters = {
+    'int': Converter(r'\d+', int),
+    'uuid': Converter(r'[0-9a-fA-F-]+', uuid.UUID),
+    }
+
+def marker_names(pattern):
+    """Return the names of the markers in ``pattern``."""
+    return [marker[1:-1].split(':', 1)[0]
+            for marker in route_re.findall(new_style_pattern(pattern))]
+
+def typed_pattern(pattern, converters):
+    """Return ``pattern`` with the regex of the matching
+    :class:`Converter` of ``converters`` added to each of its markers."""
+    def typed(match):
+        name = match.group(0)[1:-1]
+        if name in converters:
+            return '{%s:%s}' % (name, converters[name].regex)
+        return match.group(0)
+    return route_re.sub(typed, new_style_pattern(pattern))
+
+class ConvertPredicate(object):
+    """Route predicate converting the values of a route's matchdict before
+    any view runs."""
+    def __init__(self, converters):
+        self.converters = sorted(converters.items())
+
+    def __call__(self, info, request):
+        match = info['match']
+        try:
+            for name, converter in self.converters:
+                if name in match:
+                    match[name] = converter.to_python(match[name])
+        except ValueError:
+            return False
+        return True
+
+    def __repr__(self):
+        return '<ConvertPredicate %s>' % ', '.join(
+            [name for name, converter in self.converters])
+
+def sub_domain_url(request, sub_domain):
+    """Return the application URL of ``request`` on ``sub_domain``."""
+    try:
+        registry = request.registry
+    except AttributeError:
+        registry = get_current_registry()
+    mapper = registry.queryUtility(IRoutesMapper)
+    domain = getattr(mapper, 'domain', None)
+    scheme, host = request.host_url.split('://', 1)
+    port = ''
+    if ':' in host:
+        host, port = host.split(':', 1)
+        port = ':' + port
+    if domain is not None:
+        host = domain
+    elif host.count('.') >= 2:
+        host = host.split('.', 1)[1]
+    return '%s://%s.%s%s%s' % (scheme, sub_domain, host, port, request.script_name)
+
+class SubDomainPregenerator(object):
+    """Pregenerator for routes restricted to sub domains, which accept a
+    ``sub_domain`` argument to generate URLs on that sub domain.  The
+    pregenerator ``wrapped``, if any, is called first."""
+    def __init__(self, wrapped=None):
+        self.wrapped = wrapped
+
+    def __call__(self, request, elements, kw):
+        sub_domain = kw.pop('sub_domain', None)
+        if self.wrapped is not None:
+            elements, kw = self.wrapped(request, elements, kw)
+        if sub_domain is not None and '_app_url' not in kw:
+            kw['_app_url'] = sub_domain_url(request, sub_domain)
+        return elements, kw
+
+def get_resource_mapper(config):
+    """Return the :class:`ResourceRoutesMapper` for ``config``'s registry,
+    replacing (and taking over the routes of) the default routes mapper if
+    necessary."""
+    mapper = config.get_routes_mapper()
+    if not isinstance(mapper, ResourceRoutesMapper):
+        settings = config.get_settings() or {}
+        resource_mapper = ResourceRoutesMapper(settings.get('routehelper.domain'))
+        resource_mapper.adopt(mapper)
+        config.registry.registerUtility(resource_mapper, IRoutesMapper)
+        mapper = resource_mapper
+    return mapper
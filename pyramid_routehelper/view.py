@@ -0,0 +1,98 @@
+from zope.interface import providedBy
+
+from pyramid.exceptions import NotFound
+from pyramid.httpexceptions import HTTPMethodNotAllowed
+from pyramid.interfaces import IRouteRequest
+from pyramid.interfaces import IView
+from pyramid.interfaces import IViewClassifier
+from pyramid.threadlocal import get_current_registry
+
+def compose_decorators(decorators):
+    """Return a view decorator applying each of ``decorators``, the first
+    being outermost."""
+    def decorator(view):
+        for wrap in reversed(decorators):
+            view = wrap(view)
+        return view
+    return decorator
+
+def format_view_name(format):
+    """The view name under which the ``format`` view of a collapsed route is
+    registered; ``''`` names the view used when no format is requested."""
+    return '__format_%s__' % format
+
+def method_view_name(request_method):
+    """The view name under which the ``request_method`` view of a route
+    generated with ``method_dispatch`` is registered; ``None`` names the view
+    for any method."""
+    return '__method_%s__' % (request_method or 'any')
+
+class Dispatcher(object):
+    """Base class of the views of generated routes which call another view
+    registered for the same route, by name."""
+    def __init__(self, route_name):
+        self.route_name = route_name
+        self.request_iface = None
+
+    def prepare(self, registry):
+        """Look up the request interface of the route now rather than on
+        the first request."""
+        if self.request_iface is None:
+            self.request_iface = registry.getUtility(IRouteRequest,
+                                                     name=self.route_name)
+
+    def call_view(self, name, context, request):
+        try:
+            registry = request.registry
+        except AttributeError:
+            registry = get_current_registry()
+        if self.request_iface is None:
+            self.prepare(registry)
+        view = registry.adapters.lookup(
+            (IViewClassifier, self.request_iface, providedBy(context)),
+            IView, name=name)
+        if view is None:
+            raise NotFound(request.path_info)
+        return view(context, request)
+
+class FormatDispatcher(Dispatcher):
+    """View for a route registered with ``collapse_formats`` which calls the
+    view registered for the requested format.
+
+    ``views`` maps each format (``''`` for none) to the name of its view, so
+    finding the view costs a dict lookup however many formats there are."""
+    def __init__(self, route_name, views):
+        Dispatcher.__init__(self, route_name)
+        self.views = views
+
+    def __call__(self, context, request):
+        format = request.matchdict.get('format') or ''
+        format = format[1:]
+        name = self.views.get(format)
+        if name is None:
+            raise NotFound(request.path_info)
+        request.matchdict['format'] = format or None
+        return self.call_view(name, context, request)
+
+class MethodDispatcher(Dispatcher):
+    """View for a route registered with ``method_dispatch`` which calls the
+    view registered for the request method.
+
+    ``views`` maps each request method (``None`` for any other) to the name
+    of its view; a request with a method which has no view gets a ``405
+    Method Not Allowed`` response listing those which do.  ``HEAD``
+    requests are answered by the ``GET`` view unless ``HEAD`` has its own."""
+    def __init__(self, route_name, views):
+        Dispatcher.__init__(self, route_name)
+        views = dict(views)
+        if 'GET' in views and 'HEAD' not in views:
+            views['HEAD'] = views['GET']
+        self.views = views
+        self.allow = ', '.join(sorted([method for method in views if method]))
+
+    def __call__(self, context, request):
+        views = self.views
+        name = views.get(request.method) or views.get(None)
+        if name is None:
+            return HTTPMethodNotAllowed(headers=[('Allow', self.allow)])
+        return self.call_view(name, context, request)